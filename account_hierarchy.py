@@ -0,0 +1,186 @@
+import logging
+
+from sqlalchemy.orm import aliased
+
+from app import db
+from models import Account, Transaction, TransactionItem
+from ledger_aggregates import signed_balance
+from ledger_money import to_cents, from_cents, cents_column
+
+logger = logging.getLogger(__name__)
+
+# Number prefix lengths of the OHADA groupings: class, 2-digit and 3-digit accounts
+ROLLUP_DEPTHS = (1, 2, 3)
+
+def compute_account_paths(rows):
+    """
+    Compute the materialized path ('/<root id>/.../<id>/') of accounts
+    from (id, parent_id) rows. Missing parents and cycles are treated as roots.
+    """
+    parents = dict(rows)
+    paths = {}
+
+    for account_id in parents:
+        chain = []
+        current = account_id
+        while current is not None and current not in paths and current not in chain:
+            chain.append(current)
+            current = parents.get(current)
+
+        prefix = paths.get(current, '/')
+        for ancestor_id in reversed(chain):
+            prefix = f"{prefix}{ancestor_id}/"
+            paths[ancestor_id] = prefix
+
+    return paths
+
+def set_account_path(account):
+    """Set the path of a new account from its parent. Does not commit."""
+    if account.id is None:
+        db.session.flush()
+
+    parent_path = None
+    if account.parent_id:
+        parent_path = db.session.query(Account.path).filter(Account.id == account.parent_id).scalar()
+
+    account.path = f"{parent_path or '/'}{account.id}/"
+
+def move_account(account, parent_id):
+    """
+    Attach an account to a new parent and rewrite the paths of its whole subtree
+    with a single UPDATE. Does not commit.
+    """
+    old_path = account.path
+    if old_path is None:
+        old_path = rebuild_account_paths(account.exercise_id)[account.id]
+
+    account.parent_id = parent_id
+    set_account_path(account)
+    new_path = account.path
+
+    if new_path == old_path:
+        return
+
+    db.session.flush()
+    Account.query.filter(
+        Account.exercise_id == account.exercise_id,
+        Account.path.like(f"{old_path}%"),
+        Account.id != account.id
+    ).update({
+        Account.path: db.literal(new_path) + db.func.substr(Account.path, len(old_path) + 1)
+    }, synchronize_session=False)
+
+def rebuild_account_paths(exercise_id=None):
+    """Recompute the paths of the accounts (of one exercise if given) and return them. Does not commit."""
+    query = db.session.query(Account.id, Account.parent_id)
+    if exercise_id is not None:
+        query = query.filter(Account.exercise_id == exercise_id)
+
+    paths = compute_account_paths(query.all())
+    db.session.bulk_update_mappings(Account, [
+        {'id': account_id, 'path': path} for account_id, path in paths.items()
+    ])
+    logger.info(f"Account paths rebuilt for {len(paths)} account(s)")
+
+    return paths
+
+def ensure_account_paths(exercise_id):
+    """Fill the missing paths of an exercise (accounts created outside the application)"""
+    missing = db.session.query(Account.id).filter(
+        Account.exercise_id == exercise_id,
+        Account.path == None
+    ).first()
+    if missing:
+        rebuild_account_paths(exercise_id)
+        db.session.commit()
+
+def get_hierarchy_balances(exercise_id, end_date=None, active_only=False):
+    """
+    Return every account of an exercise with its own totals and the totals of its
+    whole subtree, in tree order, from one query joining each account to its
+    descendants through their paths.
+    """
+    ensure_account_paths(exercise_id)
+
+    descendant = aliased(Account)
+    item_filter = [Transaction.is_posted == True]
+    if end_date:
+        item_filter.append(Transaction.transaction_date <= end_date)
+
+    posted_items = db.session.query(
+        TransactionItem.account_id.label('account_id'),
+        cents_column(TransactionItem.debit_amount).label('debit'),
+        cents_column(TransactionItem.credit_amount).label('credit')
+    ).join(
+        Transaction, TransactionItem.transaction_id == Transaction.id
+    ).filter(
+        Transaction.exercise_id == exercise_id,
+        *item_filter
+    ).subquery()
+
+    is_own = descendant.id == Account.id
+    query = db.session.query(
+        Account,
+        db.func.coalesce(db.func.sum(db.case((is_own, posted_items.c.debit), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((is_own, posted_items.c.credit), else_=0)), 0),
+        db.func.coalesce(db.func.sum(posted_items.c.debit), 0),
+        db.func.coalesce(db.func.sum(posted_items.c.credit), 0)
+    ).join(
+        descendant, db.and_(
+            descendant.exercise_id == Account.exercise_id,
+            descendant.path.like(Account.path + '%')
+        )
+    ).outerjoin(
+        posted_items, posted_items.c.account_id == descendant.id
+    ).filter(
+        Account.exercise_id == exercise_id
+    )
+
+    if active_only:
+        query = query.filter(Account.is_active == True)
+
+    rows = query.group_by(Account.id).all()
+
+    # Tree order, siblings sorted by account number
+    numbers = {account.id: account.account_number for account, *_ in rows}
+    rows.sort(key=lambda row: [numbers.get(int(account_id), '') for account_id in row[0].path.strip('/').split('/')])
+
+    hierarchy = []
+    for account, own_debit, own_credit, subtree_debit, subtree_credit in rows:
+        hierarchy.append({
+            'account': account,
+            'depth': account.path.count('/') - 2,
+            'own_debit': from_cents(own_debit),
+            'own_credit': from_cents(own_credit),
+            'subtree_debit': from_cents(subtree_debit),
+            'subtree_credit': from_cents(subtree_credit),
+            'balance': from_cents(signed_balance(account.account_type, int(subtree_debit), int(subtree_credit)))
+        })
+
+    return hierarchy
+
+def rollup_by_prefix(rows, depths=ROLLUP_DEPTHS, debit_key='total_debit', credit_key='total_credit'):
+    """
+    Group per-account rows ({'account', debit_key, credit_key}) by account number prefix:
+    {depth: [{'prefix', 'total_debit', 'total_credit', 'solde'}]} for each prefix length.
+    """
+    rollups = {depth: {} for depth in depths}
+
+    for row in rows:
+        account_number = row['account'].account_number
+        for depth in depths:
+            if len(account_number) < depth:
+                continue
+            total = rollups[depth].setdefault(account_number[:depth], [0, 0])
+            total[0] += to_cents(row[debit_key])
+            total[1] += to_cents(row[credit_key])
+
+    return {
+        depth: [{
+            'prefix': prefix,
+            'total_debit': from_cents(debit),
+            'total_credit': from_cents(credit),
+            'solde': from_cents(debit - credit)
+        } for prefix, (debit, credit) in sorted(totals.items())]
+        for depth, totals in rollups.items()
+    }
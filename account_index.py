@@ -0,0 +1,135 @@
+import logging
+import threading
+from collections import namedtuple
+
+from app import db
+from models import Exercise, Account
+
+logger = logging.getLogger(__name__)
+
+class AccountEntry(namedtuple('AccountEntry', ['id', 'account_number', 'name', 'account_type', 'is_active', 'parent_id'])):
+    """Read-only copy of an account held by the index"""
+    __slots__ = ()
+
+    @property
+    def full_name(self):
+        return f"{self.account_number} - {self.name}"
+
+class _TrieNode:
+    __slots__ = ('children', 'first_active')
+
+    def __init__(self):
+        self.children = {}
+        self.first_active = None  # Lowest numbered active account below this node
+
+class AccountIndex:
+    """
+    In-memory index of the chart of accounts of one exercise: a prefix trie over
+    the account numbers and an id map.
+    """
+
+    def __init__(self, entries):
+        self.entries = sorted(entries, key=lambda entry: (entry.account_number, entry.id))
+        self.by_id = {entry.id: entry for entry in self.entries}
+        self.root = _TrieNode()
+
+        # Accounts are inserted in number order, so the first active one seen is the lowest
+        for entry in self.entries:
+            node = self.root
+            for digit in entry.account_number:
+                if entry.is_active and node.first_active is None:
+                    node.first_active = entry
+                node = node.children.setdefault(digit, _TrieNode())
+            if entry.is_active and node.first_active is None:
+                node.first_active = entry
+
+    def _node(self, prefix):
+        node = self.root
+        for digit in prefix:
+            node = node.children.get(digit)
+            if node is None:
+                return None
+        return node
+
+    def get(self, account_id):
+        """Return the account with the given id, or None"""
+        return self.by_id.get(account_id)
+
+    def first_active(self, prefix):
+        """Return the lowest numbered active account starting with prefix, or None"""
+        node = self._node(prefix)
+        return node.first_active if node else None
+
+    def find(self, prefix):
+        """
+        Return the active account best matching prefix, shortening the prefix
+        down to its class, then any active account
+        """
+        for length in range(len(prefix), 0, -1):
+            entry = self.first_active(prefix[:length])
+            if entry:
+                return entry
+        return self.root.first_active
+
+    def active_accounts(self):
+        """Return the active accounts in number order"""
+        return [entry for entry in self.entries if entry.is_active]
+
+    def choices(self, active_only=True, excluded_ids=()):
+        """Return (id, full name) pairs in number order for form dropdowns"""
+        return [(entry.id, entry.full_name) for entry in self.entries
+                if (entry.is_active or not active_only) and entry.id not in excluded_ids]
+
+class AccountIndexCache:
+    """Per-process cache of the account indexes, keyed by exercise and chart version"""
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, exercise_id, chart_version):
+        with self._lock:
+            cached = self._indexes.get(exercise_id)
+        if cached and cached[0] == chart_version:
+            return cached[1]
+        return None
+
+    def set(self, exercise_id, chart_version, index):
+        with self._lock:
+            self._indexes[exercise_id] = (chart_version, index)
+
+    def invalidate(self, exercise_id=None):
+        with self._lock:
+            if exercise_id is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(exercise_id, None)
+
+account_index_cache = AccountIndexCache()
+
+def bump_chart_version(exercise_id):
+    """
+    Increment the chart version of an exercise after any account change,
+    invalidating the account indexes of every process. Does not commit.
+    """
+    Exercise.query.filter_by(id=exercise_id).update({
+        Exercise.chart_version: db.func.coalesce(Exercise.chart_version, 0) + 1
+    }, synchronize_session=False)
+    account_index_cache.invalidate(exercise_id)
+
+def get_account_index(exercise_id):
+    """Return the account index of an exercise, rebuilt when its chart version changed"""
+    chart_version = db.session.query(Exercise.chart_version).filter(Exercise.id == exercise_id).scalar() or 0
+
+    index = account_index_cache.get(exercise_id, chart_version)
+    if index is None:
+        rows = db.session.query(
+            Account.id, Account.account_number, Account.name, Account.account_type,
+            Account.is_active, Account.parent_id
+        ).filter(Account.exercise_id == exercise_id).all()
+
+        index = AccountIndex(AccountEntry(*row) for row in rows)
+        account_index_cache.set(exercise_id, chart_version, index)
+        logger.debug(f"Account index built for exercise {exercise_id} (version {chart_version}, {len(rows)} accounts)")
+
+    return index
@@ -3,6 +3,10 @@ from datetime import datetime
 import json
 from app import db
 from models import Document, Transaction, TransactionItem, Account, Exercise
+from balance_store import apply_transaction, apply_transactions, bump_ledger_version, refresh_transaction_totals
+from account_index import get_account_index
+from keyword_classifier import get_classifier
+from ledger_money import to_cents, from_cents, sum_cents, cents_column
 
 logger = logging.getLogger(__name__)
 
@@ -59,6 +63,9 @@ def create_transaction_from_document(document_id, extracted_data):
             logger.error("Failed to add transaction items")
             return None
         
+        refresh_transaction_totals([transaction.id])
+        bump_ledger_version(transaction.exercise_id)
+        
         # Commit transaction
         db.session.commit()
         logger.info(f"Transaction created: {transaction.id}")
@@ -93,18 +100,27 @@ def add_transaction_items(transaction, extracted_data):
         # Extract TVA amount
         tva_amount = extracted_data.get('tva_amount')
         
+        # Amounts parsed from the document are floats, converted once to exact centimes
+        total_cents = to_cents(total_amount)
+        tva_cents = to_cents(tva_amount)
+        total_amount = from_cents(total_cents)
+        tva_amount = from_cents(tva_cents)
+        
+        # Account lookups go through the in-memory index of the exercise
+        index = get_account_index(exercise.id)
+        
         # For invoices (create typical entries)
         if extracted_data.get('probable_type') == 'invoice':
             # Find appropriate accounts
-            debit_account = find_suitable_account('6', exercise.id)  # Class 6: Expense
-            credit_account_supplier = find_suitable_account('401', exercise.id)  # Supplier
+            debit_account = find_suitable_account('6', exercise.id, index)  # Class 6: Expense
+            credit_account_supplier = find_suitable_account('401', exercise.id, index)  # Supplier
             
-            if tva_amount and tva_amount > 0:
+            if tva_cents > 0:
                 # With TVA
-                net_amount = total_amount - tva_amount
+                net_amount = from_cents(total_cents - tva_cents)
                 
                 # Find TVA account
-                tva_account = find_suitable_account('445', exercise.id)  # TVA account
+                tva_account = find_suitable_account('445', exercise.id, index)  # TVA account
                 
                 # Add expense item
                 expense_item = TransactionItem(
@@ -158,8 +174,8 @@ def add_transaction_items(transaction, extracted_data):
                 db.session.add(supplier_item)
         else:
             # For other document types, create a simple debit/credit entry
-            debit_account = find_suitable_account('6', exercise.id)  # Class 6: Expense
-            credit_account = find_suitable_account('5', exercise.id)  # Class 5: Cash/bank
+            debit_account = find_suitable_account('6', exercise.id, index)  # Class 6: Expense
+            credit_account = find_suitable_account('5', exercise.id, index)  # Class 5: Cash/bank
             
             # Add expense item
             expense_item = TransactionItem(
@@ -187,26 +203,15 @@ def add_transaction_items(transaction, extracted_data):
         logger.error(f"Error adding transaction items: {str(e)}")
         return False
 
-def find_suitable_account(account_prefix, exercise_id):
+def find_suitable_account(account_prefix, exercise_id, index=None):
     """
-    Find a suitable account that starts with the given prefix
-    Returns the first active account found, or a default one if none found
+    Find a suitable account of the exercise that starts with the given prefix
+    Falls back to shorter prefixes, then to any active account
+    Returns an entry of the exercise account index (id, account_number, name...), or None
     """
-    # Try to find an account with the exact prefix
-    account = Account.query.filter(
-        Account.account_number.startswith(account_prefix),
-        Account.is_active == True
-    ).first()
-    
-    if account:
-        return account
-    
-    # If no account found, try more generic prefix
-    if len(account_prefix) > 1:
-        return find_suitable_account(account_prefix[0], exercise_id)
-    
-    # If still no account found, return a default one
-    return Account.query.filter(Account.is_active == True).first()
+    if index is None:
+        index = get_account_index(exercise_id)
+    return index.find(account_prefix)
 
 def get_transaction_balance(transaction_id):
     """
@@ -214,10 +219,56 @@ def get_transaction_balance(transaction_id):
     """
     items = TransactionItem.query.filter_by(transaction_id=transaction_id).all()
     
-    total_debit = sum(item.debit_amount for item in items)
-    total_credit = sum(item.credit_amount for item in items)
+    total_debit = sum_cents(item.debit_amount for item in items)
+    total_credit = sum_cents(item.credit_amount for item in items)
     
-    return abs(total_debit - total_credit)
+    return from_cents(abs(total_debit - total_credit))
+
+def find_unbalanced_transactions(exercise_id=None, transaction_ids=None, include_empty=True):
+    """
+    Find the transactions whose debits and credits differ, and those without items
+    unless include_empty is False, from one GROUP BY/HAVING query over the items.
+    Sums are compared exactly in integer centimes.
+    Returns [{'id', 'reference', 'transaction_date', 'total_debit', 'total_credit', 'item_count'}]
+    """
+    total_debit = db.func.coalesce(db.func.sum(cents_column(TransactionItem.debit_amount)), 0)
+    total_credit = db.func.coalesce(db.func.sum(cents_column(TransactionItem.credit_amount)), 0)
+    item_count = db.func.count(TransactionItem.id)
+
+    query = db.session.query(
+        Transaction.id,
+        Transaction.reference,
+        Transaction.transaction_date,
+        total_debit,
+        total_credit,
+        item_count
+    ).outerjoin(
+        TransactionItem, TransactionItem.transaction_id == Transaction.id
+    )
+
+    if exercise_id is not None:
+        query = query.filter(Transaction.exercise_id == exercise_id)
+    if transaction_ids is not None:
+        query = query.filter(Transaction.id.in_(transaction_ids))
+
+    condition = total_debit != total_credit
+    if include_empty:
+        condition = db.or_(item_count == 0, condition)
+
+    rows = query.group_by(
+        Transaction.id, Transaction.reference, Transaction.transaction_date
+    ).having(condition).order_by(
+        Transaction.transaction_date, Transaction.id
+    ).all()
+
+    return [{
+        'id': transaction_id,
+        'reference': reference,
+        'transaction_date': transaction_date,
+        'total_debit': from_cents(debit),
+        'total_credit': from_cents(credit),
+        'item_count': count
+    } for transaction_id, reference, transaction_date, debit, credit, count in rows]
 
 def post_transaction(transaction_id):
     """
@@ -228,20 +279,98 @@ def post_transaction(transaction_id):
     if not transaction:
         logger.error(f"Transaction not found: {transaction_id}")
         return False
-    
+
+    # Already posted transactions are already part of the stored balances
+    if transaction.is_posted:
+        return True
+
     # Check if the transaction is balanced
-    balance = get_transaction_balance(transaction_id)
-    if balance > 0.01:  # Allow small rounding differences
+    unbalanced = find_unbalanced_transactions(transaction_ids=[transaction_id], include_empty=False)
+    if unbalanced:
+        balance = unbalanced[0]['total_debit'] - unbalanced[0]['total_credit']
         logger.error(f"Transaction {transaction_id} is not balanced: {balance}")
         return False
     
     # Mark as posted
     transaction.is_posted = True
+    apply_transaction(transaction)
+    bump_ledger_version(transaction.exercise_id)
     db.session.commit()
     logger.info(f"Transaction {transaction_id} posted successfully")
     
     return True
 
+def post_transactions(transaction_ids, exercise_id):
+    """
+    Post a set of draft transactions of an exercise at once.
+    Balance is checked for the whole set with one GROUP BY/HAVING query and the
+    accepted transactions are flipped with a single UPDATE.
+    Returns {'posted': [ids], 'rejected': {id: reason}}
+    """
+    transaction_ids = set(transaction_ids)
+    result = {'posted': [], 'rejected': {}}
+    if not transaction_ids:
+        return result
+
+    exercise = Exercise.query.get(exercise_id)
+    if not exercise:
+        logger.error(f"Exercise not found: {exercise_id}")
+        result['rejected'] = {transaction_id: "Exercice introuvable" for transaction_id in transaction_ids}
+        return result
+
+    if exercise.is_closed:
+        result['rejected'] = {transaction_id: "Exercice clôturé" for transaction_id in transaction_ids}
+        return result
+
+    found = dict(db.session.query(Transaction.id, Transaction.is_posted).filter(
+        Transaction.id.in_(transaction_ids),
+        Transaction.exercise_id == exercise_id
+    ).all())
+
+    for transaction_id in transaction_ids:
+        if transaction_id not in found:
+            result['rejected'][transaction_id] = "Transaction introuvable"
+        elif found[transaction_id]:
+            result['rejected'][transaction_id] = "Transaction déjà comptabilisée"
+
+    drafts = [transaction_id for transaction_id, is_posted in found.items() if not is_posted]
+
+    # Drafts without items or whose debits and credits differ
+    for unbalanced in (find_unbalanced_transactions(transaction_ids=drafts) if drafts else []):
+        if unbalanced['item_count'] == 0:
+            result['rejected'][unbalanced['id']] = "Aucune ligne d'écriture"
+        else:
+            result['rejected'][unbalanced['id']] = (
+                f"Transaction non équilibrée (débit {unbalanced['total_debit']:.2f}, "
+                f"crédit {unbalanced['total_credit']:.2f})"
+            )
+
+    accepted = [transaction_id for transaction_id in drafts if transaction_id not in result['rejected']]
+    if not accepted:
+        return result
+
+    try:
+        Transaction.query.filter(
+            Transaction.id.in_(accepted),
+            Transaction.is_posted == False
+        ).update({
+            Transaction.is_posted: True,
+            Transaction.updated_at: datetime.utcnow()
+        }, synchronize_session=False)
+
+        apply_transactions(accepted)
+        bump_ledger_version(exercise_id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error posting transactions of exercise {exercise_id}: {str(e)}")
+        raise
+
+    result['posted'] = sorted(accepted)
+    logger.info(f"{len(accepted)} transaction(s) posted, {len(result['rejected'])} rejected for exercise {exercise_id}")
+
+    return result
+
 def auto_categorize_transaction(transaction_id):
     """
     Attempt to automatically categorize a transaction based on its description
@@ -252,42 +381,15 @@ def auto_categorize_transaction(transaction_id):
     if not transaction:
         return False
     
-    # Get all active accounts
-    accounts = Account.query.filter_by(is_active=True).all()
+    # Accounts of the transaction's exercise, from the in-memory index
+    index = get_account_index(transaction.exercise_id)
     
-    # Create a simple mapping of keywords to account numbers
-    keyword_mapping = {
-        'loyer': '613',        # Rent
-        'électricité': '6051',  # Electricity
-        'eau': '6052',         # Water
-        'téléphone': '626',    # Phone
-        'internet': '626',     # Internet
-        'salaire': '661',      # Salary
-        'fourniture': '604',   # Supplies
-        'assurance': '616',    # Insurance
-        'banque': '627',       # Bank fees
-        'publicité': '623',    # Advertising
-        'carburant': '6114',   # Fuel
-        'voyage': '6251',      # Travel expenses
-        'repas': '6252',       # Meals
-        'client': '411',       # Clients
-        'fournisseur': '401',  # Suppliers
-        'tva': '445',          # VAT
-        'impôt': '444',        # Taxes
-        'vente': '707',        # Sales
-        'achat': '601'         # Purchases
-    }
-    
-    # Check transaction description for keywords
-    description = transaction.description.lower()
+    # Keywords of the description, matched in one pass by the shared classifier
     matched_accounts = {}
-    
-    for keyword, account_number in keyword_mapping.items():
-        if keyword in description:
-            # Find the account with this number
-            account = next((a for a in accounts if a.account_number.startswith(account_number)), None)
-            if account:
-                matched_accounts[keyword] = account
+    for keyword, account_number in get_classifier().match_accounts(transaction.description or '').items():
+        account = index.first_active(account_number)
+        if account:
+            matched_accounts[keyword] = account
     
     # If we found matches, update the transaction items
     if matched_accounts:
@@ -8,6 +8,8 @@ from decimal import Decimal
 from app import db
 from models import Exercise, Transaction, TransactionItem, Account
 from utils import DecimalEncoder, get_account_balance, get_exercise_totals
+from ledger_aggregates import get_exercise_aggregates, prefix_balance
+from anomaly_detection import detect_anomalies
 from config import Config
 
 logger = logging.getLogger(__name__)
@@ -50,8 +52,9 @@ def calculate_financial_indicators(exercise_id):
     Calculate key financial indicators for the exercise
     Returns a dictionary of indicators
     """
-    # Get exercise totals
-    totals = get_exercise_totals(exercise_id)
+    # Get exercise totals and prefix balances from one aggregate query
+    aggregates = get_exercise_aggregates(exercise_id, datetime.now().date())
+    totals = get_exercise_totals(exercise_id, aggregates)
     
     # Extract individual values
     total_assets = totals.get('asset', Decimal('0'))
@@ -62,8 +65,8 @@ def calculate_financial_indicators(exercise_id):
     net_income = totals.get('net_income', Decimal('0'))
     
     # Calculate liquidity ratio (current assets / current liabilities)
-    current_assets = get_account_type_balance(exercise_id, ['10', '11', '12', '13', '14'])
-    current_liabilities = get_account_type_balance(exercise_id, ['40', '41', '42', '43'])
+    current_assets = get_account_type_balance(exercise_id, ['10', '11', '12', '13', '14'], aggregates)
+    current_liabilities = get_account_type_balance(exercise_id, ['40', '41', '42', '43'], aggregates)
     
     try:
         liquidity_ratio = float(current_assets / current_liabilities) if current_liabilities else 0
@@ -109,21 +112,12 @@ def calculate_financial_indicators(exercise_id):
         'asset_turnover': asset_turnover
     }
 
-def get_account_type_balance(exercise_id, account_prefixes):
+def get_account_type_balance(exercise_id, account_prefixes, aggregates=None):
     """Get the balance for accounts starting with specific prefixes"""
-    total_balance = Decimal('0')
+    if aggregates is None:
+        aggregates = get_exercise_aggregates(exercise_id, datetime.now().date())
     
-    for prefix in account_prefixes:
-        accounts = Account.query.filter(
-            Account.account_number.like(f"{prefix}%"),
-            Account.is_active == True
-        ).all()
-        
-        for account in accounts:
-            balance = get_account_balance(account.id, exercise_id)
-            total_balance += balance
-    
-    return total_balance
+    return prefix_balance(aggregates, account_prefixes)
 
 def prepare_exercise_data(exercise_id):
     """
@@ -324,88 +318,7 @@ def analyze_transactions(exercise_id):
     Analyze transactions for anomalies and patterns
     Returns a list of findings and insights
     """
-    exercise = Exercise.query.get_or_404(exercise_id)
-    findings = []
-    
-    # Get all transactions for this exercise
-    transactions = Transaction.query.filter_by(exercise_id=exercise_id).all()
-    
-    # Check for unbalanced transactions
-    unbalanced = []
-    for transaction in transactions:
-        items = TransactionItem.query.filter_by(transaction_id=transaction.id).all()
-        total_debit = sum(item.debit_amount for item in items)
-        total_credit = sum(item.credit_amount for item in items)
-        
-        if total_debit != total_credit:
-            unbalanced.append({
-                'id': transaction.id,
-                'reference': transaction.reference,
-                'date': transaction.transaction_date.strftime('%Y-%m-%d'),
-                'difference': float(total_debit - total_credit)
-            })
+    Exercise.query.get_or_404(exercise_id)
     
-    if unbalanced:
-        findings.append({
-            'type': 'warning',
-            'title': 'Transactions non équilibrées',
-            'description': f"{len(unbalanced)} transaction(s) présentent des débits et crédits non équilibrés.",
-            'details': unbalanced
-        })
-    
-    # Check for duplicate transactions
-    references = {}
-    for transaction in transactions:
-        ref = transaction.reference
-        if ref in references:
-            references[ref].append(transaction.id)
-        else:
-            references[ref] = [transaction.id]
-    
-    duplicates = {ref: ids for ref, ids in references.items() if len(ids) > 1}
-    
-    if duplicates:
-        findings.append({
-            'type': 'warning',
-            'title': 'Références en double',
-            'description': f"{len(duplicates)} référence(s) de transaction sont utilisées plus d'une fois.",
-            'details': duplicates
-        })
-    
-    # Look for unusual activity
-    # (This is simplified; a real implementation would use statistical methods)
-    account_activity = {}
-    for transaction in transactions:
-        for item in transaction.items:
-            if item.account_id not in account_activity:
-                account_activity[item.account_id] = []
-            
-            amount = max(item.debit_amount, item.credit_amount)
-            account_activity[item.account_id].append(float(amount))
-    
-    unusual = []
-    for account_id, amounts in account_activity.items():
-        if len(amounts) < 2:
-            continue
-            
-        avg = sum(amounts) / len(amounts)
-        for amount in amounts:
-            # Flag if amount is more than 3x the average
-            if amount > avg * 3:
-                account = Account.query.get(account_id)
-                unusual.append({
-                    'account': f"{account.account_number} - {account.name}",
-                    'amount': amount,
-                    'average': avg
-                })
-                break
-    
-    if unusual:
-        findings.append({
-            'type': 'info',
-            'title': 'Montants inhabituels',
-            'description': f"{len(unusual)} compte(s) présentent des montants inhabituellement élevés.",
-            'details': unusual
-        })
-    
-    return findings
+    # One query into NumPy arrays, every check is vectorized
+    return detect_anomalies(exercise_id)
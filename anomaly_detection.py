@@ -0,0 +1,326 @@
+"""
+Statistical anomaly detection over the transaction items of an exercise.
+
+The items are loaded by one query into NumPy arrays (transaction, account, day,
+amount in centimes) and every check runs on whole arrays: balance per
+transaction, robust outliers per account (median/MAD z-scores and IQR fences),
+activity on unusual days of the week, round amounts and duplicated lines.
+"""
+import logging
+from collections import defaultdict
+from itertools import chain
+
+import numpy as np
+
+from app import db
+from models import Transaction, TransactionItem
+from account_index import get_account_index
+from ledger_money import cents_column, cents_to_float, epoch_day
+
+logger = logging.getLogger(__name__)
+
+# Modified z-score above which an amount is an outlier (Iglewicz and Hoaglin)
+MAD_Z_THRESHOLD = 3.5
+# Consistency constant of the MAD for normally distributed amounts
+MAD_SCALE = 0.6745
+# Tukey fence for the far outliers
+IQR_FACTOR = 3.0
+# Robust statistics are meaningless on a handful of amounts
+MIN_ACCOUNT_ITEMS = 8
+
+# A weekday is unusual when it has less than this share of the median weekday activity
+WEEKDAY_ACTIVITY_RATIO = 0.2
+
+# Round amounts: multiples of 1 000, flagged when they make most of an account activity
+ROUND_AMOUNT_CENTS = 100_000
+ROUND_SHARE_THRESHOLD = 0.5
+MIN_ROUND_ITEMS = 3
+
+# Details kept per finding
+MAX_DETAILS = 50
+
+WEEKDAY_NAMES = ('lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi', 'dimanche')
+
+def load_item_arrays(exercise_id):
+    """
+    Load the items of an exercise in one query, ordered by transaction, and the
+    references of its transactions.
+    Returns {'transaction_ids', 'account_ids', 'days' (datetime64[D]), 'debits', 'credits',
+    'amounts' (centimes, int64)} and the {transaction id: reference} map.
+    """
+    # Core select of plain integers: no ORM row processing, no date or Decimal objects
+    rows = db.session.execute(db.select(
+        TransactionItem.transaction_id,
+        TransactionItem.account_id,
+        epoch_day(Transaction.transaction_date),
+        cents_column(TransactionItem.debit_amount),
+        cents_column(TransactionItem.credit_amount)
+    ).join(
+        Transaction, TransactionItem.transaction_id == Transaction.id
+    ).where(
+        Transaction.exercise_id == exercise_id
+    ).order_by(
+        TransactionItem.transaction_id, TransactionItem.id
+    )).all()
+
+    values = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=5 * len(rows)).reshape(-1, 5)
+    arrays = {
+        'transaction_ids': values[:, 0].copy(),
+        'account_ids': values[:, 1].copy(),
+        'days': values[:, 2].astype('datetime64[D]'),
+        'debits': values[:, 3].copy(),
+        'credits': values[:, 4].copy(),
+    }
+    arrays['amounts'] = np.maximum(arrays['debits'], arrays['credits'])
+
+    references = dict(db.session.execute(db.select(Transaction.id, Transaction.reference).where(
+        Transaction.exercise_id == exercise_id
+    )).all())
+    return arrays, references
+
+def _segments(keys):
+    """Return the start and length of each run of equal values in a sorted array"""
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+    lengths = np.diff(np.r_[starts, len(keys)])
+    return starts, lengths
+
+def _segment_quantile(sorted_values, starts, lengths, q):
+    """Linear interpolation quantile of each sorted segment (numpy's default method)"""
+    position = starts + q * (lengths - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.ceil(position).astype(np.int64)
+    fraction = position - lower
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * fraction
+
+def unbalanced_transactions(arrays):
+    """
+    Return (position of the first item, debit - credit in centimes) of the
+    unbalanced transactions, the items being ordered by transaction
+    """
+    transaction_ids = arrays['transaction_ids']
+    if not len(transaction_ids):
+        return transaction_ids, transaction_ids
+    starts, _ = _segments(transaction_ids)
+    differences = np.add.reduceat(arrays['debits'] - arrays['credits'], starts)
+    unbalanced = differences != 0
+    return starts[unbalanced], differences[unbalanced]
+
+def robust_amount_outliers(account_ids, amounts):
+    """
+    Flag the amounts far from the usual amounts of their account, per account:
+    modified z-score |0.6745 (x - median) / MAD| above MAD_Z_THRESHOLD, or outside
+    the IQR_FACTOR Tukey fences. Accounts with fewer than MIN_ACCOUNT_ITEMS
+    amounts are skipped.
+    Returns (outlier mask, median, z-score) aligned on the input arrays.
+    """
+    size = len(amounts)
+    medians = np.zeros(size)
+    zscores = np.zeros(size)
+    if not size:
+        return np.zeros(0, dtype=bool), medians, zscores
+
+    values = amounts.astype(np.float64)
+    order = np.lexsort((values, account_ids))
+    sorted_accounts = account_ids[order]
+    sorted_values = values[order]
+    starts, lengths = _segments(sorted_accounts)
+
+    median = _segment_quantile(sorted_values, starts, lengths, 0.5)
+    q1 = _segment_quantile(sorted_values, starts, lengths, 0.25)
+    q3 = _segment_quantile(sorted_values, starts, lengths, 0.75)
+
+    # Median absolute deviation: same segments, deviations sorted within each account
+    segment_of = np.repeat(np.arange(len(starts)), lengths)
+    deviations = np.abs(sorted_values - median[segment_of])
+    deviation_order = np.lexsort((deviations, segment_of))
+    mad = _segment_quantile(deviations[deviation_order], starts, lengths, 0.5)
+
+    item_median = median[segment_of]
+    item_mad = mad[segment_of]
+    item_zscores = np.divide(MAD_SCALE * (sorted_values - item_median), item_mad,
+                             out=np.zeros(size), where=item_mad > 0)
+
+    iqr = (q3 - q1)[segment_of]
+    outside_fences = (iqr > 0) & ((sorted_values > q3[segment_of] + IQR_FACTOR * iqr) |
+                                  (sorted_values < q1[segment_of] - IQR_FACTOR * iqr))
+    enough_items = lengths[segment_of] >= MIN_ACCOUNT_ITEMS
+    sorted_outliers = enough_items & ((np.abs(item_zscores) > MAD_Z_THRESHOLD) | outside_fences)
+
+    outliers = np.zeros(size, dtype=bool)
+    outliers[order] = sorted_outliers
+    medians[order] = item_median
+    zscores[order] = item_zscores
+    return outliers, medians, zscores
+
+def unusual_weekdays(days):
+    """
+    Return (weekday of each item, Monday = 0; weekdays whose activity is below
+    WEEKDAY_ACTIVITY_RATIO of the median active weekday)
+    """
+    # 1970-01-01 was a Thursday
+    weekdays = (days.astype(np.int64) + 3) % 7
+    counts = np.bincount(weekdays, minlength=7)
+    active = counts[counts > 0]
+    if len(active) < 2:
+        return weekdays, np.zeros(0, dtype=np.int64)
+    threshold = WEEKDAY_ACTIVITY_RATIO * np.median(active)
+    return weekdays, np.flatnonzero((counts > 0) & (counts < threshold))
+
+def round_amount_accounts(account_ids, amounts):
+    """Return (account ids, round item count, share) of the accounts mostly moved by round amounts"""
+    if not len(amounts):
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0)
+    is_round = (amounts > 0) & (amounts % ROUND_AMOUNT_CENTS == 0)
+    accounts, inverse, totals = np.unique(account_ids, return_inverse=True, return_counts=True)
+    rounds = np.bincount(inverse, weights=is_round, minlength=len(accounts)).astype(np.int64)
+    shares = rounds / totals
+    flagged = (rounds >= MIN_ROUND_ITEMS) & (shares >= ROUND_SHARE_THRESHOLD)
+    return accounts[flagged], rounds[flagged], shares[flagged]
+
+def duplicate_lines(arrays):
+    """
+    Find lines repeated in different transactions: same account, day, debit and credit.
+    Returns a list of (account id, day, amount in centimes, [transaction ids]).
+    """
+    if not len(arrays['transaction_ids']):
+        return []
+    keys = (arrays['transaction_ids'], arrays['credits'], arrays['debits'],
+            arrays['days'].astype(np.int64), arrays['account_ids'])
+    order = np.lexsort(keys)
+    account_ids = arrays['account_ids'][order]
+    days = arrays['days'][order]
+    debits = arrays['debits'][order]
+    credits = arrays['credits'][order]
+    transaction_ids = arrays['transaction_ids'][order]
+
+    same_line = ((account_ids[1:] == account_ids[:-1]) & (days[1:] == days[:-1]) &
+                 (debits[1:] == debits[:-1]) & (credits[1:] == credits[:-1]))
+    other_transaction = transaction_ids[1:] != transaction_ids[:-1]
+
+    # Runs of identical lines spanning at least two transactions
+    starts, lengths = _segments(np.cumsum(np.r_[True, ~same_line]))
+    repeated = np.add.reduceat(np.r_[False, same_line & other_transaction], starts) > 0
+
+    duplicates = []
+    for start, length in zip(starts[repeated].tolist(), lengths[repeated].tolist()):
+        duplicates.append((
+            int(account_ids[start]),
+            days[start].item(),
+            int(max(debits[start], credits[start])),
+            sorted(set(transaction_ids[start:start + length].tolist()))
+        ))
+    return duplicates
+
+def detect_anomalies(exercise_id):
+    """
+    Run every check on the items of an exercise.
+    Returns the findings: [{'type', 'title', 'description', 'details'}]
+    """
+    arrays, references = load_item_arrays(exercise_id)
+    index = get_account_index(exercise_id)
+    findings = []
+
+    def account_name(account_id):
+        entry = index.get(account_id)
+        return entry.full_name if entry else str(account_id)
+
+    # Transactions whose debits and credits differ
+    positions, differences = unbalanced_transactions(arrays)
+    if len(positions):
+        findings.append({
+            'type': 'warning',
+            'title': 'Transactions non équilibrées',
+            'description': f"{len(positions)} transaction(s) présentent des débits et crédits non équilibrés.",
+            'details': [{
+                'id': transaction_id,
+                'reference': references.get(transaction_id),
+                'date': day.strftime('%Y-%m-%d'),
+                'difference': cents_to_float(difference)
+            } for transaction_id, day, difference in zip(arrays['transaction_ids'][positions].tolist(),
+                                                         arrays['days'][positions].tolist(),
+                                                         differences.tolist())]
+        })
+
+    # References used by several transactions
+    transactions_by_reference = defaultdict(list)
+    for transaction_id, reference in references.items():
+        transactions_by_reference[reference].append(transaction_id)
+    duplicated_references = {reference: sorted(ids) for reference, ids in transactions_by_reference.items() if len(ids) > 1}
+    if duplicated_references:
+        findings.append({
+            'type': 'warning',
+            'title': 'Références en double',
+            'description': f"{len(duplicated_references)} référence(s) de transaction sont utilisées plus d'une fois.",
+            'details': duplicated_references
+        })
+
+    # Same line entered in several transactions
+    duplicates = duplicate_lines(arrays)
+    if duplicates:
+        findings.append({
+            'type': 'warning',
+            'title': 'Lignes en double',
+            'description': f"{len(duplicates)} ligne(s) identiques (compte, date, montant) apparaissent dans plusieurs transactions.",
+            'details': [{
+                'account': account_name(account_id),
+                'date': day.strftime('%Y-%m-%d'),
+                'amount': cents_to_float(amount),
+                'transactions': transaction_ids
+            } for account_id, day, amount, transaction_ids in duplicates[:MAX_DETAILS]]
+        })
+
+    # Amounts far from the usual amounts of their account
+    outliers, medians, zscores = robust_amount_outliers(arrays['account_ids'], arrays['amounts'])
+    outlier_positions = np.flatnonzero(outliers)
+    if len(outlier_positions):
+        # Largest deviations first
+        outlier_positions = outlier_positions[np.argsort(-np.abs(zscores[outlier_positions]), kind='stable')]
+        findings.append({
+            'type': 'info',
+            'title': 'Montants inhabituels',
+            'description': f"{len(np.unique(arrays['account_ids'][outlier_positions]))} compte(s) présentent "
+                           f"{len(outlier_positions)} montant(s) très éloignés de leurs montants habituels.",
+            'details': [{
+                'account': account_name(int(arrays['account_ids'][i])),
+                'transaction_id': int(arrays['transaction_ids'][i]),
+                'reference': references.get(int(arrays['transaction_ids'][i])),
+                'date': arrays['days'][i].item().strftime('%Y-%m-%d'),
+                'amount': cents_to_float(arrays['amounts'][i]),
+                'median': round(float(medians[i]) / 100, 2),
+                'zscore': round(float(zscores[i]), 2)
+            } for i in outlier_positions[:MAX_DETAILS].tolist()]
+        })
+
+    # Entries on days of the week the exercise is barely active
+    weekdays, rare_weekdays = unusual_weekdays(arrays['days'])
+    if len(rare_weekdays):
+        on_rare_days = np.isin(weekdays, rare_weekdays)
+        transaction_ids = np.unique(arrays['transaction_ids'][on_rare_days])
+        findings.append({
+            'type': 'info',
+            'title': 'Jours inhabituels',
+            'description': f"{len(transaction_ids)} transaction(s) sont datées d'un jour peu habituel "
+                           f"({', '.join(WEEKDAY_NAMES[weekday] for weekday in rare_weekdays.tolist())}).",
+            'details': [{
+                'id': transaction_id,
+                'reference': references.get(transaction_id)
+            } for transaction_id in transaction_ids[:MAX_DETAILS].tolist()]
+        })
+
+    # Accounts moved mostly by round amounts
+    round_accounts, round_counts, round_shares = round_amount_accounts(arrays['account_ids'], arrays['amounts'])
+    if len(round_accounts):
+        findings.append({
+            'type': 'info',
+            'title': 'Montants ronds',
+            'description': f"{len(round_accounts)} compte(s) sont mouvementés principalement par des montants ronds.",
+            'details': [{
+                'account': account_name(account_id),
+                'count': count,
+                'share': round(share, 2)
+            } for account_id, count, share in zip(round_accounts.tolist(), round_counts.tolist(), round_shares.tolist())]
+        })
+
+    logger.debug(f"Anomaly detection for exercise {exercise_id}: {len(arrays['amounts'])} items, {len(findings)} finding(s)")
+    return findings
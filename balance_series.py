@@ -0,0 +1,172 @@
+import json
+import logging
+from datetime import date, timedelta
+
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+from app import db
+from models import Exercise, Account, Transaction, TransactionItem
+from ledger_aggregates import signed_balance
+from ledger_money import cents_column, from_cents
+from report_cache import ReportCache, report_version
+from utils import DecimalEncoder
+
+logger = logging.getLogger(__name__)
+
+SERIES_PERIODS = ('month', 'week')
+SERIES_GROUPS = ('account', 'class')
+
+# Series are small JSON documents, many more of them fit than rendered reports
+series_cache = ReportCache(max_entries=512, max_bytes=16 * 1024 * 1024)
+
+class period_start(FunctionElement):
+    """First day of the month or of the week (Monday) of a date column"""
+    type = db.Date()
+    inherit_cache = True
+
+    def __init__(self, period, column):
+        self.period = period
+        super().__init__(column)
+
+@compiles(period_start)
+def _period_start_default(element, compiler, **kw):
+    column = compiler.process(list(element.clauses)[0], **kw)
+    return f"CAST(date_trunc('{element.period}', {column}) AS DATE)"
+
+@compiles(period_start, 'sqlite')
+def _period_start_sqlite(element, compiler, **kw):
+    column = compiler.process(list(element.clauses)[0], **kw)
+    if element.period == 'month':
+        return f"date({column}, 'start of month')"
+    # strftime('%w') is 0 on Sunday, back to the previous Monday
+    return f"date({column}, '-' || (((CAST(strftime('%w', {column}) AS INTEGER) + 6) % 7)) || ' days')"
+
+def _to_date(value):
+    """Normalize a period start returned by the database"""
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    if hasattr(value, 'date'):
+        return value.date()
+    return value
+
+def get_periods(start_date, end_date, period='month'):
+    """Return the start dates of the periods covering [start_date, end_date]"""
+    if period == 'month':
+        current = start_date.replace(day=1)
+    else:
+        current = start_date - timedelta(days=start_date.weekday())
+
+    periods = []
+    while current <= end_date:
+        periods.append(current)
+        if period == 'month':
+            current = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+        else:
+            current += timedelta(days=7)
+    return periods
+
+def get_balance_series(exercise_id, period='month', group_by='account', prefix=None):
+    """
+    Build the posted debit/credit/balance series of an exercise, per account or per
+    OHADA class, by month or week, from one query grouped on the truncated date.
+    Amounts are summed in the database and accumulated as integer centimes.
+    Returns {'periods': [...], 'series': [{'key', 'label', 'debit', 'credit', 'net', 'balance'}]}
+    where 'net' is the signed movement of each period and 'balance' the running balance.
+    """
+    if period not in SERIES_PERIODS:
+        raise ValueError(f"Période non supportée: {period}")
+    if group_by not in SERIES_GROUPS:
+        raise ValueError(f"Regroupement non supporté: {group_by}")
+
+    exercise = Exercise.query.get(exercise_id)
+    if not exercise:
+        raise ValueError(f"Exercice introuvable: {exercise_id}")
+
+    bucket = period_start(period, Transaction.transaction_date).label('period')
+    query = db.session.query(
+        Account.id,
+        Account.account_number,
+        Account.name,
+        Account.account_type,
+        bucket,
+        cents_column(db.func.coalesce(db.func.sum(TransactionItem.debit_amount), 0)),
+        cents_column(db.func.coalesce(db.func.sum(TransactionItem.credit_amount), 0))
+    ).join(
+        TransactionItem, TransactionItem.account_id == Account.id
+    ).join(
+        Transaction, TransactionItem.transaction_id == Transaction.id
+    ).filter(
+        Transaction.exercise_id == exercise_id,
+        Transaction.is_posted == True
+    )
+
+    if prefix:
+        query = query.filter(Account.account_number.startswith(prefix))
+
+    rows = query.group_by(
+        Account.id, Account.account_number, Account.name, Account.account_type, bucket
+    ).all()
+
+    periods = get_periods(exercise.start_date, exercise.end_date, period)
+    position = {period_date: index for index, period_date in enumerate(periods)}
+
+    series = {}
+    for account_id, account_number, name, account_type, period_date, debit, credit in rows:
+        if group_by == 'class':
+            key, label = account_number[:1], f"Classe {account_number[:1]}"
+        else:
+            key, label = account_number, name
+
+        entry = series.get(key)
+        if entry is None:
+            entry = series[key] = {
+                'key': key,
+                'label': label,
+                'debit': [0] * len(periods),
+                'credit': [0] * len(periods),
+                'net': [0] * len(periods)
+            }
+
+        index = position.get(_to_date(period_date))
+        if index is None:
+            continue  # Transaction dated outside the exercise
+        debit = int(debit)
+        credit = int(credit)
+        entry['debit'][index] += debit
+        entry['credit'][index] += credit
+        # Class series add up the balances of their accounts, each on its normal side
+        entry['net'][index] += signed_balance(account_type, debit, credit)
+
+    for entry in series.values():
+        running = 0
+        entry['balance'] = []
+        for net in entry['net']:
+            running += net
+            entry['balance'].append(from_cents(running))
+        for column in ('debit', 'credit', 'net'):
+            entry[column] = [from_cents(amount) for amount in entry[column]]
+
+    return {
+        'exercise_id': exercise_id,
+        'period': period,
+        'group_by': group_by,
+        'prefix': prefix,
+        'periods': [period_date.isoformat() for period_date in periods],
+        'series': [series[key] for key in sorted(series)]
+    }
+
+def get_balance_series_json(exercise_id, period='month', group_by='account', prefix=None):
+    """Return the series as JSON bytes, cached until the ledger or chart version of the exercise changes"""
+    versions = db.session.query(Exercise.ledger_version, Exercise.chart_version).filter(Exercise.id == exercise_id).first()
+    version = report_version(*versions) if versions else report_version(0, 0)
+    key = (exercise_id, period, group_by, prefix or None, version)
+
+    content = series_cache.get(key)
+    if content is None:
+        series_cache.invalidate_stale(exercise_id, version)
+        data = get_balance_series(exercise_id, period, group_by, prefix)
+        content = json.dumps(data, cls=DecimalEncoder, separators=(',', ':')).encode('utf-8')
+        series_cache.set(key, content)
+
+    return content
@@ -0,0 +1,322 @@
+import logging
+from datetime import datetime
+from decimal import Decimal
+
+from app import db
+from models import Exercise, Transaction, TransactionItem, AccountBalance, AccountDailyBalance
+from daily_cube import daily_cube_cache
+
+logger = logging.getLogger(__name__)
+
+def bump_ledger_version(exercise_id):
+    """
+    Increment the ledger version of an exercise after any transaction change,
+    invalidating the reports and daily cubes cached for the previous version. Does not commit.
+    """
+    Exercise.query.filter_by(id=exercise_id).update({
+        Exercise.ledger_version: db.func.coalesce(Exercise.ledger_version, 0) + 1
+    }, synchronize_session=False)
+    daily_cube_cache.invalidate(exercise_id)
+
+def _apply_daily_totals(daily_rows, direction):
+    """
+    Add (exercise_id, account_id, day, debit, credit) rows to the stored balances.
+    Existing rows get atomic increments in one executemany UPDATE per table,
+    missing rows are bulk inserted.
+    """
+    daily = {}
+    totals = {}
+    for exercise_id, account_id, day, debit, credit in daily_rows:
+        debit = (debit or Decimal('0')) * direction
+        credit = (credit or Decimal('0')) * direction
+
+        bucket = daily.setdefault((exercise_id, account_id, day), [Decimal('0'), Decimal('0')])
+        bucket[0] += debit
+        bucket[1] += credit
+
+        total = totals.setdefault((exercise_id, account_id), [Decimal('0'), Decimal('0'), day])
+        total[0] += debit
+        total[1] += credit
+        total[2] = max(total[2], day)
+
+    if not daily:
+        return
+
+    exercise_ids = {key[0] for key in totals}
+    account_ids = {key[1] for key in totals}
+
+    existing_days = {
+        (exercise_id, account_id, day): row_id
+        for row_id, exercise_id, account_id, day in db.session.query(
+            AccountDailyBalance.id,
+            AccountDailyBalance.exercise_id,
+            AccountDailyBalance.account_id,
+            AccountDailyBalance.day
+        ).filter(
+            AccountDailyBalance.exercise_id.in_(exercise_ids),
+            AccountDailyBalance.account_id.in_(account_ids),
+            AccountDailyBalance.day.in_({key[2] for key in daily})
+        )
+    }
+
+    existing_balances = {
+        (exercise_id, account_id): row_id
+        for row_id, exercise_id, account_id in db.session.query(
+            AccountBalance.id,
+            AccountBalance.exercise_id,
+            AccountBalance.account_id
+        ).filter(
+            AccountBalance.exercise_id.in_(exercise_ids),
+            AccountBalance.account_id.in_(account_ids)
+        )
+    }
+
+    # Atomic increments so concurrent postings on the same account do not overwrite each other
+    daily_table = AccountDailyBalance.__table__
+    daily_updates = [
+        {'row_id': existing_days[key], 'add_debit': debit, 'add_credit': credit}
+        for key, (debit, credit) in daily.items() if key in existing_days
+    ]
+    if daily_updates:
+        db.session.execute(
+            daily_table.update().where(
+                daily_table.c.id == db.bindparam('row_id')
+            ).values(
+                debit=daily_table.c.debit + db.bindparam('add_debit', type_=db.Numeric(15, 2)),
+                credit=daily_table.c.credit + db.bindparam('add_credit', type_=db.Numeric(15, 2))
+            ),
+            daily_updates
+        )
+
+    balance_table = AccountBalance.__table__
+    balance_updates = [
+        {'row_id': existing_balances[key], 'add_debit': debit, 'add_credit': credit, 'day': day}
+        for key, (debit, credit, day) in totals.items() if key in existing_balances
+    ]
+    if balance_updates:
+        day = db.bindparam('day', type_=db.Date)
+        db.session.execute(
+            balance_table.update().where(
+                balance_table.c.id == db.bindparam('row_id')
+            ).values(
+                total_debit=balance_table.c.total_debit + db.bindparam('add_debit', type_=db.Numeric(15, 2)),
+                total_credit=balance_table.c.total_credit + db.bindparam('add_credit', type_=db.Numeric(15, 2)),
+                last_transaction_date=db.case(
+                    (balance_table.c.last_transaction_date == None, day),
+                    (balance_table.c.last_transaction_date < day, day),
+                    else_=balance_table.c.last_transaction_date
+                ),
+                updated_at=datetime.utcnow()
+            ),
+            balance_updates
+        )
+
+    db.session.bulk_insert_mappings(AccountDailyBalance, [{
+        'exercise_id': key[0],
+        'account_id': key[1],
+        'day': key[2],
+        'debit': debit,
+        'credit': credit
+    } for key, (debit, credit) in daily.items() if key not in existing_days])
+
+    db.session.bulk_insert_mappings(AccountBalance, [{
+        'exercise_id': key[0],
+        'account_id': key[1],
+        'total_debit': debit,
+        'total_credit': credit,
+        'last_transaction_date': day
+    } for key, (debit, credit, day) in totals.items() if key not in existing_balances])
+
+def apply_transaction(transaction, direction=1):
+    """
+    Add a posted transaction to the stored balances (direction=1),
+    or remove it (direction=-1) before it is edited or deleted.
+    Must be called while the transaction items are still in the session.
+    Does not commit.
+    """
+    apply_transactions([transaction.id], direction)
+
+def apply_transactions(transaction_ids, direction=1):
+    """
+    Add (or remove) a set of transactions to the stored balances,
+    from one query grouping their items by account and day.
+    Does not commit.
+    """
+    if not transaction_ids:
+        return
+
+    db.session.flush()
+
+    daily_rows = db.session.query(
+        Transaction.exercise_id,
+        TransactionItem.account_id,
+        Transaction.transaction_date,
+        db.func.sum(TransactionItem.debit_amount),
+        db.func.sum(TransactionItem.credit_amount)
+    ).join(
+        Transaction, TransactionItem.transaction_id == Transaction.id
+    ).filter(
+        TransactionItem.transaction_id.in_(transaction_ids)
+    ).group_by(
+        Transaction.exercise_id,
+        TransactionItem.account_id,
+        Transaction.transaction_date
+    ).all()
+
+    _apply_daily_totals(daily_rows, direction)
+
+def refresh_transaction_totals(transaction_ids):
+    """
+    Recompute the stored debit and credit totals of a set of transactions from
+    their items, in one UPDATE with correlated sums. Call after items are added,
+    changed or deleted. Does not commit.
+    """
+    transaction_ids = set(transaction_ids)
+    if not transaction_ids:
+        return
+
+    db.session.flush()
+
+    def item_total(column):
+        return db.select(db.func.coalesce(db.func.sum(column), 0)).where(
+            TransactionItem.transaction_id == Transaction.id
+        ).scalar_subquery()
+
+    Transaction.query.filter(Transaction.id.in_(transaction_ids)).update({
+        Transaction.total_debit: item_total(TransactionItem.debit_amount),
+        Transaction.total_credit: item_total(TransactionItem.credit_amount)
+    }, synchronize_session=False)
+
+    # Loaded transactions read the new totals on next access
+    for transaction in list(db.session.identity_map.values()):
+        if isinstance(transaction, Transaction) and transaction.id in transaction_ids:
+            db.session.expire(transaction, ['total_debit', 'total_credit'])
+
+def get_stored_totals(account_id, exercise_id, end_date=None):
+    """
+    Return (total_debit, total_credit) for an account from the stored balances,
+    or None if no stored balance exists for it.
+    """
+    balance = AccountBalance.query.filter_by(exercise_id=exercise_id, account_id=account_id).first()
+    if balance is None:
+        return None
+
+    if end_date is None or balance.last_transaction_date is None or end_date >= balance.last_transaction_date:
+        return balance.total_debit or Decimal('0'), balance.total_credit or Decimal('0')
+
+    # The period stops before the latest posting: sum the daily buckets instead
+    result = db.session.query(
+        db.func.sum(AccountDailyBalance.debit),
+        db.func.sum(AccountDailyBalance.credit)
+    ).filter(
+        AccountDailyBalance.exercise_id == exercise_id,
+        AccountDailyBalance.account_id == account_id,
+        AccountDailyBalance.day <= end_date
+    ).first()
+
+    return result[0] or Decimal('0'), result[1] or Decimal('0')
+
+def rebuild_balances(exercise_id=None, dry_run=False):
+    """
+    Recompute the stored balances from the posted transaction items, bumping the ledger
+    version of every rebuilt exercise so the values cached from the old store are dropped.
+    Returns a report listing every (exercise, account) whose stored totals drifted.
+    """
+    daily_query = db.session.query(
+        Transaction.exercise_id,
+        TransactionItem.account_id,
+        Transaction.transaction_date,
+        db.func.sum(TransactionItem.debit_amount),
+        db.func.sum(TransactionItem.credit_amount)
+    ).join(
+        Transaction, TransactionItem.transaction_id == Transaction.id
+    ).filter(
+        Transaction.is_posted == True
+    )
+    stored_query = AccountBalance.query
+
+    if exercise_id is not None:
+        daily_query = daily_query.filter(Transaction.exercise_id == exercise_id)
+        stored_query = stored_query.filter_by(exercise_id=exercise_id)
+
+    daily_rows = daily_query.group_by(
+        Transaction.exercise_id,
+        TransactionItem.account_id,
+        Transaction.transaction_date
+    ).all()
+
+    # Expected cumulative totals per (exercise, account)
+    expected = {}
+    for row_exercise_id, account_id, day, debit, credit in daily_rows:
+        key = (row_exercise_id, account_id)
+        total = expected.setdefault(key, {'debit': Decimal('0'), 'credit': Decimal('0'), 'last_date': day})
+        total['debit'] += debit or Decimal('0')
+        total['credit'] += credit or Decimal('0')
+        total['last_date'] = max(total['last_date'], day)
+
+    stored = {(b.exercise_id, b.account_id): b for b in stored_query.all()}
+
+    drift = []
+    for key in sorted(set(expected) | set(stored)):
+        expected_total = expected.get(key, {'debit': Decimal('0'), 'credit': Decimal('0')})
+        stored_balance = stored.get(key)
+        stored_debit = stored_balance.total_debit if stored_balance else Decimal('0')
+        stored_credit = stored_balance.total_credit if stored_balance else Decimal('0')
+
+        if stored_debit != expected_total['debit'] or stored_credit != expected_total['credit']:
+            drift.append({
+                'exercise_id': key[0],
+                'account_id': key[1],
+                'stored_debit': str(stored_debit),
+                'stored_credit': str(stored_credit),
+                'expected_debit': str(expected_total['debit']),
+                'expected_credit': str(expected_total['credit'])
+            })
+
+    report = {
+        'exercise_id': exercise_id,
+        'accounts_checked': len(set(expected) | set(stored)),
+        'drift': drift,
+        'dry_run': dry_run
+    }
+
+    if dry_run:
+        return report
+
+    # Replace the stored rows by the recomputed ones
+    daily_delete = AccountDailyBalance.query
+    balance_delete = AccountBalance.query
+    if exercise_id is not None:
+        daily_delete = daily_delete.filter_by(exercise_id=exercise_id)
+        balance_delete = balance_delete.filter_by(exercise_id=exercise_id)
+    daily_delete.delete(synchronize_session=False)
+    balance_delete.delete(synchronize_session=False)
+
+    db.session.bulk_insert_mappings(AccountDailyBalance, [{
+        'exercise_id': row_exercise_id,
+        'account_id': account_id,
+        'day': day,
+        'debit': debit or Decimal('0'),
+        'credit': credit or Decimal('0')
+    } for row_exercise_id, account_id, day, debit, credit in daily_rows])
+
+    db.session.bulk_insert_mappings(AccountBalance, [{
+        'exercise_id': key[0],
+        'account_id': key[1],
+        'total_debit': total['debit'],
+        'total_credit': total['credit'],
+        'last_transaction_date': total['last_date']
+    } for key, total in expected.items()])
+
+    rebuilt_exercise_ids = {exercise_id} if exercise_id is not None else {key[0] for key in set(expected) | set(stored)}
+    for rebuilt_exercise_id in sorted(rebuilt_exercise_ids):
+        bump_ledger_version(rebuilt_exercise_id)
+
+    db.session.commit()
+
+    if drift:
+        logger.warning(f"Stored balances rebuilt, {len(drift)} account(s) had drifted")
+    else:
+        logger.info("Stored balances rebuilt, no drift detected")
+
+    return report
@@ -0,0 +1,159 @@
+"""
+Benchmark of the keyword classifier against the per-keyword substring checks it replaces.
+
+Generates long exercise statements and noisy OCR texts, checks that both
+implementations classify them identically and prints their median latency, then
+measures how both scale with the number of keywords, using the words of the
+OHADA account names as extra rules. Usage:
+
+    python benchmark_classifier.py [n_texts] [words_per_text]
+"""
+import sys
+import time
+import random
+import re
+import statistics
+
+from keyword_classifier import get_classifier, KeywordMatcher
+from ohada_init import OHADA_ACCOUNTS, iter_chart_accounts
+
+REPEAT = 5
+
+# Margin allowed for timer noise when checking that the classifier is no slower than the legacy checks
+SLOWDOWN_TOLERANCE = 1.2
+
+# Keyword set sizes of the scaling run
+RULE_COUNTS = (10, 20, 30, 40, 60, 100, 200)
+
+FILLER_WORDS = (
+    "la société a réalisé au cours du mois les opérations suivantes avec ses partenaires "
+    "le montant hors taxes est réglé par chèque bancaire selon la facture numéro du "
+    "comptable doit passer les écritures nécessaires au titre de l'exercice en cours"
+).split()
+
+def _legacy_match_accounts(classifier, text):
+    """Former auto_categorize_transaction matching: one substring check per keyword"""
+    description = text.lower()
+    return {keyword: account for keyword, account in classifier.transaction_accounts if keyword in description}
+
+def _legacy_classify_operation(texte):
+    """Former ComptableIA.analyser_operation"""
+    texte = texte.lower()
+    if "achat" in texte and "marchandises" in texte:
+        return "achat_marchandises"
+    elif "vente" in texte:
+        return "vente_marchandises"
+    elif "transport" in texte:
+        return "transport"
+    elif "remise" in texte or "ristourne" in texte:
+        return "remise"
+    elif "amortissement" in texte:
+        return "amortissement"
+    elif "immobilisation" in texte or "matériel" in texte:
+        return "immobilisation"
+    elif "salaire" in texte:
+        return "salaires"
+    else:
+        return None
+
+def _legacy_category_scores(classifier, text):
+    """Former ExerciseSolver._detect_exercise_category scoring: one count per keyword"""
+    text_lower = text.lower()
+    return {category: sum(text_lower.count(kw) for kw in keywords)
+            for category, keywords in classifier.exercise_categories}
+
+def generate_texts(n_texts, words_per_text, ocr_noise=False, seed_value=1):
+    """Generate statements mixing filler words and classification keywords"""
+    random.seed(seed_value)
+    classifier = get_classifier()
+    keywords = sorted(set(classifier.account_matcher.keywords + classifier.operation_matcher.keywords +
+                          classifier.category_matcher.keywords))
+    texts = []
+    for _ in range(n_texts):
+        words = []
+        for _ in range(words_per_text):
+            word = random.choice(keywords) if random.random() < 0.05 else random.choice(FILLER_WORDS)
+            if ocr_noise:
+                # Scanned documents: upper case lines, amounts and broken lines
+                if random.random() < 0.1:
+                    word = word.upper()
+                if random.random() < 0.1:
+                    word = f"{random.randint(1, 999999)},{random.randint(0, 99):02d}"
+                if random.random() < 0.05:
+                    word += "\n"
+            words.append(word)
+        texts.append(' '.join(words))
+    return texts
+
+def _median_ms(function, texts, repeat=REPEAT):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            function(text)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def run_benchmark(n_texts=200, words_per_text=2000):
+    """
+    Return {name: (legacy ms, classifier ms)} after checking that both give the same
+    results and that the classifier is no slower on the shipped rule sets
+    """
+    classifier = get_classifier()
+    cases = {
+        'transaction_accounts': (lambda text: _legacy_match_accounts(classifier, text), classifier.match_accounts),
+        'operations': (_legacy_classify_operation, classifier.classify_operation),
+        'exercise_categories': (lambda text: _legacy_category_scores(classifier, text), classifier.category_scores),
+    }
+    corpora = {
+        'énoncés': generate_texts(n_texts, words_per_text),
+        'ocr': generate_texts(n_texts, words_per_text, ocr_noise=True, seed_value=2),
+    }
+
+    results = {}
+    for corpus_name, texts in corpora.items():
+        for case_name, (legacy, compiled) in cases.items():
+            mismatches = sum(1 for text in texts if legacy(text) != compiled(text))
+            if mismatches:
+                raise AssertionError(f"{case_name} on {corpus_name}: {mismatches} text(s) classified differently")
+            legacy_ms, compiled_ms = _median_ms(legacy, texts), _median_ms(compiled, texts)
+            if compiled_ms > legacy_ms * SLOWDOWN_TOLERANCE:
+                raise AssertionError(f"{case_name} on {corpus_name}: {legacy_ms:.1f} ms -> {compiled_ms:.1f} ms, slower than the legacy checks")
+            results[f"{case_name} / {corpus_name}"] = (legacy_ms, compiled_ms)
+
+    return results
+
+def run_scaling_benchmark(n_texts=200, words_per_text=2000, rule_counts=RULE_COUNTS):
+    """
+    Return {number of keywords: (one substring count per keyword ms, compiled scan ms)}
+    after checking that both count the same occurrences
+    """
+    words = sorted({word.lower() for account_data, _ in iter_chart_accounts(OHADA_ACCOUNTS)
+                    for word in re.findall(r"\w{5,}", account_data["name"])})
+    texts = generate_texts(n_texts, words_per_text, seed_value=3)
+
+    results = {}
+    for rule_count in rule_counts:
+        keywords = words[:rule_count]
+        substring_matcher = KeywordMatcher(keywords, compiled=False)
+        compiled_matcher = KeywordMatcher(keywords, compiled=True)
+        mismatches = sum(1 for text in texts if substring_matcher.count(text) != compiled_matcher.count(text))
+        if mismatches:
+            raise AssertionError(f"{rule_count} keywords: {mismatches} text(s) counted differently")
+        results[len(keywords)] = (
+            _median_ms(substring_matcher.count, texts),
+            _median_ms(compiled_matcher.count, texts)
+        )
+    return results
+
+if __name__ == "__main__":
+    n_texts = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    words_per_text = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    for name, (legacy_ms, compiled_ms) in run_benchmark(n_texts, words_per_text).items():
+        speedup = legacy_ms / compiled_ms if compiled_ms else float('inf')
+        print(f"{name}: {legacy_ms:.1f} ms -> {compiled_ms:.1f} ms (x{speedup:.2f})")
+
+    for rule_count, (legacy_ms, compiled_ms) in run_scaling_benchmark(n_texts, words_per_text).items():
+        speedup = legacy_ms / compiled_ms if compiled_ms else float('inf')
+        print(f"{rule_count} keywords: {legacy_ms:.1f} ms -> {compiled_ms:.1f} ms (x{speedup:.2f})")
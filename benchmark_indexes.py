@@ -0,0 +1,239 @@
+"""
+Benchmark of the hot query paths before and after the index migrations.
+
+Builds a scratch database without the hot path indexes, fills it with synthetic
+data, then prints the query plan and median latency of each query before and
+after running db_migrations.upgrade. Usage:
+
+    python benchmark_indexes.py [n_transactions] [database_url]
+
+Without database_url a temporary SQLite file is used. A given database must be
+a scratch one: its tables are created and dropped by the benchmark.
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import statistics
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, select, func
+
+from app import db
+from models import (User, Exercise, Account, Transaction, TransactionItem, Document,
+                    Workgroup, Post, Like, PrivateMessage, Notification)
+from db_migrations import HOT_PATH_INDEXES, KEYSET_INDEXES, get_model_indexes, upgrade
+
+REPEAT = 20
+INSERT_BATCH_SIZE = 5000
+
+def _insert(connection, model, rows):
+    """Bulk insert rows in batches"""
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        connection.execute(model.__table__.insert(), rows[start:start + INSERT_BATCH_SIZE])
+
+def seed(engine, n_transactions, n_exercises=10, n_accounts=50, n_users=200, seed_value=1):
+    """Fill the scratch database with synthetic accounting and social data"""
+    random.seed(seed_value)
+    now = datetime.utcnow()
+
+    with engine.begin() as connection:
+        _insert(connection, User, [{
+            'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com',
+            'full_name': f'User {i}', 'password_hash': 'x'
+        } for i in range(1, n_users + 1)])
+
+        _insert(connection, Workgroup, [{
+            'id': i, 'name': f'Groupe {i}', 'owner_id': random.randint(1, n_users)
+        } for i in range(1, 21)])
+
+        _insert(connection, Exercise, [{
+            'id': i, 'name': f'Exercice {i}', 'start_date': date(2024, 1, 1),
+            'end_date': date(2024, 12, 31), 'user_id': 1
+        } for i in range(1, n_exercises + 1)])
+
+        account_types = ['asset', 'liability', 'equity', 'revenue', 'expense']
+        accounts = []
+        for exercise_id in range(1, n_exercises + 1):
+            for i in range(n_accounts):
+                accounts.append({
+                    'id': len(accounts) + 1, 'exercise_id': exercise_id,
+                    'account_number': f'{(i % 8) + 1}{i:04d}', 'name': f'Compte {i}',
+                    'account_type': account_types[i % len(account_types)]
+                })
+        _insert(connection, Account, accounts)
+
+        _insert(connection, Document, [{
+            'id': i, 'original_filename': f'doc{i}.pdf', 'filename': f'doc{i}.pdf',
+            'document_type': 'invoice', 'user_id': 1,
+            'exercise_id': random.randint(1, n_exercises),
+            'upload_date': now - timedelta(minutes=i)
+        } for i in range(1, n_transactions // 4 + 1)])
+
+        transactions = []
+        items = []
+        for i in range(1, n_transactions + 1):
+            exercise_id = random.randint(1, n_exercises)
+            transactions.append({
+                'id': i, 'reference': f'R{i}', 'description': f'Opération {i}',
+                'transaction_date': date(2024, 1, 1) + timedelta(days=random.randint(0, 365)),
+                'is_posted': random.random() < 0.8, 'user_id': 1, 'exercise_id': exercise_id
+            })
+            debit_account, credit_account = random.sample(range(n_accounts), 2)
+            amount = random.randint(100, 1000000) / 100
+            first_account_id = (exercise_id - 1) * n_accounts + 1
+            items.append({'transaction_id': i, 'account_id': first_account_id + debit_account,
+                          'debit_amount': amount, 'credit_amount': 0})
+            items.append({'transaction_id': i, 'account_id': first_account_id + credit_account,
+                          'debit_amount': 0, 'credit_amount': amount})
+        _insert(connection, Transaction, transactions)
+        _insert(connection, TransactionItem, items)
+
+        _insert(connection, Notification, [{
+            'user_id': random.randint(1, n_users), 'title': 'Notification', 'content': 'Contenu',
+            'notification_type': 'system', 'is_read': random.random() < 0.7,
+            'created_at': now - timedelta(minutes=i)
+        } for i in range(n_transactions)])
+
+        _insert(connection, PrivateMessage, [{
+            'content': 'Message', 'sender_id': random.randint(1, n_users),
+            'recipient_id': random.randint(1, n_users), 'is_read': random.random() < 0.7,
+            'sent_at': now - timedelta(minutes=i)
+        } for i in range(n_transactions)])
+
+        n_posts = n_transactions // 2
+        _insert(connection, Post, [{
+            'id': i, 'content': 'Publication', 'user_id': random.randint(1, n_users),
+            'workgroup_id': random.randint(1, 20) if random.random() < 0.5 else None,
+            'created_at': now - timedelta(minutes=i)
+        } for i in range(1, n_posts + 1)])
+
+        _insert(connection, Like, [{
+            'user_id': random.randint(1, n_users), 'post_id': random.randint(1, n_posts)
+        } for _ in range(n_transactions * 2)])
+
+def get_benchmark_queries():
+    """Return the hot path queries, as issued by the application"""
+    period_end = date(2024, 6, 30)
+
+    return {
+        'trial_balance': select(
+            Account.id,
+            func.sum(TransactionItem.debit_amount),
+            func.sum(TransactionItem.credit_amount)
+        ).join(
+            TransactionItem, TransactionItem.account_id == Account.id
+        ).join(
+            Transaction, TransactionItem.transaction_id == Transaction.id
+        ).where(
+            Account.exercise_id == 3,
+            Transaction.exercise_id == 3,
+            Transaction.is_posted == True,
+            Transaction.transaction_date <= period_end
+        ).group_by(Account.id),
+        'account_ledger': select(
+            Transaction.transaction_date, TransactionItem.debit_amount, TransactionItem.credit_amount
+        ).join(
+            Transaction, TransactionItem.transaction_id == Transaction.id
+        ).where(
+            TransactionItem.account_id == 105,
+            Transaction.is_posted == True
+        ).order_by(Transaction.transaction_date),
+        'transactions_list': select(Transaction.id).where(
+            Transaction.exercise_id == 3
+        ).order_by(Transaction.transaction_date.desc()).limit(50),
+        'account_lookup': select(Account.id).where(
+            Account.exercise_id == 3,
+            Account.account_number == '10007'
+        ),
+        'unread_notifications': select(Notification.id).where(
+            Notification.user_id == 7,
+            Notification.is_read == False
+        ).order_by(Notification.created_at.desc()).limit(20),
+        'unread_messages': select(func.count(PrivateMessage.id)).where(
+            PrivateMessage.recipient_id == 7,
+            PrivateMessage.is_read == False
+        ),
+        'workgroup_feed': select(Post.id).where(
+            Post.workgroup_id == 4
+        ).order_by(Post.created_at.desc()).limit(20),
+        'post_like_count': select(func.count(Like.id)).where(Like.post_id == 42),
+        'user_liked_post': select(Like.id).where(Like.user_id == 7, Like.post_id == 42),
+        'exercise_documents': select(Document.id).where(
+            Document.exercise_id == 3
+        ).order_by(Document.upload_date.desc()),
+    }
+
+def explain(connection, statement):
+    """Return the query plan of a statement as a list of lines"""
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+
+    if connection.dialect.name == 'sqlite':
+        return [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+    if connection.dialect.name == 'postgresql':
+        return [row[0] for row in connection.exec_driver_sql(f"EXPLAIN ANALYZE {sql}")]
+    return [row[0] for row in connection.exec_driver_sql(f"EXPLAIN {sql}")]
+
+def measure(engine, queries, repeat=REPEAT):
+    """Return {name: (plan, median latency in ms)} for every query"""
+    results = {}
+    with engine.connect() as connection:
+        connection.exec_driver_sql("ANALYZE")
+        for name, statement in queries.items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                connection.execute(statement).fetchall()
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = (explain(connection, statement), statistics.median(timings))
+        connection.commit()
+    return results
+
+def run_benchmark(n_transactions=20000, database_url=None):
+    """Run the benchmark and return {name: (before, after)}"""
+    temp_path = None
+    if database_url is None:
+        handle, temp_path = tempfile.mkstemp(suffix='.db', prefix='benchmark_indexes_')
+        os.close(handle)
+        database_url = f"sqlite:///{temp_path}"
+
+    engine = create_engine(database_url)
+    try:
+        # Schema as it was before the migrations: tables without the hot path and keyset indexes
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            for index in get_model_indexes(HOT_PATH_INDEXES + KEYSET_INDEXES):
+                index.drop(connection, checkfirst=True)
+
+        seed(engine, n_transactions)
+        queries = get_benchmark_queries()
+
+        before = measure(engine, queries)
+        upgrade(engine)
+        after = measure(engine, queries)
+
+        return {name: (before[name], after[name]) for name in queries}
+    finally:
+        if temp_path:
+            engine.dispose()
+            os.remove(temp_path)
+        else:
+            db.metadata.drop_all(engine)
+            engine.dispose()
+
+if __name__ == "__main__":
+    n_transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    database_url = sys.argv[2] if len(sys.argv) > 2 else None
+
+    results = run_benchmark(n_transactions, database_url)
+
+    for name, ((plan_before, latency_before), (plan_after, latency_after)) in results.items():
+        speedup = latency_before / latency_after if latency_after else float('inf')
+        print(f"=== {name}: {latency_before:.2f} ms -> {latency_after:.2f} ms (x{speedup:.1f})")
+        print("  before:")
+        for line in plan_before:
+            print(f"    {line}")
+        print("  after:")
+        for line in plan_after:
+            print(f"    {line}")
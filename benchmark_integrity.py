@@ -0,0 +1,188 @@
+"""
+Benchmark of the streaming ledger integrity verifier.
+
+Builds a scratch database with synthetic posted and draft transactions (two
+items each), their stored totals and stored balances, plants a known number of
+violations of each invariant, then runs verify_ledger with several chunk sizes
+and prints its throughput, its peak Python memory (a second run under
+tracemalloc) and whether every planted violation was found. Usage:
+
+    python benchmark_integrity.py [n_transactions] [database_url]
+
+Without database_url a temporary SQLite file is used. A given database must be
+a scratch one: its tables are created and dropped by the benchmark.
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import tracemalloc
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine
+
+from app import db
+from models import User, Exercise, Account, Transaction, TransactionItem, AccountBalance, AccountDailyBalance
+from ledger_integrity import verify_ledger
+
+INSERT_BATCH_SIZE = 10000
+CHUNK_SIZES = (10000, 50000, 200000)
+
+# Violations planted of each kind
+PLANTED = 25
+
+def seed(engine, n_transactions, n_exercises=10, n_accounts=50, seed_value=1):
+    """
+    Fill the scratch database in batches and plant the violations.
+    Returns ({check: number of violations expected}, item count).
+    """
+    random.seed(seed_value)
+    start_day = date(2024, 1, 1)
+    daily = {}
+
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert(), [{
+            'id': 1, 'username': 'bench', 'email': 'bench@example.com', 'full_name': 'Bench', 'password_hash': 'x'
+        }])
+        connection.execute(Exercise.__table__.insert(), [{
+            'id': i, 'name': f'Exercice {i}', 'start_date': start_day,
+            'end_date': date(2024, 12, 31), 'user_id': 1
+        } for i in range(1, n_exercises + 1)])
+        connection.execute(Account.__table__.insert(), [{
+            'id': (exercise_id - 1) * n_accounts + i + 1, 'exercise_id': exercise_id,
+            'account_number': f'{(i % 8) + 1}{i:04d}', 'name': f'Compte {i}', 'account_type': 'asset'
+        } for exercise_id in range(1, n_exercises + 1) for i in range(n_accounts)])
+
+        # Planted violations, spread over the id range
+        planted_ids = random.sample(range(1, n_transactions + 1), PLANTED * 4)
+        unbalanced = set(planted_ids[:PLANTED])
+        foreign_account = set(planted_ids[PLANTED:2 * PLANTED])
+        drifted_totals = set(planted_ids[2 * PLANTED:3 * PLANTED])
+        invalid_amount = set(planted_ids[3 * PLANTED:])
+
+        item_id = 0
+        for batch_start in range(1, n_transactions + 1, INSERT_BATCH_SIZE):
+            transactions = []
+            items = []
+            for i in range(batch_start, min(batch_start + INSERT_BATCH_SIZE, n_transactions + 1)):
+                exercise_id = random.randint(1, n_exercises)
+                is_posted = random.random() < 0.8 or i in unbalanced
+                day = start_day + timedelta(days=random.randint(0, 365))
+                amount = random.randint(100, 1000000)
+                debit_account, credit_account = random.sample(range(n_accounts), 2)
+                first_account_id = (exercise_id - 1) * n_accounts + 1
+                debit_account_id = first_account_id + debit_account
+                credit_account_id = first_account_id + credit_account
+
+                credit_amount = amount + 1 if i in unbalanced else amount
+                if i in foreign_account:
+                    # An account of the next exercise
+                    credit_account_id = (exercise_id % n_exercises) * n_accounts + 1 + credit_account
+                debit_amount = 0 if i in invalid_amount else amount
+                if i in invalid_amount:
+                    credit_amount = 0
+
+                stored_debit = debit_amount + (100 if i in drifted_totals else 0)
+                transactions.append({
+                    'id': i, 'reference': f'R{i}', 'transaction_date': day, 'is_posted': is_posted,
+                    'user_id': 1, 'exercise_id': exercise_id,
+                    'total_debit': stored_debit / 100, 'total_credit': credit_amount / 100
+                })
+                item_id += 2
+                items.append({'id': item_id - 1, 'transaction_id': i, 'account_id': debit_account_id,
+                              'debit_amount': debit_amount / 100, 'credit_amount': 0})
+                items.append({'id': item_id, 'transaction_id': i, 'account_id': credit_account_id,
+                              'debit_amount': 0, 'credit_amount': credit_amount / 100})
+
+                if is_posted:
+                    for account_id, debit, credit in ((debit_account_id, debit_amount, 0),
+                                                      (credit_account_id, 0, credit_amount)):
+                        total = daily.setdefault((exercise_id, account_id, day), [0, 0])
+                        total[0] += debit
+                        total[1] += credit
+
+            connection.execute(Transaction.__table__.insert(), transactions)
+            connection.execute(TransactionItem.__table__.insert(), items)
+
+        # Stored balances as maintained on posting, with drifted daily and account rows
+        drifted_days = set(random.sample(sorted(daily), PLANTED))
+        accounts = {}
+        daily_rows = []
+        for (exercise_id, account_id, day), (debit, credit) in sorted(daily.items()):
+            stored_debit = debit + (100 if (exercise_id, account_id, day) in drifted_days else 0)
+            daily_rows.append({'exercise_id': exercise_id, 'account_id': account_id, 'day': day,
+                               'debit': stored_debit / 100, 'credit': credit / 100})
+            total = accounts.setdefault((exercise_id, account_id), [0, 0, day])
+            total[0] += debit
+            total[1] += credit
+            total[2] = max(total[2], day)
+        for batch_start in range(0, len(daily_rows), INSERT_BATCH_SIZE):
+            connection.execute(AccountDailyBalance.__table__.insert(), daily_rows[batch_start:batch_start + INSERT_BATCH_SIZE])
+
+        drifted_accounts = set(random.sample(sorted(accounts), PLANTED))
+        connection.execute(AccountBalance.__table__.insert(), [{
+            'exercise_id': exercise_id, 'account_id': account_id,
+            'total_debit': (debit + (100 if (exercise_id, account_id) in drifted_accounts else 0)) / 100,
+            'total_credit': credit / 100, 'last_transaction_date': last_day
+        } for (exercise_id, account_id), (debit, credit, last_day) in accounts.items()])
+
+    return {
+        'unbalanced_transactions': PLANTED,
+        'stored_transaction_totals': PLANTED,
+        'missing_accounts': 0,
+        'account_exercise_mismatch': PLANTED,
+        # Both items of an empty transaction are invalid
+        'invalid_amounts': PLANTED * 2,
+        'account_balances': PLANTED,
+        'daily_balances': PLANTED,
+    }, item_id
+
+def run_benchmark(n_transactions=500000, database_url=None, chunk_sizes=CHUNK_SIZES):
+    """Run the benchmark and return (item count, expected counts, {chunk size: (report, peak memory in MB)})"""
+    temp_path = None
+    if database_url is None:
+        handle, temp_path = tempfile.mkstemp(suffix='.db', prefix='benchmark_integrity_')
+        os.close(handle)
+        database_url = f"sqlite:///{temp_path}"
+
+    engine = create_engine(database_url)
+    try:
+        db.metadata.create_all(engine)
+        expected, item_count = seed(engine, n_transactions)
+
+        results = {}
+        for chunk_size in chunk_sizes:
+            report = verify_ledger(chunk_size=chunk_size, engine=engine)
+
+            # Memory is measured on a separate run, tracemalloc slows allocations down
+            tracemalloc.start()
+            verify_ledger(chunk_size=chunk_size, engine=engine)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            results[chunk_size] = (report, peak / (1024 * 1024))
+        return item_count, expected, results
+    finally:
+        if temp_path:
+            engine.dispose()
+            os.remove(temp_path)
+        else:
+            db.metadata.drop_all(engine)
+            engine.dispose()
+
+if __name__ == "__main__":
+    n_transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    database_url = sys.argv[2] if len(sys.argv) > 2 else None
+
+    started = time.perf_counter()
+    item_count, expected, results = run_benchmark(n_transactions, database_url)
+    print(f"{item_count} items seeded and verified in {time.perf_counter() - started:.1f} s")
+
+    for chunk_size, (report, peak_memory) in results.items():
+        rate = report['items_checked'] / report['elapsed_seconds'] if report['elapsed_seconds'] else float('inf')
+        print(f"=== chunk {chunk_size}: {report['elapsed_seconds']:.2f} s, {rate:,.0f} items/s, "
+              f"peak memory {peak_memory:.0f} MB, {report['chunks']} chunks")
+        for name, check in report['checks'].items():
+            status = "ok" if check['count'] == expected[name] else f"EXPECTED {expected[name]}"
+            print(f"  {name}: {check['count']} ({status})")
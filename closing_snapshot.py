@@ -0,0 +1,110 @@
+import json
+import zlib
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+
+from app import db
+from models import Account, ClosingSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Reports frozen at closing time, computed over the whole exercise
+SNAPSHOT_REPORTS = ('trial_balance', 'balance_sheet', 'income_statement', 'general_ledger')
+
+def _dump(value):
+    """Convert report data to JSON-compatible values, keeping accounts as ids"""
+    if isinstance(value, Account):
+        return {'__account__': value.id}
+    if isinstance(value, Decimal):
+        return {'__decimal__': str(value)}
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    if isinstance(value, dict):
+        return {key: _dump(item) for key, item in value.items() if key != 'exercise'}
+    if isinstance(value, (list, tuple)):
+        return [_dump(item) for item in value]
+    return value
+
+def _collect_account_ids(value, account_ids):
+    """Collect the ids of the accounts referenced by dumped report data"""
+    if isinstance(value, dict):
+        if '__account__' in value:
+            account_ids.add(value['__account__'])
+        else:
+            for item in value.values():
+                _collect_account_ids(item, account_ids)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_account_ids(item, account_ids)
+
+def _load(value, accounts):
+    """Rebuild report data from its dumped form"""
+    if isinstance(value, dict):
+        if '__account__' in value:
+            return accounts.get(value['__account__'])
+        if '__decimal__' in value:
+            return Decimal(value['__decimal__'])
+        if '__datetime__' in value:
+            return datetime.fromisoformat(value['__datetime__'])
+        if '__date__' in value:
+            return date.fromisoformat(value['__date__'])
+        return {key: _load(item, accounts) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_load(item, accounts) for item in value]
+    return value
+
+def create_closing_snapshots(exercise):
+    """
+    Freeze the final reports of an exercise. Must be called before the
+    exercise is marked as closed, on the raw transaction items.
+    Does not commit.
+    """
+    from document_generator import (generate_trial_balance, generate_balance_sheet,
+                                    generate_income_statement, generate_general_ledger)
+
+    generators = {
+        'trial_balance': lambda: generate_trial_balance(exercise.id),
+        'balance_sheet': lambda: generate_balance_sheet(exercise.id),
+        'income_statement': lambda: generate_income_statement(exercise.id),
+        'general_ledger': lambda: generate_general_ledger(exercise.id)
+    }
+
+    ClosingSnapshot.query.filter_by(exercise_id=exercise.id).delete(synchronize_session=False)
+
+    for report_type in SNAPSHOT_REPORTS:
+        payload = json.dumps(_dump(generators[report_type]()), ensure_ascii=False, separators=(',', ':'))
+        db.session.add(ClosingSnapshot(
+            exercise_id=exercise.id,
+            report_type=report_type,
+            payload=zlib.compress(payload.encode('utf-8'))
+        ))
+
+    logger.info(f"Closing snapshots created for exercise {exercise.id}")
+
+def get_closing_snapshot(exercise, report_type):
+    """
+    Return the frozen report data of a closed exercise,
+    or None if the exercise is open or has no snapshot for this report.
+    """
+    if not exercise.is_closed:
+        return None
+
+    snapshot = ClosingSnapshot.query.filter_by(exercise_id=exercise.id, report_type=report_type).first()
+    if snapshot is None:
+        return None
+
+    dumped = json.loads(zlib.decompress(snapshot.payload).decode('utf-8'))
+
+    account_ids = set()
+    _collect_account_ids(dumped, account_ids)
+    accounts = {}
+    if account_ids:
+        accounts = {account.id: account for account in Account.query.filter(Account.id.in_(account_ids)).all()}
+
+    data = _load(dumped, accounts)
+    data['exercise'] = exercise
+
+    return data
@@ -0,0 +1,242 @@
+import os
+import csv
+import logging
+import tempfile
+from datetime import date
+
+import numpy as np
+
+from app import db
+from models import Exercise, Account, Transaction, TransactionItem, workgroup_exercises
+from journal_export import EXPORT_BATCH_SIZE
+from ledger_money import cents_column, epoch_day, from_cents
+
+# pyarrow is only needed for the Parquet and Arrow exports, CSV is written with the csv module
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Extension and MIME type of each columnar format
+COLUMNAR_FORMATS = {
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('.arrow', 'application/vnd.apache.arrow.file'),
+    'csv': ('.csv', 'text/csv'),
+}
+
+PARQUET_COMPRESSION = 'zstd'
+
+# Columns of the export, one row per journal line
+JOURNAL_COLUMNS = (
+    'exercise_id', 'exercise', 'transaction_id', 'transaction_date', 'reference', 'description',
+    'is_posted', 'account_number', 'account_name', 'account_type', 'debit', 'credit'
+)
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+class ColumnarExportError(Exception):
+    """Raised when a columnar export cannot be written"""
+    pass
+
+def _journal_schema():
+    """
+    One row per journal line, with its transaction, account and exercise.
+    Account and exercise labels are dictionary encoded: each distinct value is stored once.
+    """
+    label = pa.dictionary(pa.int32(), pa.string())
+    amount = pa.decimal128(15, 2)
+    types = (pa.int32(), label, pa.int64(), pa.date32(), pa.string(), pa.string(),
+             pa.bool_(), label, label, label, amount, amount)
+    return pa.schema(list(zip(JOURNAL_COLUMNS, types)))
+
+def scope_exercise_ids(user_id=None, workgroup_id=None):
+    """Return the ids of the exercises of a user, or of those shared in a workgroup"""
+    if workgroup_id is not None:
+        query = db.session.query(workgroup_exercises.c.exercise_id).filter(
+            workgroup_exercises.c.workgroup_id == workgroup_id
+        )
+    else:
+        query = db.session.query(Exercise.id).filter(Exercise.user_id == user_id)
+    return sorted(exercise_id for exercise_id, in query.all())
+
+class _Dictionary:
+    """Dictionary encoding of a label of the rows identified by an id (account or exercise)"""
+
+    def __init__(self, ids, labels):
+        values = sorted(set(labels))
+        positions = {value: position for position, value in enumerate(values)}
+        order = np.argsort(ids)
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.indices = np.array([positions[label] for label in labels], dtype=np.int32)[order]
+        self.dictionary = pa.array(values, pa.string())
+
+    def encode(self, ids):
+        """Return the DictionaryArray of the labels of the given ids"""
+        indices = self.indices[np.searchsorted(self.ids, ids)]
+        return pa.DictionaryArray.from_arrays(indices, self.dictionary)
+
+def _amount_array(cents):
+    """Build a decimal128(15, 2) array from int64 centimes without creating a Decimal per value"""
+    # decimal128 values are the unscaled integers in 16 little-endian bytes: centimes, then their sign
+    words = np.empty((len(cents), 2), dtype='<i8')
+    words[:, 0] = cents
+    words[:, 1] = cents >> 63
+    return pa.Array.from_buffers(pa.decimal128(15, 2), len(cents), [None, pa.py_buffer(words)])
+
+def _scope_labels(exercise_ids):
+    """Return ({exercise id: name}, {account id: (number, name, type)}) of the exported exercises"""
+    exercises = dict(db.session.query(Exercise.id, Exercise.name).filter(Exercise.id.in_(exercise_ids)).all())
+    accounts = {
+        account_id: (account_number, name, account_type or '')
+        for account_id, account_number, name, account_type in db.session.query(
+            Account.id, Account.account_number, Account.name, Account.account_type
+        ).filter(Account.exercise_id.in_(exercise_ids)).all()
+    }
+    return exercises, accounts
+
+def _iter_journal_partitions(exercise_ids, batch_size):
+    """
+    Yield the journal lines of several exercises by lists of batch_size rows, in exercise
+    and date order, read through a server-side cursor: (exercise id, transaction id,
+    epoch day, reference, description, posted, account id, debit, credit), amounts in centimes
+    """
+    query = db.select(
+        Transaction.exercise_id,
+        Transaction.id,
+        epoch_day(Transaction.transaction_date),
+        Transaction.reference,
+        db.func.coalesce(TransactionItem.description, Transaction.description),
+        Transaction.is_posted,
+        TransactionItem.account_id,
+        cents_column(TransactionItem.debit_amount),
+        cents_column(TransactionItem.credit_amount)
+    ).join(
+        TransactionItem, TransactionItem.transaction_id == Transaction.id
+    ).where(
+        Transaction.exercise_id.in_(exercise_ids)
+    ).order_by(
+        Transaction.exercise_id,
+        Transaction.transaction_date,
+        Transaction.id,
+        TransactionItem.id
+    ).execution_options(yield_per=batch_size)
+
+    for rows in db.session.execute(query).partitions():
+        yield rows
+
+def iter_journal_batches(exercise_ids, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield the journal lines of several exercises as Arrow record batches: amounts come
+    as centimes and dates as epoch days, so the columns are filled from NumPy arrays.
+    """
+    schema = _journal_schema()
+    exercise_ids = list(exercise_ids)
+    if not exercise_ids:
+        return
+
+    exercises, accounts = _scope_labels(exercise_ids)
+    exercise_names = _Dictionary(list(exercises), list(exercises.values()))
+    account_ids = list(accounts)
+    account_numbers = _Dictionary(account_ids, [labels[0] for labels in accounts.values()])
+    account_names = _Dictionary(account_ids, [labels[1] for labels in accounts.values()])
+    account_types = _Dictionary(account_ids, [labels[2] for labels in accounts.values()])
+
+    for rows in _iter_journal_partitions(exercise_ids, batch_size):
+        (exercise_column, transaction_ids, days, references, descriptions,
+         posted, item_accounts, debits, credits) = zip(*rows)
+
+        exercise_column = np.array(exercise_column, dtype=np.int64)
+        item_accounts = np.array(item_accounts, dtype=np.int64)
+
+        yield pa.RecordBatch.from_arrays([
+            pa.array(exercise_column.astype(np.int32)),
+            exercise_names.encode(exercise_column),
+            pa.array(np.array(transaction_ids, dtype=np.int64)),
+            pa.array(np.array(days, dtype=np.int32)).view(pa.date32()),
+            pa.array(references, pa.string()),
+            pa.array(descriptions, pa.string()),
+            pa.array(posted, pa.bool_()),
+            account_numbers.encode(item_accounts),
+            account_names.encode(item_accounts),
+            account_types.encode(item_accounts),
+            _amount_array(np.array(debits, dtype=np.int64)),
+            _amount_array(np.array(credits, dtype=np.int64)),
+        ], schema=schema)
+
+def write_journal_csv(exercise_ids, file_path, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Write the journal lines of several exercises to a CSV file with the columns of the
+    Parquet export (comma separated, ISO dates, dot decimals), without pyarrow. Returns the line count.
+    """
+    exercise_ids = list(exercise_ids)
+    rows_written = 0
+
+    with open(file_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(JOURNAL_COLUMNS)
+        if not exercise_ids:
+            return rows_written
+
+        exercises, accounts = _scope_labels(exercise_ids)
+        for rows in _iter_journal_partitions(exercise_ids, batch_size):
+            writer.writerows(
+                (exercise_id, exercises[exercise_id], transaction_id,
+                 date.fromordinal(EPOCH_ORDINAL + day).isoformat(), reference, description,
+                 'true' if posted else 'false', *accounts[account_id],
+                 from_cents(debit), from_cents(credit))
+                for exercise_id, transaction_id, day, reference, description, posted, account_id, debit, credit in rows
+            )
+            rows_written += len(rows)
+
+    return rows_written
+
+def write_columnar_export(exercise_ids, file_path, format='parquet'):
+    """Write the journal lines of the given exercises to a Parquet, Arrow IPC or CSV file, batch by batch"""
+    if format not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unsupported columnar format: {format}")
+
+    exercise_ids = list(exercise_ids)
+
+    if format == 'csv':
+        rows = write_journal_csv(exercise_ids, file_path)
+        logger.info(f"Columnar export (csv) of {len(exercise_ids)} exercises: {rows} lines")
+        return
+
+    if not PYARROW_AVAILABLE:
+        raise ColumnarExportError("L'export Parquet/Arrow nécessite le module pyarrow")
+
+    schema = _journal_schema()
+    batches = iter_journal_batches(exercise_ids)
+    rows = 0
+
+    if format == 'parquet':
+        with pq.ParquetWriter(file_path, schema, compression=PARQUET_COMPRESSION) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=PARQUET_COMPRESSION)
+        with pa.OSFile(file_path, 'wb') as sink, pa.ipc.new_file(sink, schema, options=options) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+
+    logger.info(f"Columnar export ({format}) of {len(exercise_ids)} exercises: {rows} lines")
+
+def export_columnar(exercise_ids, format='parquet'):
+    """Write a columnar export to a temporary file and return its path"""
+    suffix = COLUMNAR_FORMATS[format][0] if format in COLUMNAR_FORMATS else ''
+    handle, file_path = tempfile.mkstemp(suffix=suffix, prefix='export_')
+    os.close(handle)
+
+    try:
+        write_columnar_export(exercise_ids, file_path, format)
+    except Exception:
+        os.remove(file_path)
+        raise
+
+    return file_path
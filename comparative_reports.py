@@ -0,0 +1,284 @@
+import io
+import logging
+from decimal import Decimal
+from itertools import chain
+
+import numpy as np
+import xlsxwriter
+
+from app import db
+from models import Exercise, Account, Transaction, TransactionItem, workgroup_exercises
+from ledger_aggregates import DEBIT_NORMAL_TYPES
+from ledger_money import cents_column, from_cents
+from report_cache import report_cache, report_cache_filename, report_version
+from report_renderer import report_renderer
+from utils import format_date
+
+logger = logging.getLogger(__name__)
+
+COMPARATIVE_REPORTS = ('balance_sheet', 'income_statement', 'trial_balance')
+
+# Exercises compared by default: N and N-1
+DEFAULT_YEARS = 2
+MAX_YEARS = 10
+
+def comparable_exercises(exercise, years=DEFAULT_YEARS, workgroup_id=None):
+    """
+    Return exercise N followed by up to years - 1 earlier exercises, most recent first:
+    those of the same owner, or those shared in the given workgroup
+    """
+    query = Exercise.query.filter(Exercise.start_date < exercise.start_date)
+    if workgroup_id is not None:
+        query = query.filter(Exercise.id.in_(
+            db.select(workgroup_exercises.c.exercise_id).where(workgroup_exercises.c.workgroup_id == workgroup_id)
+        ))
+    else:
+        query = query.filter(Exercise.user_id == exercise.user_id)
+
+    return [exercise] + query.order_by(Exercise.start_date.desc()).limit(max(years - 1, 0)).all()
+
+class AlignedTotals:
+    """
+    Posted totals of several exercises aligned on the account numbers:
+    one row per account number, one column per exercise, in centimes.
+    """
+
+    def __init__(self, accounts, debit, credit):
+        self.accounts = accounts  # [{'account_number', 'name', 'account_type'}] in number order
+        self.debit = debit
+        self.credit = credit
+
+    def balances(self):
+        """Signed balances (following the normal side of each account), shape (accounts, exercises)"""
+        debit_normal = np.array([account['account_type'] in DEBIT_NORMAL_TYPES for account in self.accounts], dtype=bool)
+        return np.where(debit_normal[:, None], self.debit - self.credit, self.credit - self.debit)
+
+def get_aligned_totals(exercises):
+    """
+    Aggregate the posted items of several exercises in one grouped query keyed by
+    exercise and account number. The name and type of an account number are those
+    of the most recent exercise using it.
+    """
+    positions = {exercise.id: position for position, exercise in enumerate(exercises)}
+
+    rows = db.session.query(
+        Transaction.exercise_id,
+        Account.account_number,
+        Account.account_type,
+        Account.name,
+        cents_column(db.func.sum(TransactionItem.debit_amount)),
+        cents_column(db.func.sum(TransactionItem.credit_amount))
+    ).join(
+        TransactionItem, TransactionItem.account_id == Account.id
+    ).join(
+        Transaction, TransactionItem.transaction_id == Transaction.id
+    ).filter(
+        Transaction.exercise_id.in_(positions),
+        Transaction.is_posted == True,
+        Account.is_active == True
+    ).group_by(
+        Transaction.exercise_id,
+        Account.account_number,
+        Account.account_type,
+        Account.name
+    ).all()
+
+    accounts = {}
+    for exercise_id, account_number, account_type, name, _, _ in rows:
+        account = accounts.get(account_number)
+        if account is None or positions[exercise_id] < account['position']:
+            accounts[account_number] = {'account_number': account_number, 'name': name,
+                                        'account_type': account_type, 'position': positions[exercise_id]}
+
+    numbers = sorted(accounts)
+    number_positions = {number: position for position, number in enumerate(numbers)}
+
+    amounts = np.fromiter(chain.from_iterable((row[4], row[5]) for row in rows), dtype=np.int64, count=len(rows) * 2).reshape(-1, 2)
+    account_positions = np.fromiter((number_positions[row[1]] for row in rows), dtype=np.int64, count=len(rows))
+    exercise_positions = np.fromiter((positions[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+
+    debit = np.zeros((len(numbers), len(exercises)), dtype=np.int64)
+    credit = np.zeros_like(debit)
+    np.add.at(debit, (account_positions, exercise_positions), amounts[:, 0])
+    np.add.at(credit, (account_positions, exercise_positions), amounts[:, 1])
+
+    return AlignedTotals([
+        {key: accounts[number][key] for key in ('account_number', 'name', 'account_type')} for number in numbers
+    ], debit, credit)
+
+def _section(label, aligned, balances, mask):
+    """Build a section of a comparative statement from the accounts selected by mask"""
+    lines = [{
+        'account_number': account['account_number'],
+        'name': account['name'],
+        'amounts': [from_cents(amount) for amount in balances[position]]
+    } for position, account in enumerate(aligned.accounts) if mask[position] and balances[position].any()]
+
+    return {'label': label, 'lines': lines, 'totals': [from_cents(total) for total in balances[mask].sum(axis=0)]}
+
+def comparative_balance_sheet(exercises, aligned):
+    """Balance sheet of several exercises side by side, with the net income of each in equity"""
+    balances = aligned.balances()
+    types = np.array([account['account_type'] for account in aligned.accounts], dtype=object)
+    net_income = balances[types == 'revenue'].sum(axis=0) - balances[types == 'expense'].sum(axis=0)
+
+    equity = _section('Capitaux propres', aligned, balances, types == 'equity')
+    if net_income.any():
+        equity['lines'].append({'account_number': '', 'name': 'Résultat net de la période',
+                                'amounts': [from_cents(amount) for amount in net_income]})
+    equity['totals'] = [total + from_cents(amount) for total, amount in zip(equity['totals'], net_income)]
+
+    return {
+        'title': 'Bilan comparatif',
+        'exercises': exercises,
+        'sections': [
+            _section('Actif', aligned, balances, types == 'asset'),
+            _section('Passif', aligned, balances, types == 'liability'),
+            equity
+        ],
+        'result_label': None,
+        'result': None
+    }
+
+def comparative_income_statement(exercises, aligned):
+    """Income statement of several exercises side by side"""
+    balances = aligned.balances()
+    types = np.array([account['account_type'] for account in aligned.accounts], dtype=object)
+    net_income = balances[types == 'revenue'].sum(axis=0) - balances[types == 'expense'].sum(axis=0)
+
+    return {
+        'title': 'Compte de résultat comparatif',
+        'exercises': exercises,
+        'sections': [
+            _section('Produits', aligned, balances, types == 'revenue'),
+            _section('Charges', aligned, balances, types == 'expense')
+        ],
+        'result_label': 'Résultat net',
+        'result': [from_cents(amount) for amount in net_income]
+    }
+
+def comparative_trial_balance(exercises, aligned):
+    """Debit-positive balance of every account of several exercises side by side, by OHADA class"""
+    balances = aligned.debit - aligned.credit
+    classes = np.array([account['account_number'][:1] for account in aligned.accounts], dtype=object)
+
+    return {
+        'title': 'Balance comparative',
+        'exercises': exercises,
+        'sections': [_section(f"Classe {class_number}", aligned, balances, classes == class_number)
+                     for class_number in sorted(set(classes))],
+        'result_label': 'Total (débit - crédit)',
+        'result': [from_cents(total) for total in balances.sum(axis=0)]
+    }
+
+def build_comparative_data(exercises, report_type):
+    """Compute a comparative statement of the given exercises (most recent first)"""
+    builders = {
+        'balance_sheet': comparative_balance_sheet,
+        'income_statement': comparative_income_statement,
+        'trial_balance': comparative_trial_balance
+    }
+    if report_type not in builders:
+        raise ValueError(f"Unsupported comparative report type: {report_type}")
+
+    data = builders[report_type](exercises, get_aligned_totals(exercises))
+
+    # Variation of N against N-1, for every line and total
+    for section in data['sections']:
+        for line in section['lines'] + [section]:
+            amounts = line['amounts'] if 'amounts' in line else line['totals']
+            line['variation'] = _variation(amounts)
+    data['result_variation'] = _variation(data['result']) if data['result'] else None
+
+    return data
+
+def _variation(amounts):
+    """Return (difference, percentage or None) of N against N-1, or None with a single exercise"""
+    if len(amounts) < 2:
+        return None
+    difference = amounts[0] - amounts[1]
+    percentage = (difference / abs(amounts[1]) * 100).quantize(Decimal('0.1')) if amounts[1] else None
+    return difference, percentage
+
+def generate_excel_comparative(data):
+    """Render a comparative statement to XLSX bytes"""
+    output = io.BytesIO()
+    workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+    worksheet = workbook.add_worksheet(data['title'][:31])
+
+    header_format = workbook.add_format({'bold': True, 'bg_color': '#4472C4', 'color': 'white', 'align': 'center', 'border': 1})
+    subheader_format = workbook.add_format({'bold': True, 'bg_color': '#D9E1F2', 'border': 1})
+    currency_format = workbook.add_format({'num_format': '#,##0.00 "XOF"', 'border': 1})
+    total_format = workbook.add_format({'bold': True, 'bg_color': '#D9E1F2', 'num_format': '#,##0.00 "XOF"', 'border': 1, 'top': 2})
+    percent_format = workbook.add_format({'num_format': '0.0"%"', 'border': 1})
+    cell_format = workbook.add_format({'border': 1})
+
+    exercises = data['exercises']
+    compared = len(exercises) > 1
+    last_column = 1 + len(exercises) + (2 if compared else 0)
+
+    worksheet.set_column(0, 0, 15)
+    worksheet.set_column(1, 1, 40)
+    worksheet.set_column(2, last_column, 18)
+
+    worksheet.merge_range(0, 0, 0, last_column, data['title'].upper(), header_format)
+
+    headers = ["N° Compte", "Compte"] + [
+        f"{exercise.name} ({format_date(exercise.end_date)})" for exercise in exercises
+    ] + (["Variation", "Variation %"] if compared else [])
+    for column, title in enumerate(headers):
+        worksheet.write(2, column, title, header_format)
+
+    def write_amounts(row, amounts, variation, amount_format):
+        for column, amount in enumerate(amounts, 2):
+            worksheet.write(row, column, float(amount), amount_format)
+        if variation:
+            worksheet.write(row, 2 + len(amounts), float(variation[0]), amount_format)
+            if variation[1] is not None:
+                worksheet.write(row, 3 + len(amounts), float(variation[1]), percent_format)
+
+    row = 3
+    for section in data['sections']:
+        worksheet.merge_range(row, 0, row, last_column, section['label'].upper(), subheader_format)
+        row += 1
+        for line in section['lines']:
+            worksheet.write(row, 0, line['account_number'], cell_format)
+            worksheet.write(row, 1, line['name'], cell_format)
+            write_amounts(row, line['amounts'], line['variation'], currency_format)
+            row += 1
+        worksheet.merge_range(row, 0, row, 1, f"TOTAL {section['label'].upper()}", total_format)
+        write_amounts(row, section['totals'], section['variation'], total_format)
+        row += 2
+
+    if data['result']:
+        worksheet.merge_range(row, 0, row, 1, data['result_label'].upper(), total_format)
+        write_amounts(row, data['result'], data['result_variation'], total_format)
+
+    workbook.close()
+    return output.getvalue()
+
+def get_comparative_report(exercise, report_type, format='html', years=DEFAULT_YEARS, workgroup_id=None):
+    """
+    Return (filename, content) of a comparative statement of exercise N and its
+    predecessors, from the in-memory report cache while no compared ledger or chart of accounts changed
+    """
+    if format not in ('html', 'xlsx'):
+        raise ValueError(f"Unsupported format: {format}")
+    years = min(max(years, 1), MAX_YEARS)
+
+    exercises = comparable_exercises(exercise, years, workgroup_id)
+    compared_versions = tuple((other.id, report_version(other.ledger_version, other.chart_version)) for other in exercises[1:])
+    version = report_version(exercise.ledger_version, exercise.chart_version)
+    key = (exercise.id, f"comparative_{report_type}", format, compared_versions, version)
+
+    content = report_cache.get(key)
+    if content is None:
+        data = build_comparative_data(exercises, report_type)
+        if format == 'html':
+            content = report_renderer.render('comparative', data).encode('utf-8')
+        else:
+            content = generate_excel_comparative(data)
+        report_cache.invalidate_stale(exercise.id, version)
+        report_cache.set(key, content)
+
+    return report_cache_filename(key), content
@@ -30,6 +30,7 @@ try:
     from models import (User, Exercise, Account, Transaction, TransactionItem, 
                        Document, Workgroup, Message, Note, Post, Comment, Like,
                        Story, Notification, workgroup_members, workgroup_exercises)
+    from balance_store import refresh_transaction_totals, apply_transactions, bump_ledger_version
 except ImportError as e:
     logger.error(f"Erreur d'importation: {e}")
     sys.exit(1)
@@ -300,6 +301,11 @@ def create_transactions(exercises, users):
                 transaction_items.append(item)
     
     try:
+        refresh_transaction_totals(transaction.id for transaction in transactions)
+        # Les transactions comptabilisées alimentent les soldes stockés, comme une comptabilisation normale
+        apply_transactions([transaction.id for transaction in transactions if transaction.is_posted])
+        for exercise_id in {transaction.exercise_id for transaction in transactions}:
+            bump_ledger_version(exercise_id)
         db.session.commit()
         logger.info(f"Création de {len(transactions)} transactions et {len(transaction_items)} lignes réussie.")
         return transactions
@@ -0,0 +1,205 @@
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date
+from itertools import chain
+
+import numpy as np
+
+from app import db
+from models import Exercise, Account, Transaction, TransactionItem, AccountBalance, AccountDailyBalance
+from ledger_money import cents_column, epoch_day, from_cents
+
+logger = logging.getLogger(__name__)
+
+EPOCH = date(1970, 1, 1)
+
+# Exercises whose cube is kept in memory by each process
+DAILY_CUBE_CACHE_MAX_EXERCISES = 16
+
+class DailyCube:
+    """
+    Posted debit/credit of one exercise per (account, day), held as cumulative sums
+    in centimes along the days: the totals of any period are two column lookups.
+    """
+
+    def __init__(self, account_ids, first_day, debit_cumsum, credit_cumsum):
+        self.account_ids = account_ids
+        self.first_day = first_day  # Epoch day of column 1 (column 0 is the zero before it)
+        self.debit_cumsum = debit_cumsum
+        self.credit_cumsum = credit_cumsum
+        self.n_days = debit_cumsum.shape[1] - 1
+
+    @classmethod
+    def from_daily_rows(cls, daily, first_day, last_day):
+        """Build the cube from an (n, 4) array of (account id, epoch day, debit, credit) in centimes"""
+        if len(daily):
+            first_day = min(first_day, int(daily[:, 1].min()))
+            last_day = max(last_day, int(daily[:, 1].max()))
+
+        account_ids, account_positions = np.unique(daily[:, 0], return_inverse=True)
+        n_days = max(last_day - first_day + 1, 0)
+        day_positions = daily[:, 1] - first_day + 1
+
+        debit = np.zeros((len(account_ids), n_days + 1), dtype=np.int64)
+        credit = np.zeros_like(debit)
+        np.add.at(debit, (account_positions, day_positions), daily[:, 2])
+        np.add.at(credit, (account_positions, day_positions), daily[:, 3])
+
+        return cls(account_ids, first_day, np.cumsum(debit, axis=1), np.cumsum(credit, axis=1))
+
+    def _column(self, day, offset):
+        return int(np.clip((day - EPOCH).days - self.first_day + offset, 0, self.n_days))
+
+    def period_totals(self, start_date=None, end_date=None):
+        """Return the (debit, credit) arrays in centimes of every account over [start_date, end_date]"""
+        low = 0 if start_date is None else self._column(start_date, 0)
+        high = self.n_days if end_date is None else self._column(end_date, 1)
+        high = max(high, low)
+        return (self.debit_cumsum[:, high] - self.debit_cumsum[:, low],
+                self.credit_cumsum[:, high] - self.credit_cumsum[:, low])
+
+class DailyCubeCache:
+    """Per-process LRU cache of the daily cubes, keyed by exercise and ledger version"""
+
+    def __init__(self, max_exercises=DAILY_CUBE_CACHE_MAX_EXERCISES):
+        self.max_exercises = max_exercises
+        self._cubes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, exercise_id, ledger_version):
+        with self._lock:
+            cached = self._cubes.get(exercise_id)
+            if cached and cached[0] == ledger_version:
+                self._cubes.move_to_end(exercise_id)
+                return cached[1]
+        return None
+
+    def set(self, exercise_id, ledger_version, cube):
+        with self._lock:
+            self._cubes[exercise_id] = (ledger_version, cube)
+            self._cubes.move_to_end(exercise_id)
+            while len(self._cubes) > self.max_exercises:
+                self._cubes.popitem(last=False)
+
+    def invalidate(self, exercise_id=None):
+        with self._lock:
+            if exercise_id is None:
+                self._cubes.clear()
+            else:
+                self._cubes.pop(exercise_id, None)
+
+daily_cube_cache = DailyCubeCache()
+
+def _store_is_complete(exercise_id):
+    """
+    Whether the stored balances of an exercise hold all its postings: their grand totals must
+    equal those of its posted items. Postings made without apply_transactions (imports,
+    seeded data) make them differ.
+    """
+    stored_rows, stored_debit, stored_credit = db.session.query(
+        db.func.count(AccountBalance.id),
+        cents_column(db.func.coalesce(db.func.sum(AccountBalance.total_debit), 0)),
+        cents_column(db.func.coalesce(db.func.sum(AccountBalance.total_credit), 0))
+    ).filter(
+        AccountBalance.exercise_id == exercise_id
+    ).one()
+    if not stored_rows:
+        return False
+
+    posted_debit, posted_credit = db.session.query(
+        cents_column(db.func.coalesce(db.func.sum(TransactionItem.debit_amount), 0)),
+        cents_column(db.func.coalesce(db.func.sum(TransactionItem.credit_amount), 0))
+    ).join(
+        Transaction, TransactionItem.transaction_id == Transaction.id
+    ).filter(
+        Transaction.exercise_id == exercise_id,
+        Transaction.is_posted == True
+    ).one()
+
+    if (stored_debit, stored_credit) != (posted_debit, posted_credit):
+        logger.warning(f"Stored balances of exercise {exercise_id} do not match its posted items "
+                       f"({from_cents(stored_debit)}/{from_cents(stored_credit)} vs "
+                       f"{from_cents(posted_debit)}/{from_cents(posted_credit)}), grouping the items instead")
+        return False
+    return True
+
+def _load_daily_rows(exercise_id):
+    """
+    Read the posted (account, epoch day, debit, credit) totals in centimes of an exercise from the
+    stored daily balances, or group the posted items when the stored balances are missing or incomplete
+    """
+    if _store_is_complete(exercise_id):
+        query = db.session.query(
+            AccountDailyBalance.account_id,
+            epoch_day(AccountDailyBalance.day),
+            cents_column(AccountDailyBalance.debit),
+            cents_column(AccountDailyBalance.credit)
+        ).filter(
+            AccountDailyBalance.exercise_id == exercise_id
+        )
+    else:
+        query = db.session.query(
+            TransactionItem.account_id,
+            epoch_day(Transaction.transaction_date),
+            cents_column(db.func.sum(TransactionItem.debit_amount)),
+            cents_column(db.func.sum(TransactionItem.credit_amount))
+        ).join(
+            Transaction, TransactionItem.transaction_id == Transaction.id
+        ).filter(
+            Transaction.exercise_id == exercise_id,
+            Transaction.is_posted == True
+        ).group_by(
+            TransactionItem.account_id,
+            Transaction.transaction_date
+        )
+
+    rows = query.all()
+    return np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=len(rows) * 4).reshape(-1, 4)
+
+def get_daily_cube(exercise_id):
+    """Return the daily cube of an exercise, rebuilt when its ledger version changed"""
+    exercise = db.session.query(
+        Exercise.ledger_version, Exercise.start_date, Exercise.end_date
+    ).filter(Exercise.id == exercise_id).first()
+    if exercise is None:
+        return None
+    ledger_version = exercise.ledger_version or 0
+
+    cube = daily_cube_cache.get(exercise_id, ledger_version)
+    if cube is None:
+        daily = _load_daily_rows(exercise_id)
+        cube = DailyCube.from_daily_rows(daily, (exercise.start_date - EPOCH).days, (exercise.end_date - EPOCH).days)
+        daily_cube_cache.set(exercise_id, ledger_version, cube)
+        logger.debug(f"Daily cube built for exercise {exercise_id} (version {ledger_version}, "
+                     f"{len(cube.account_ids)} accounts x {cube.n_days} days)")
+
+    return cube
+
+def get_period_account_totals(exercise_id, start_date=None, end_date=None, active_only=True):
+    """
+    Posted debit and credit totals of every account of an exercise over a period,
+    read from the daily cube: same result as ledger_aggregates.get_account_totals
+    (accounts whose debit or credit total is not zero in the period, by account number),
+    without scanning the items.
+    """
+    cube = get_daily_cube(exercise_id)
+    if cube is None or not len(cube.account_ids):
+        return []
+
+    debit, credit = cube.period_totals(start_date, end_date)
+    moved = (debit != 0) | (credit != 0)
+    totals = {int(account_id): (int(d), int(c))
+              for account_id, d, c in zip(cube.account_ids[moved], debit[moved], credit[moved])}
+    if not totals:
+        return []
+
+    query = Account.query.filter(Account.id.in_(totals))
+    if active_only:
+        query = query.filter(Account.is_active == True)
+
+    return [{
+        'account': account,
+        'total_debit': from_cents(totals[account.id][0]),
+        'total_credit': from_cents(totals[account.id][1])
+    } for account in query.order_by(Account.account_number).all()]
@@ -0,0 +1,250 @@
+"""
+Versioned schema migrations for PostgreSQL and SQLite.
+
+Each migration runs once, in its own database transaction, and is recorded in
+the schema_migration table. Usage:
+
+    python db_migrations.py [upgrade|status]
+"""
+import sys
+import logging
+from datetime import datetime
+
+from sqlalchemy import MetaData, Table, Column, String, DateTime, inspect, select, insert, func, bindparam
+
+logger = logging.getLogger(__name__)
+
+migration_metadata = MetaData()
+
+schema_migration = Table(
+    'schema_migration', migration_metadata,
+    Column('version', String(20), primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+# Secondary indexes of the hot query paths, declared on the models
+HOT_PATH_INDEXES = (
+    'ix_transaction_posted_exercise_date',
+    'ix_transaction_item_account_transaction',
+    'ix_transaction_item_transaction',
+    'ix_account_exercise_number',
+    'ix_notification_user_read_created',
+    'ix_private_message_recipient_read',
+    'ix_post_workgroup_created',
+    'ix_like_post',
+    'ix_like_user_post',
+)
+
+# Indexes ending with (sort column, id) read by the keyset pagination of the list views
+KEYSET_INDEXES = (
+    'ix_exercise_user_start_id',
+    'ix_transaction_exercise_date_id',
+    'ix_document_exercise_upload_id',
+    'ix_document_user_upload_id',
+    'ix_exercise_solution_user_created_id',
+    'ix_notification_user_created_id',
+)
+
+# Indexes created by migration 0002 that are prefixes of keyset indexes, dropped by migration 0006
+REPLACED_INDEXES = (
+    'ix_transaction_exercise_date',       # by ix_transaction_exercise_date_id
+    'ix_document_exercise_upload_date',   # by ix_document_exercise_upload_id
+)
+
+def get_model_indexes(names):
+    """Return the Index objects declared on the models with the given names"""
+    from app import db
+    import models  # noqa: F401 - registers the tables on db.metadata
+
+    indexes = {index.name: index for table in db.metadata.tables.values() for index in table.indexes}
+    missing = [name for name in names if name not in indexes]
+    if missing:
+        raise ValueError(f"Unknown indexes: {', '.join(missing)}")
+    return [indexes[name] for name in names]
+
+def _migration_0000(connection):
+    """Create the tables missing from the database (the whole schema on an empty database)"""
+    from app import db
+    import models  # noqa: F401 - registers the tables on db.metadata
+
+    db.metadata.create_all(connection)
+
+def _migration_0001(connection):
+    """Add the ledger version, the stored balance tables and the closing snapshots"""
+    from models import Exercise, Transaction, TransactionItem, AccountBalance, AccountDailyBalance, ClosingSnapshot
+
+    inspector = inspect(connection)
+    exercise_columns = {column['name'] for column in inspector.get_columns(Exercise.__tablename__)}
+    if 'ledger_version' not in exercise_columns:
+        connection.exec_driver_sql(
+            f"ALTER TABLE {Exercise.__tablename__} ADD COLUMN ledger_version INTEGER NOT NULL DEFAULT 0"
+        )
+
+    for model in (AccountBalance, AccountDailyBalance, ClosingSnapshot):
+        model.__table__.create(connection, checkfirst=True)
+
+    if connection.execute(select(func.count()).select_from(AccountBalance.__table__)).scalar():
+        return
+
+    # Backfill the empty stored balances from the posted transactions
+    posted_items = select(
+        Transaction.exercise_id,
+        TransactionItem.account_id,
+        Transaction.transaction_date,
+        func.coalesce(func.sum(TransactionItem.debit_amount), 0),
+        func.coalesce(func.sum(TransactionItem.credit_amount), 0)
+    ).join(
+        Transaction, TransactionItem.transaction_id == Transaction.id
+    ).where(
+        Transaction.is_posted == True
+    ).group_by(
+        Transaction.exercise_id, TransactionItem.account_id, Transaction.transaction_date
+    )
+    daily = AccountDailyBalance.__table__
+    connection.execute(insert(daily).from_select(
+        ['exercise_id', 'account_id', 'day', 'debit', 'credit'], posted_items
+    ))
+
+    connection.execute(insert(AccountBalance.__table__).from_select(
+        ['exercise_id', 'account_id', 'total_debit', 'total_credit', 'last_transaction_date', 'updated_at'],
+        select(
+            daily.c.exercise_id,
+            daily.c.account_id,
+            func.sum(daily.c.debit),
+            func.sum(daily.c.credit),
+            func.max(daily.c.day),
+            func.current_timestamp()
+        ).group_by(daily.c.exercise_id, daily.c.account_id)
+    ))
+
+def _migration_0002(connection):
+    """Create the composite and partial indexes of the hot query paths"""
+    for index in get_model_indexes(HOT_PATH_INDEXES):
+        index.create(connection, checkfirst=True)
+
+def _migration_0003(connection):
+    """Add the materialized path of the account hierarchy and backfill it"""
+    from models import Account
+    from account_hierarchy import compute_account_paths
+
+    table = Account.__table__
+    account_columns = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    if 'path' not in account_columns:
+        connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN path VARCHAR(255)")
+
+    paths = compute_account_paths(connection.execute(select(table.c.id, table.c.parent_id)).all())
+    if paths:
+        connection.execute(
+            table.update().where(table.c.id == bindparam('account_id')).values(path=bindparam('account_path')),
+            [{'account_id': account_id, 'account_path': path} for account_id, path in paths.items()]
+        )
+
+    get_model_indexes(('ix_account_exercise_path',))[0].create(connection, checkfirst=True)
+
+def _migration_0004(connection):
+    """Add the chart version used to invalidate the in-memory account indexes"""
+    from models import Exercise
+
+    exercise_columns = {column['name'] for column in inspect(connection).get_columns(Exercise.__tablename__)}
+    if 'chart_version' not in exercise_columns:
+        connection.exec_driver_sql(
+            f"ALTER TABLE {Exercise.__tablename__} ADD COLUMN chart_version INTEGER NOT NULL DEFAULT 0"
+        )
+
+def _migration_0005(connection):
+    """Add the stored debit/credit totals of the transactions and backfill them from their items"""
+    from models import Transaction, TransactionItem
+
+    table = Transaction.__table__
+    items = TransactionItem.__table__
+    # "transaction" is a reserved word, let the dialect quote it
+    table_name = connection.dialect.identifier_preparer.format_table(table)
+    transaction_columns = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    for column_name in ('total_debit', 'total_credit'):
+        if column_name not in transaction_columns:
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table_name} ADD COLUMN {column_name} NUMERIC(15, 2) NOT NULL DEFAULT 0"
+            )
+
+    def item_total(column):
+        return select(func.coalesce(func.sum(column), 0)).where(
+            items.c.transaction_id == table.c.id
+        ).scalar_subquery()
+
+    connection.execute(table.update().values(
+        total_debit=item_total(items.c.debit_amount),
+        total_credit=item_total(items.c.credit_amount)
+    ))
+
+def _migration_0006(connection):
+    """Add the indexes of the keyset pagination of the list views, replacing the indexes they extend"""
+    for index in get_model_indexes(KEYSET_INDEXES):
+        index.create(connection, checkfirst=True)
+
+    for name in REPLACED_INDEXES:
+        connection.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+
+MIGRATIONS = [
+    ('0000', 'Base schema', _migration_0000),
+    ('0001', 'Ledger version, stored balances and closing snapshots', _migration_0001),
+    ('0002', 'Indexes for the hot query paths', _migration_0002),
+    ('0003', 'Materialized path of the account hierarchy', _migration_0003),
+    ('0004', 'Chart version of the exercises', _migration_0004),
+    ('0005', 'Stored totals of the transactions', _migration_0005),
+    ('0006', 'Indexes for the keyset pagination of the list views', _migration_0006),
+]
+
+def get_applied_versions(engine):
+    """Return the set of migration versions already applied"""
+    with engine.begin() as connection:
+        schema_migration.create(connection, checkfirst=True)
+        return set(connection.execute(select(schema_migration.c.version)).scalars())
+
+def upgrade(engine, target=None):
+    """Apply the pending migrations up to target (all by default), return the versions applied"""
+    applied = get_applied_versions(engine)
+    done = []
+
+    for version, description, migration in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        if version in applied:
+            continue
+
+        logger.info(f"Applying migration {version}: {description}")
+        with engine.begin() as connection:
+            migration(connection)
+            connection.execute(schema_migration.insert().values(
+                version=version,
+                description=description,
+                applied_at=datetime.utcnow()
+            ))
+        done.append(version)
+
+    if not done:
+        logger.info("Database schema is up to date")
+    return done
+
+def status(engine):
+    """Return (version, description, applied) for every known migration"""
+    applied = get_applied_versions(engine)
+    return [(version, description, version in applied) for version, description, _ in MIGRATIONS]
+
+if __name__ == "__main__":
+    from app import app, db
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    command = sys.argv[1] if len(sys.argv) > 1 else 'upgrade'
+
+    with app.app_context():
+        if command == 'status':
+            for version, description, applied in status(db.engine):
+                print(f"{version} [{'x' if applied else ' '}] {description}")
+        elif command == 'upgrade':
+            applied = upgrade(db.engine)
+            print(f"Applied migrations: {', '.join(applied) or 'none'}")
+        else:
+            print("Usage: python db_migrations.py [upgrade|status]")
+            sys.exit(1)
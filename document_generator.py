@@ -1,33 +1,74 @@
 import os
 import json
 import logging
-from datetime import datetime
+import threading
 from decimal import Decimal
 
 import xlsxwriter
-from jinja2 import Environment, FileSystemLoader
 
-from app import app, db
-from models import Exercise, Account, Transaction, TransactionItem
-from utils import format_currency, format_date, get_account_balance, get_exercise_totals
+from app import app
+from models import Exercise, Account
+from utils import format_date
+from ledger_aggregates import signed_balance
+from daily_cube import get_period_account_totals
+from account_hierarchy import rollup_by_prefix
+from ledger_builder import build_ledger
+from journal_export import iter_journal_rows
+from ledger_money import to_cents, from_cents
+from closing_snapshot import get_closing_snapshot
+from report_cache import report_cache, report_cache_key, report_cache_filename, remove_stale_reports, report_version
+from report_renderer import report_renderer
 
 logger = logging.getLogger(__name__)
 
 def generate_report(exercise_id, report_type, format='html', start_date=None, end_date=None, account_id=None):
-    """Generate a report for the specified exercise and type"""
+    """
+    Generate a report for the specified exercise and type.
+    The file name depends on the ledger and chart versions, so an unchanged exercise reuses the file already rendered.
+    """
     exercise = Exercise.query.get_or_404(exercise_id)
     
-    # Create reports directory if it doesn't exist
+    reports_dir, file_path = report_file_path(exercise, report_type, format, start_date, end_date, account_id)
+    
+    if os.path.exists(file_path):
+        logger.debug(f"Report served from disk cache: {file_path}")
+        return file_path
+    
+    data = build_report_data(exercise_id, report_type, start_date, end_date, account_id)
+    write_report_file(data, file_path, report_type, format)
+    remove_stale_reports(reports_dir, exercise.id, report_version(exercise.ledger_version, exercise.chart_version))
+    
+    return file_path
+
+def report_file_path(exercise, report_type, format, start_date=None, end_date=None, account_id=None):
+    """Return (reports directory, file path) of a report for the current ledger and chart versions, creating the directory"""
     reports_dir = os.path.join(app.config['UPLOAD_FOLDER'], str(exercise.user_id), 'reports')
     os.makedirs(reports_dir, exist_ok=True)
     
-    # Generate filename
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    filename = f"{report_type}_{exercise.id}_{timestamp}.{format}"
-    file_path = os.path.join(reports_dir, filename)
+    key = report_cache_key(exercise.id, report_type, format, start_date, end_date, account_id,
+                           report_version(exercise.ledger_version, exercise.chart_version))
+    return reports_dir, os.path.join(reports_dir, report_cache_filename(key))
+
+def write_report_file(data, file_path, report_type, format):
+    """Render report data to a file in the given format"""
+    if format not in ('html', 'xlsx'):
+        raise ValueError(f"Unsupported format: {format}")
+    
+    # Render to a temporary file first so a concurrent request never reads a partial report
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
     
-    # Generate report based on type
-    if report_type == 'balance_sheet':
+    if format == 'html':
+        generate_html_report(data, tmp_path, report_type)
+    else:
+        generate_excel_report(data, tmp_path, report_type)
+    
+    os.replace(tmp_path, file_path)
+
+def build_report_data(exercise_id, report_type, start_date=None, end_date=None, account_id=None):
+    """Compute the data of a report of the given type"""
+    if report_type == 'journal':
+        data = generate_journal(exercise_id, start_date, end_date)
+    elif report_type == 'balance_sheet':
         data = generate_balance_sheet(exercise_id, end_date)
     elif report_type == 'income_statement':
         data = generate_income_statement(exercise_id, start_date, end_date)
@@ -42,15 +83,77 @@ def generate_report(exercise_id, report_type, format='html', start_date=None, en
     else:
         raise ValueError(f"Unsupported report type: {report_type}")
     
-    # Generate report file
-    if format == 'html':
-        generate_html_report(data, file_path, report_type)
-    elif format == 'xlsx':
-        generate_excel_report(data, file_path, report_type)
-    else:
-        raise ValueError(f"Unsupported format: {format}")
+    return data
+
+def stream_html_report(exercise_id, report_type, start_date=None, end_date=None, account_id=None):
+    """
+    Compute a report and return its HTML as a generator of fragments, for a streamed
+    response: the page is sent while it renders, without a file or a full string in memory
+    """
+    Exercise.query.get_or_404(exercise_id)
+    data = build_report_data(exercise_id, report_type, start_date, end_date, account_id)
+    return report_renderer.generate(report_type, data)
+
+def get_report_content(exercise_id, report_type, format='html', start_date=None, end_date=None, account_id=None):
+    """Return (filename, content) of a rendered report, from the in-memory cache when possible"""
+    exercise = Exercise.query.get_or_404(exercise_id)
+    key = report_cache_key(exercise.id, report_type, format, start_date, end_date, account_id,
+                           report_version(exercise.ledger_version, exercise.chart_version))
+    
+    content = report_cache.get(key)
+    if content is None:
+        file_path = generate_report(exercise_id, report_type, format, start_date, end_date, account_id)
+        with open(file_path, 'rb') as f:
+            content = f.read()
+        report_cache.invalidate_stale(exercise.id, key[-1])
+        report_cache.set(key, content)
+    
+    return report_cache_filename(key), content
+
+def generate_journal(exercise_id, start_date=None, end_date=None):
+    """Generate journal data"""
+    exercise = Exercise.query.get_or_404(exercise_id)
     
-    return file_path
+    if not start_date:
+        start_date = exercise.start_date
+    
+    if not end_date:
+        end_date = exercise.end_date
+    
+    return journal_from_rows(exercise, start_date, end_date, iter_journal_rows(exercise_id, start_date, end_date))
+
+def journal_from_rows(exercise, start_date, end_date, rows):
+    """Build the journal data from date-ordered journal rows of the period (as yielded by iter_journal_rows)"""
+    data = {
+        'exercise': exercise,
+        'start_date': start_date,
+        'end_date': end_date,
+        'entries': []
+    }
+    
+    grand_debit = grand_credit = 0
+    entry = None
+    
+    for transaction_id, transaction_date, reference, account_number, description, debit, credit in rows:
+        if entry is None or entry['id'] != transaction_id:
+            entry = {'id': transaction_id, 'date': transaction_date, 'reference': reference, 'lines': []}
+            data['entries'].append(entry)
+        
+        debit = to_cents(debit)
+        credit = to_cents(credit)
+        entry['lines'].append({
+            'account_number': account_number,
+            'description': description,
+            'debit': from_cents(debit),
+            'credit': from_cents(credit)
+        })
+        grand_debit += debit
+        grand_credit += credit
+    
+    data['total_debit'] = from_cents(grand_debit)
+    data['total_credit'] = from_cents(grand_credit)
+    
+    return data
 
 def generate_balance_sheet(exercise_id, end_date=None):
     """Generate balance sheet data"""
@@ -59,6 +162,17 @@ def generate_balance_sheet(exercise_id, end_date=None):
     if not end_date:
         end_date = exercise.end_date
     
+    # Closed exercises are read from the snapshot taken at closing time
+    if end_date == exercise.end_date:
+        snapshot = get_closing_snapshot(exercise, 'balance_sheet')
+        if snapshot is not None:
+            return snapshot
+    
+    # Period totals are read from the daily cube, whatever the dates
+    return balance_sheet_from_totals(exercise, end_date, get_period_account_totals(exercise_id, end_date=end_date))
+
+def balance_sheet_from_totals(exercise, end_date, account_totals):
+    """Build the balance sheet data from per-account totals (as returned by get_period_account_totals)"""
     data = {
         'exercise': exercise,
         'end_date': end_date,
@@ -70,45 +184,40 @@ def generate_balance_sheet(exercise_id, end_date=None):
         'total_equity': Decimal('0')
     }
     
-    # Get asset accounts
-    asset_accounts = Account.query.filter_by(account_type='asset', is_active=True).order_by(Account.account_number).all()
-    for account in asset_accounts:
-        balance = get_account_balance(account.id, exercise_id, end_date)
-        if balance != 0:
-            data['assets'].append({
-                'account': account,
-                'balance': balance
-            })
-            data['total_assets'] += balance
+    sections = {
+        'asset': ('assets', 'total_assets'),
+        'liability': ('liabilities', 'total_liabilities'),
+        'equity': ('equity', 'total_equity')
+    }
     
-    # Get liability accounts
-    liability_accounts = Account.query.filter_by(account_type='liability', is_active=True).order_by(Account.account_number).all()
-    for account in liability_accounts:
-        balance = get_account_balance(account.id, exercise_id, end_date)
-        if balance != 0:
-            data['liabilities'].append({
-                'account': account,
-                'balance': balance
-            })
-            data['total_liabilities'] += balance
+    # Totals are accumulated in integer centimes and converted back once
+    section_totals = {total_key: 0 for _, total_key in sections.values()}
     
-    # Get equity accounts
-    equity_accounts = Account.query.filter_by(account_type='equity', is_active=True).order_by(Account.account_number).all()
-    for account in equity_accounts:
-        balance = get_account_balance(account.id, exercise_id, end_date)
-        if balance != 0:
-            data['equity'].append({
+    # Retained earnings (net income/loss for the period) come from the same totals
+    net_income = 0
+    
+    for totals in account_totals:
+        account = totals['account']
+        balance = signed_balance(account.account_type, to_cents(totals['total_debit']), to_cents(totals['total_credit']))
+        
+        if account.account_type == 'revenue':
+            net_income += balance
+        elif account.account_type == 'expense':
+            net_income -= balance
+        elif account.account_type in sections and balance != 0:
+            section, total_key = sections[account.account_type]
+            data[section].append({
                 'account': account,
-                'balance': balance
+                'balance': from_cents(balance)
             })
-            data['total_equity'] += balance
+            section_totals[total_key] += balance
     
-    # Calculate retained earnings (net income/loss for the period)
-    totals = get_exercise_totals(exercise_id)
-    net_income = totals['net_income']
+    section_totals['total_equity'] += net_income
+    for total_key, total in section_totals.items():
+        data[total_key] = from_cents(total)
     
+    net_income = from_cents(net_income)
     data['net_income'] = net_income
-    data['total_equity'] += net_income
     
     # Add net income to equity section if not zero
     if net_income != 0:
@@ -118,7 +227,8 @@ def generate_balance_sheet(exercise_id, end_date=None):
         })
     
     # Check if balance sheet balances
-    data['is_balanced'] = (data['total_assets'] == (data['total_liabilities'] + data['total_equity']))
+    data['is_balanced'] = (section_totals['total_assets'] ==
+                           section_totals['total_liabilities'] + section_totals['total_equity'])
     
     return data
 
@@ -132,6 +242,17 @@ def generate_income_statement(exercise_id, start_date=None, end_date=None):
     if not end_date:
         end_date = exercise.end_date
     
+    # Closed exercises are read from the snapshot taken at closing time
+    if start_date == exercise.start_date and end_date == exercise.end_date:
+        snapshot = get_closing_snapshot(exercise, 'income_statement')
+        if snapshot is not None:
+            return snapshot
+    
+    account_totals = get_period_account_totals(exercise_id, start_date=start_date, end_date=end_date)
+    return income_statement_from_totals(exercise, start_date, end_date, account_totals)
+
+def income_statement_from_totals(exercise, start_date, end_date, account_totals):
+    """Build the income statement data from per-account totals (as returned by get_period_account_totals)"""
     data = {
         'exercise': exercise,
         'start_date': start_date,
@@ -143,78 +264,31 @@ def generate_income_statement(exercise_id, start_date=None, end_date=None):
         'net_income': Decimal('0')
     }
     
-    # Get revenue accounts
-    revenue_accounts = Account.query.filter_by(account_type='revenue', is_active=True).order_by(Account.account_number).all()
+    section_totals = {'total_revenues': 0, 'total_expenses': 0}
     
-    # Get transaction items for revenues
-    for account in revenue_accounts:
-        balance = Decimal('0')
+    for totals in account_totals:
+        account = totals['account']
         
-        # Get all transactions for this account in the date range
-        query = db.session.query(
-            TransactionItem.account_id,
-            db.func.sum(TransactionItem.credit_amount - TransactionItem.debit_amount).label('balance')
-        ).join(
-            Transaction, TransactionItem.transaction_id == Transaction.id
-        ).filter(
-            TransactionItem.account_id == account.id,
-            Transaction.exercise_id == exercise_id,
-            Transaction.transaction_date >= start_date,
-            Transaction.transaction_date <= end_date,
-            Transaction.is_posted == True
-        ).group_by(
-            TransactionItem.account_id
-        )
-        
-        result = query.first()
-        
-        if result:
-            balance = result.balance
-        
-        if balance != 0:
-            data['revenues'].append({
-                'account': account,
-                'balance': balance
-            })
-            data['total_revenues'] += balance
-    
-    # Get expense accounts
-    expense_accounts = Account.query.filter_by(account_type='expense', is_active=True).order_by(Account.account_number).all()
-    
-    # Get transaction items for expenses
-    for account in expense_accounts:
-        balance = Decimal('0')
-        
-        # Get all transactions for this account in the date range
-        query = db.session.query(
-            TransactionItem.account_id,
-            db.func.sum(TransactionItem.debit_amount - TransactionItem.credit_amount).label('balance')
-        ).join(
-            Transaction, TransactionItem.transaction_id == Transaction.id
-        ).filter(
-            TransactionItem.account_id == account.id,
-            Transaction.exercise_id == exercise_id,
-            Transaction.transaction_date >= start_date,
-            Transaction.transaction_date <= end_date,
-            Transaction.is_posted == True
-        ).group_by(
-            TransactionItem.account_id
-        )
-        
-        result = query.first()
+        if account.account_type == 'revenue':
+            section, total_key = 'revenues', 'total_revenues'
+        elif account.account_type == 'expense':
+            section, total_key = 'expenses', 'total_expenses'
+        else:
+            continue
         
-        if result:
-            balance = result.balance
+        balance = signed_balance(account.account_type, to_cents(totals['total_debit']), to_cents(totals['total_credit']))
         
         if balance != 0:
-            data['expenses'].append({
+            data[section].append({
                 'account': account,
-                'balance': balance
+                'balance': from_cents(balance)
             })
-            data['total_expenses'] += balance
+            section_totals[total_key] += balance
     
     # Calculate net income
-    data['net_income'] = data['total_revenues'] - data['total_expenses']
+    data['total_revenues'] = from_cents(section_totals['total_revenues'])
+    data['total_expenses'] = from_cents(section_totals['total_expenses'])
+    data['net_income'] = from_cents(section_totals['total_revenues'] - section_totals['total_expenses'])
     
     return data
 
@@ -225,6 +299,16 @@ def generate_trial_balance(exercise_id, end_date=None):
     if not end_date:
         end_date = exercise.end_date
     
+    # Closed exercises are read from the snapshot taken at closing time
+    if end_date == exercise.end_date:
+        snapshot = get_closing_snapshot(exercise, 'trial_balance')
+        if snapshot is not None:
+            return snapshot
+    
+    return trial_balance_from_totals(exercise, end_date, get_period_account_totals(exercise_id, end_date=end_date))
+
+def trial_balance_from_totals(exercise, end_date, account_totals):
+    """Build the trial balance data from per-account totals (as returned by get_period_account_totals)"""
     data = {
         'exercise': exercise,
         'end_date': end_date,
@@ -233,48 +317,38 @@ def generate_trial_balance(exercise_id, end_date=None):
         'total_credit': Decimal('0')
     }
     
-    # Get all active accounts
-    accounts = Account.query.filter_by(is_active=True).order_by(Account.account_number).all()
-    
-    for account in accounts:
-        # Get debit and credit totals for this account
-        query = db.session.query(
-            db.func.sum(TransactionItem.debit_amount).label('total_debit'),
-            db.func.sum(TransactionItem.credit_amount).label('total_credit')
-        ).join(
-            Transaction, TransactionItem.transaction_id == Transaction.id
-        ).filter(
-            TransactionItem.account_id == account.id,
-            Transaction.exercise_id == exercise_id,
-            Transaction.transaction_date <= end_date,
-            Transaction.is_posted == True
-        )
-        
-        result = query.first()
-        
-        total_debit = result.total_debit or Decimal('0')
-        total_credit = result.total_credit or Decimal('0')
+    grand_debit = grand_credit = 0
+    
+    for totals in account_totals:
+        total_debit = to_cents(totals['total_debit'])
+        total_credit = to_cents(totals['total_credit'])
         
         # Determine final balance and debit/credit values for trial balance
         if total_debit > total_credit:
             debit_balance = total_debit - total_credit
-            credit_balance = Decimal('0')
+            credit_balance = 0
         else:
-            debit_balance = Decimal('0')
+            debit_balance = 0
             credit_balance = total_credit - total_debit
         
         if debit_balance != 0 or credit_balance != 0:
             data['accounts'].append({
-                'account': account,
-                'debit': debit_balance,
-                'credit': credit_balance
+                'account': totals['account'],
+                'debit': from_cents(debit_balance),
+                'credit': from_cents(credit_balance)
             })
             
-            data['total_debit'] += debit_balance
-            data['total_credit'] += credit_balance
+            grand_debit += debit_balance
+            grand_credit += credit_balance
+    
+    data['total_debit'] = from_cents(grand_debit)
+    data['total_credit'] = from_cents(grand_credit)
+    
+    # Subtotals per OHADA class
+    data['classes'] = rollup_by_prefix(data['accounts'], depths=(1,), debit_key='debit', credit_key='credit')[1]
     
     # Check if trial balance balances
-    data['is_balanced'] = (data['total_debit'] == data['total_credit'])
+    data['is_balanced'] = (grand_debit == grand_credit)
     
     return data
 
@@ -288,6 +362,16 @@ def generate_general_ledger(exercise_id, start_date=None, end_date=None):
     if not end_date:
         end_date = exercise.end_date
     
+    # Closed exercises are read from the snapshot taken at closing time
+    if start_date == exercise.start_date and end_date == exercise.end_date:
+        snapshot = get_closing_snapshot(exercise, 'general_ledger')
+        if snapshot is not None:
+            return snapshot
+    
+    return general_ledger_from_ledger(exercise, start_date, end_date, build_ledger(exercise_id, start_date, end_date))
+
+def general_ledger_from_ledger(exercise, start_date, end_date, ledger):
+    """Build the general ledger data from the ledger lines (as returned by build_ledger)"""
     data = {
         'exercise': exercise,
         'start_date': start_date,
@@ -295,63 +379,8 @@ def generate_general_ledger(exercise_id, start_date=None, end_date=None):
         'accounts': []
     }
     
-    # Get all active accounts
-    accounts = Account.query.filter_by(is_active=True).order_by(Account.account_number).all()
-    
-    for account in accounts:
-        account_data = {
-            'account': account,
-            'transactions': [],
-            'opening_balance': Decimal('0'),
-            'closing_balance': Decimal('0'),
-            'total_debit': Decimal('0'),
-            'total_credit': Decimal('0')
-        }
-        
-        # Calculate opening balance (balance at start_date - 1 day)
-        opening_balance = get_account_balance(account.id, exercise_id, start_date)
-        account_data['opening_balance'] = opening_balance
-        
-        # Get all transactions for this account in the date range
-        transaction_items = TransactionItem.query.join(
-            Transaction, TransactionItem.transaction_id == Transaction.id
-        ).filter(
-            TransactionItem.account_id == account.id,
-            Transaction.exercise_id == exercise_id,
-            Transaction.transaction_date >= start_date,
-            Transaction.transaction_date <= end_date,
-            Transaction.is_posted == True
-        ).order_by(
-            Transaction.transaction_date
-        ).all()
-        
-        running_balance = opening_balance
-        
-        for item in transaction_items:
-            transaction = Transaction.query.get(item.transaction_id)
-            
-            if account.account_type in ['asset', 'expense']:
-                # For assets and expenses, debits increase, credits decrease
-                running_balance += item.debit_amount - item.credit_amount
-            else:
-                # For liabilities, equity, and revenues, credits increase, debits decrease
-                running_balance += item.credit_amount - item.debit_amount
-            
-            account_data['transactions'].append({
-                'date': transaction.transaction_date,
-                'reference': transaction.reference,
-                'description': item.description or transaction.description,
-                'debit': item.debit_amount,
-                'credit': item.credit_amount,
-                'balance': running_balance
-            })
-            
-            account_data['total_debit'] += item.debit_amount
-            account_data['total_credit'] += item.credit_amount
-        
-        account_data['closing_balance'] = running_balance
-        
-        # Only add accounts with transactions or non-zero balances
+    # Only add accounts with transactions or non-zero balances
+    for account_data in ledger:
         if account_data['transactions'] or account_data['opening_balance'] != 0:
             data['accounts'].append(account_data)
     
@@ -380,76 +409,17 @@ def generate_account_statement(exercise_id, account_id, start_date=None, end_dat
         'total_credit': Decimal('0')
     }
     
-    # Calculate opening balance (balance at start_date - 1 day)
-    opening_balance = get_account_balance(account_id, exercise_id, start_date)
-    data['opening_balance'] = opening_balance
-    
-    # Get all transactions for this account in the date range
-    transaction_items = TransactionItem.query.join(
-        Transaction, TransactionItem.transaction_id == Transaction.id
-    ).filter(
-        TransactionItem.account_id == account_id,
-        Transaction.exercise_id == exercise_id,
-        Transaction.transaction_date >= start_date,
-        Transaction.transaction_date <= end_date,
-        Transaction.is_posted == True
-    ).order_by(
-        Transaction.transaction_date
-    ).all()
-    
-    running_balance = opening_balance
-    
-    for item in transaction_items:
-        transaction = Transaction.query.get(item.transaction_id)
-        
-        if account.account_type in ['asset', 'expense']:
-            # For assets and expenses, debits increase, credits decrease
-            running_balance += item.debit_amount - item.credit_amount
-        else:
-            # For liabilities, equity, and revenues, credits increase, debits decrease
-            running_balance += item.credit_amount - item.debit_amount
-        
-        data['transactions'].append({
-            'date': transaction.transaction_date,
-            'reference': transaction.reference,
-            'description': item.description or transaction.description,
-            'debit': item.debit_amount,
-            'credit': item.credit_amount,
-            'balance': running_balance
-        })
-        
-        data['total_debit'] += item.debit_amount
-        data['total_credit'] += item.credit_amount
-    
-    data['closing_balance'] = running_balance
+    ledger = build_ledger(exercise_id, start_date, end_date, account_id=account_id)
+    if ledger:
+        account_data = ledger[0]
+        for key in ('transactions', 'opening_balance', 'closing_balance', 'total_debit', 'total_credit'):
+            data[key] = account_data[key]
     
     return data
 
 def generate_html_report(data, file_path, report_type):
-    """Generate an HTML report from the data"""
-    # Set up Jinja2 environment
-    env = Environment(loader=FileSystemLoader('templates'))
-    
-    # Define template name based on report type
-    template_name = f"reports/{report_type}.html"
-    
-    # Get template
-    try:
-        template = env.get_template(template_name)
-    except:
-        # If template doesn't exist, use a generic one
-        template = env.get_template("reports/generic.html")
-    
-    # Add helper functions to template context
-    data['format_currency'] = format_currency
-    data['format_date'] = format_date
-    
-    # Render template
-    html = template.render(**data)
-    
-    # Write to file
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(html)
+    """Generate an HTML report from the data, streamed into the file by the precompiled template"""
+    report_renderer.render_to_file(report_type, data, file_path)
 
 def generate_excel_report(data, file_path, report_type):
     """Generate an Excel report from the data"""
@@ -498,7 +468,9 @@ def generate_excel_report(data, file_path, report_type):
     })
     
     # Generate report based on type
-    if report_type == 'balance_sheet':
+    if report_type == 'journal':
+        generate_excel_journal(worksheet, data, header_format, subheader_format, date_format, currency_format, total_format, cell_format)
+    elif report_type == 'balance_sheet':
         generate_excel_balance_sheet(worksheet, data, header_format, subheader_format, currency_format, total_format, cell_format)
     elif report_type == 'income_statement':
         generate_excel_income_statement(worksheet, data, header_format, subheader_format, currency_format, total_format, cell_format)
@@ -511,6 +483,42 @@ def generate_excel_report(data, file_path, report_type):
     
     workbook.close()
 
+def generate_excel_journal(worksheet, data, header_format, subheader_format, date_format, currency_format, total_format, cell_format):
+    """Generate journal in Excel format"""
+    # Set column widths
+    worksheet.set_column('A:A', 12)
+    worksheet.set_column('B:B', 15)
+    worksheet.set_column('C:C', 12)
+    worksheet.set_column('D:D', 40)
+    worksheet.set_column('E:E', 15)
+    worksheet.set_column('F:F', 15)
+    
+    # Write title
+    worksheet.merge_range('A1:F1', f"JOURNAL DU {format_date(data['start_date'])} AU {format_date(data['end_date'])}", header_format)
+    worksheet.merge_range('A2:F2', f"Exercice: {data['exercise'].name}", subheader_format)
+    
+    # Write headers
+    row = 4
+    for column, title in enumerate(("Date", "Référence", "N° Compte", "Libellé", "Débit", "Crédit")):
+        worksheet.write(row, column, title, header_format)
+    row += 1
+    
+    # Write entries
+    for entry in data['entries']:
+        for line in entry['lines']:
+            worksheet.write(row, 0, entry['date'], date_format)
+            worksheet.write(row, 1, entry['reference'], cell_format)
+            worksheet.write(row, 2, line['account_number'], cell_format)
+            worksheet.write(row, 3, line['description'], cell_format)
+            worksheet.write(row, 4, float(line['debit']), currency_format)
+            worksheet.write(row, 5, float(line['credit']), currency_format)
+            row += 1
+    
+    # Write totals
+    worksheet.merge_range(f'A{row + 1}:D{row + 1}', "TOTAUX", total_format)
+    worksheet.write(row, 4, float(data['total_debit']), total_format)
+    worksheet.write(row, 5, float(data['total_credit']), total_format)
+
 def generate_excel_balance_sheet(worksheet, data, header_format, subheader_format, currency_format, total_format, cell_format):
     """Generate balance sheet in Excel format"""
     # Set column widths
@@ -564,9 +572,12 @@ def generate_excel_balance_sheet(worksheet, data, header_format, subheader_forma
     row += 1
     
     for equity in data['equity']:
-        account_number = equity['account'].account_number if hasattr(equity['account'], 'account_number') else ""
+        # The net income line carries a plain dict instead of an Account
+        account = equity['account']
+        account_number = account['account_number'] if isinstance(account, dict) else account.account_number
+        account_name = account['name'] if isinstance(account, dict) else account.name
         worksheet.write(row, 0, account_number, cell_format)
-        worksheet.write(row, 1, equity['account'].name, cell_format)
+        worksheet.write(row, 1, account_name, cell_format)
         worksheet.write(row, 2, float(equity['balance']), currency_format)
         row += 1
     
@@ -670,6 +681,16 @@ def generate_excel_trial_balance(worksheet, data, header_format, subheader_forma
         worksheet.merge_range(f'A{row}:D{row}', "La balance est équilibrée.", cell_format)
     else:
         worksheet.merge_range(f'A{row}:D{row}', "ATTENTION: La balance n'est pas équilibrée!", cell_format)
+    
+    # Write class subtotals (absent from snapshots taken before they existed)
+    if data.get('classes'):
+        row += 2
+        worksheet.merge_range(f'A{row}:D{row}', "TOTAUX PAR CLASSE", subheader_format)
+        for class_totals in data['classes']:
+            worksheet.write(row, 0, f"Classe {class_totals['prefix']}", cell_format)
+            worksheet.write(row, 2, float(class_totals['total_debit']), currency_format)
+            worksheet.write(row, 3, float(class_totals['total_credit']), currency_format)
+            row += 1
 
 def generate_excel_general_ledger(worksheet, data, header_format, subheader_format, date_format, currency_format, total_format, cell_format):
     """Generate general ledger in Excel format"""
@@ -2,6 +2,9 @@
 from datetime import datetime
 from collections import defaultdict
 
+from keyword_classifier import get_classifier
+from ledger_money import to_cents, percent_cents, cents_to_float
+
 class ComptableIA:
     def __init__(self):
         self.plan_comptable = {
@@ -15,23 +18,7 @@ class ComptableIA:
         }
 
     def analyser_operation(self, texte):
-        texte = texte.lower()
-        if "achat" in texte and "marchandises" in texte:
-            return "achat_marchandises"
-        elif "vente" in texte:
-            return "vente_marchandises"
-        elif "transport" in texte:
-            return "transport"
-        elif "remise" in texte or "ristourne" in texte:
-            return "remise"
-        elif "amortissement" in texte:
-            return "amortissement"
-        elif "immobilisation" in texte or "matériel" in texte:
-            return "immobilisation"
-        elif "salaire" in texte:
-            return "salaires"
-        else:
-            return None
+        return get_classifier().classify_operation(texte)
 
     def detecter_mode_paiement(self, texte):
         texte = texte.lower()
@@ -45,7 +32,7 @@ class ComptableIA:
             return "crédit"
 
     def calculer_tva(self, montant_ht, taux_tva):
-        return round(montant_ht * (taux_tva / 100), 2)
+        return cents_to_float(percent_cents(to_cents(montant_ht), taux_tva))
 
     def generer_libelle(self, type_op, montant):
         libelles = {
@@ -66,8 +53,19 @@ class ComptableIA:
             return {"erreur": "Type d'opération non reconnu"}
 
         comptes = self.plan_comptable.get(type_op, {})
-        tva = self.calculer_tva(montant_ht, taux_tva)
-        total = montant_ht + tva + frais_accessoires - remise
+        
+        # Amounts computed in integer centimes, lines carry float amounts as before
+        ht_cents = to_cents(montant_ht)
+        tva_cents = percent_cents(ht_cents, taux_tva)
+        frais_cents = to_cents(frais_accessoires)
+        remise_cents = to_cents(remise)
+        total_cents = ht_cents + tva_cents + frais_cents - remise_cents
+        
+        tva = cents_to_float(tva_cents)
+        total = cents_to_float(total_cents)
+        montant = cents_to_float(ht_cents)
+        frais = cents_to_float(frais_cents)
+        remise_montant = cents_to_float(remise_cents)
 
         if date_op is None:
             date_op = datetime.today().strftime('%Y-%m-%d')
@@ -86,47 +84,48 @@ class ComptableIA:
         }
 
         if type_op == "achat_marchandises":
-            ecriture["débit"].append({"compte": 601, "montant": montant_ht})
+            ecriture["débit"].append({"compte": 601, "montant": montant})
             if taux_tva > 0:
                 ecriture["débit"].append({"compte": 4456, "montant": tva})
-            if frais_accessoires > 0:
-                ecriture["débit"].append({"compte": 624, "montant": frais_accessoires})
+            if frais_cents > 0:
+                ecriture["débit"].append({"compte": 624, "montant": frais})
             ecriture["crédit"].append({"compte": compte_paiement, "montant": total})
 
         elif type_op == "vente_marchandises":
             ecriture["débit"].append({"compte": 411, "montant": total})
-            ecriture["crédit"].append({"compte": 701, "montant": montant_ht})
+            ecriture["crédit"].append({"compte": 701, "montant": montant})
             if taux_tva > 0:
                 ecriture["crédit"].append({"compte": 4457, "montant": tva})
 
         elif type_op == "transport":
-            ecriture["débit"].append({"compte": 624, "montant": montant_ht})
-            ecriture["crédit"].append({"compte": compte_paiement, "montant": montant_ht})
+            ecriture["débit"].append({"compte": 624, "montant": montant})
+            ecriture["crédit"].append({"compte": compte_paiement, "montant": montant})
 
         elif type_op == "remise":
-            ecriture["débit"].append({"compte": 765, "montant": remise})
-            ecriture["crédit"].append({"compte": compte_paiement, "montant": remise})
+            ecriture["débit"].append({"compte": 765, "montant": remise_montant})
+            ecriture["crédit"].append({"compte": compte_paiement, "montant": remise_montant})
 
         elif type_op == "amortissement":
-            ecriture["débit"].append({"compte": 681, "montant": montant_ht})
-            ecriture["crédit"].append({"compte": 281, "montant": montant_ht})
+            ecriture["débit"].append({"compte": 681, "montant": montant})
+            ecriture["crédit"].append({"compte": 281, "montant": montant})
 
         elif type_op == "immobilisation":
-            ecriture["débit"].append({"compte": 215, "montant": montant_ht})
-            ecriture["crédit"].append({"compte": compte_paiement, "montant": montant_ht})
+            ecriture["débit"].append({"compte": 215, "montant": montant})
+            ecriture["crédit"].append({"compte": compte_paiement, "montant": montant})
 
         elif type_op == "salaires":
-            ecriture["débit"].append({"compte": 641, "montant": montant_ht})
-            ecriture["crédit"].append({"compte": 421, "montant": montant_ht})
+            ecriture["débit"].append({"compte": 641, "montant": montant})
+            ecriture["crédit"].append({"compte": 421, "montant": montant})
 
         return ecriture
 
     def generer_grand_livre(self, ecritures):
+        # Totals accumulated in integer centimes, converted back once all lines are read
         comptes = defaultdict(lambda: {"debit": 0, "credit": 0, "mouvements": []})
         for ecriture in ecritures:
             for ligne in ecriture["débit"]:
                 compte = ligne["compte"]
-                comptes[compte]["debit"] += ligne["montant"]
+                comptes[compte]["debit"] += to_cents(ligne["montant"])
                 comptes[compte]["mouvements"].append({
                     "type": "débit",
                     "montant": ligne["montant"],
@@ -135,20 +134,23 @@ class ComptableIA:
                 })
             for ligne in ecriture["crédit"]:
                 compte = ligne["compte"] 
-                comptes[compte]["credit"] += ligne["montant"]
+                comptes[compte]["credit"] += to_cents(ligne["montant"])
                 comptes[compte]["mouvements"].append({
                     "type": "crédit",
                     "montant": ligne["montant"],
                     "libelle": ecriture["libelle"],
                     "date": ecriture["date"]
                 })
+        for valeurs in comptes.values():
+            valeurs["debit"] = cents_to_float(valeurs["debit"])
+            valeurs["credit"] = cents_to_float(valeurs["credit"])
         return comptes
 
     def generer_bilan(self, grand_livre):
         actif = {}
         passif = {}
         for compte, valeurs in grand_livre.items():
-            solde = valeurs["debit"] - valeurs["credit"]
+            solde = to_cents(valeurs["debit"]) - to_cents(valeurs["credit"])
             if compte < 400:  
                 actif[compte] = solde
             else:
@@ -156,10 +158,10 @@ class ComptableIA:
         total_actif = sum(actif.values())
         total_passif = sum(passif.values())
         return {
-            "actif": actif,
-            "passif": passif,
-            "total_actif": total_actif,
-            "total_passif": total_passif
+            "actif": {compte: cents_to_float(solde) for compte, solde in actif.items()},
+            "passif": {compte: cents_to_float(solde) for compte, solde in passif.items()},
+            "total_actif": cents_to_float(total_actif),
+            "total_passif": cents_to_float(total_passif)
         }
 
     def generer_journal_complet(self, operations):
@@ -169,6 +171,7 @@ class ComptableIA:
             "total_débit": 0,
             "total_crédit": 0
         }
+        total_debit = total_credit = 0
 
         for op in operations:
             ecriture = self.generer_ecriture(
@@ -181,8 +184,11 @@ class ComptableIA:
                 libelle_personnalise=op.get("libelle_personnalise", None)
             )
             journal["écritures"].append(ecriture)
-            journal["total_débit"] += sum([e["montant"] for e in ecriture["débit"]])
-            journal["total_crédit"] += sum([e["montant"] for e in ecriture["crédit"]])
+            total_debit += sum(to_cents(e["montant"]) for e in ecriture["débit"])
+            total_credit += sum(to_cents(e["montant"]) for e in ecriture["crédit"])
+
+        journal["total_débit"] = cents_to_float(total_debit)
+        journal["total_crédit"] = cents_to_float(total_credit)
 
         grand_livre = self.generer_grand_livre(journal["écritures"])
         bilan = self.generer_bilan(grand_livre)
@@ -1,11 +1,12 @@
 import json
 import logging
 import requests
-from decimal import Decimal
+from datetime import datetime
 
 from app import db
 from models import Exercise, Transaction, TransactionItem, Account, ExerciseAnalysis
-from utils import get_account_balance, get_exercise_totals, DecimalEncoder
+from utils import get_exercise_totals, DecimalEncoder
+from ledger_aggregates import get_exercise_aggregates, prefix_balance
 from config import Config
 
 logger = logging.getLogger(__name__)
@@ -37,14 +38,15 @@ def analyze_exercise(exercise_id):
 
 def calculate_financial_indicators(exercise_id):
     """Calculate key financial indicators for an exercise"""
-    # Get exercise data
-    totals = get_exercise_totals(exercise_id)
+    # Get exercise data from one aggregate query
+    aggregates = get_exercise_aggregates(exercise_id, datetime.now().date())
+    totals = get_exercise_totals(exercise_id, aggregates)
     
     # Get asset and liability balances
-    current_assets = get_account_group_balance(exercise_id, ['10', '11', '12', '13', '14'])  # Adjust with actual OHADA current asset account numbers
+    current_assets = get_account_group_balance(exercise_id, ['10', '11', '12', '13', '14'], aggregates)  # Adjust with actual OHADA current asset account numbers
     total_assets = totals['asset']
     
-    current_liabilities = get_account_group_balance(exercise_id, ['40', '41', '42', '43'])  # Adjust with actual OHADA current liability account numbers
+    current_liabilities = get_account_group_balance(exercise_id, ['40', '41', '42', '43'], aggregates)  # Adjust with actual OHADA current liability account numbers
     total_liabilities = totals['liability']
     
     total_equity = totals['equity']
@@ -89,21 +91,12 @@ def calculate_financial_indicators(exercise_id):
         'total_expense': float(total_expense)
     }
 
-def get_account_group_balance(exercise_id, account_prefixes):
+def get_account_group_balance(exercise_id, account_prefixes, aggregates=None):
     """Get the total balance for account numbers starting with specific prefixes"""
-    total_balance = Decimal('0')
+    if aggregates is None:
+        aggregates = get_exercise_aggregates(exercise_id, datetime.now().date())
     
-    for prefix in account_prefixes:
-        accounts = Account.query.filter(
-            Account.account_number.like(f"{prefix}%"),
-            Account.is_active == True
-        ).all()
-        
-        for account in accounts:
-            balance = get_account_balance(account.id, exercise_id)
-            total_balance += balance
-    
-    return total_balance
+    return prefix_balance(aggregates, account_prefixes)
 
 def perform_ai_analysis(exercise_id, financial_data):
     """Perform AI analysis using Ollama with Mistral 7B model"""
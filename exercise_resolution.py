@@ -1,7 +1,7 @@
 import logging
 from models import Exercise, ExerciseSolution, Document
 from app import db
-from document_generator import generate_report
+from report_bundle import generate_report_bundle
 from exercise_solver import solver
 from datetime import datetime
 import os
@@ -111,29 +111,21 @@ def resolve_exercise_completely(exercise_id, problem_text):
         db.session.flush()  # Pour obtenir l'ID de la solution
         results['solution'] = solution.id
 
-        # 2. Générer le journal comptable
+        # 2. Générer le journal, le grand livre et le bilan à partir des mêmes agrégats
+        documents = {'journal': ('journal', 'du journal'),
+                     'general_ledger': ('grand_livre', 'du grand livre'),
+                     'balance_sheet': ('bilan', 'du bilan')}
         try:
-            journal_path = generate_report(exercise_id, 'journal', 'html')
-            results['journal'] = os.path.basename(journal_path)
+            paths, errors = generate_report_bundle(exercise_id, tuple(documents))
         except Exception as e:
-            logger.error(f"Erreur lors de la génération du journal: {str(e)}")
-            results['errors'].append(f"Erreur lors de la génération du journal: {str(e)}")
-
-        # 3. Générer le grand livre
-        try:
-            general_ledger_path = generate_report(exercise_id, 'general_ledger', 'html')
-            results['grand_livre'] = os.path.basename(general_ledger_path)
-        except Exception as e:
-            logger.error(f"Erreur lors de la génération du grand livre: {str(e)}")
-            results['errors'].append(f"Erreur lors de la génération du grand livre: {str(e)}")
-
-        # 4. Générer le bilan final
-        try:
-            balance_sheet_path = generate_report(exercise_id, 'balance_sheet', 'html')
-            results['bilan'] = os.path.basename(balance_sheet_path)
-        except Exception as e:
-            logger.error(f"Erreur lors de la génération du bilan: {str(e)}")
-            results['errors'].append(f"Erreur lors de la génération du bilan: {str(e)}")
+            logger.error(f"Erreur lors de la génération des documents: {str(e)}")
+            paths, errors = {}, {report_type: str(e) for report_type in documents}
+
+        for report_type, (result_key, label) in documents.items():
+            if report_type in paths:
+                results[result_key] = os.path.basename(paths[report_type]['html'])
+            else:
+                results['errors'].append(f"Erreur lors de la génération {label}: {errors.get(report_type)}")
 
         # Commit les changements dans la base de données
         db.session.commit()
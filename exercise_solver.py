@@ -18,6 +18,8 @@ import nltk
 from nltk.tokenize import sent_tokenize
 from nltk.corpus import stopwords
 
+from keyword_classifier import get_classifier
+
 # Initialisation du logging
 logger = logging.getLogger(__name__)
 
@@ -223,9 +225,10 @@ class ExerciseSolver:
         filtered_examples = []
         if probable_category:
             # Chercher des mots-clés de la catégorie dans les exemples
+            category_keywords = self._get_category_keywords(probable_category)
             for example in self.examples:
                 example_text = example['problem_text'].lower()
-                if any(kw in example_text for kw in self._get_category_keywords(probable_category)):
+                if any(kw in example_text for kw in category_keywords):
                     filtered_examples.append(example)
             
             logger.info(f"{len(filtered_examples)} exemples trouvés dans la catégorie {probable_category}")
@@ -298,40 +301,11 @@ class ExerciseSolver:
     
     def _detect_exercise_category(self, text):
         """Détecte la catégorie probable de l'exercice."""
-        text_lower = text.lower()
-        
-        categories = {
-            'amortissement': ['amortissement', 'amortir', 'immobilisation', 'dépréciation'],
-            'bilan': ['bilan', 'actif', 'passif', 'patrimoine'],
-            'tva': ['tva', 'taxe sur la valeur ajoutée', 'déductible', 'collectée'],
-            'journal': ['journal', 'écriture', 'comptabiliser', 'enregistrer'],
-            'resultat': ['résultat', 'compte de résultat', 'produit', 'charge', 'bénéfice', 'perte']
-        }
-        
-        category_scores = {}
-        for category, keywords in categories.items():
-            score = sum(text_lower.count(kw) for kw in keywords)
-            category_scores[category] = score
-        
-        # Trouver la catégorie avec le score le plus élevé
-        if category_scores:
-            best_category = max(category_scores.items(), key=lambda x: x[1])
-            if best_category[1] > 0:  # Si au moins un mot-clé a été trouvé
-                return best_category[0]
-        
-        return None
+        return get_classifier().detect_category(text)
     
     def _get_category_keywords(self, category):
-        """Retourne les mots-clés associés à une catégorie."""
-        keywords = {
-            'amortissement': ['amortissement', 'amortir', 'immobilisation', 'dépréciation'],
-            'bilan': ['bilan', 'actif', 'passif', 'patrimoine'],
-            'tva': ['tva', 'taxe', 'déductible', 'collectée'],
-            'journal': ['journal', 'écriture', 'comptabiliser', 'enregistrer'],
-            'resultat': ['résultat', 'produit', 'charge', 'bénéfice', 'perte']
-        }
-        
-        return keywords.get(category, [])
+        """Retourne les mots-clés associés à une catégorie (règles exercise_categories du classifieur)."""
+        return get_classifier().category_keywords(category)
     
     def _calculate_accounting_similarity(self, data1, data2):
         """Calcule un score de similarité basé sur les éléments comptables extraits."""
@@ -67,6 +67,7 @@ class ExerciseForm(FlaskForm):
     start_date = DateField('Date de début', validators=[DataRequired()])
     end_date = DateField('Date de fin', validators=[DataRequired()])
     description = TextAreaField('Description', validators=[Optional()])
+    source_exercise_id = SelectField('Plan comptable', coerce=int, default=0, validators=[Optional()])
 
     def validate_end_date(self, field):
         if field.data < self.start_date.data:
@@ -169,6 +170,15 @@ class DocumentUploadForm(FlaskForm):
     description = TextAreaField('Description', validators=[Optional()])
     auto_process = BooleanField('Traiter automatiquement', default=True)
 
+class JournalImportForm(FlaskForm):
+    """Form for importing a journal file exported from another software"""
+    journal_file = FileField('Fichier du journal', validators=[
+        FileRequired(),
+        FileAllowed(['csv', 'xlsx'], 'Seuls les fichiers CSV et XLSX sont autorisés')
+    ])
+    is_posted = BooleanField('Comptabiliser les écritures importées', default=False)
+    dry_run = BooleanField('Vérifier uniquement, sans importer', default=False)
+
 class ForgotPasswordForm(FlaskForm):
     """Form for requesting password reset"""
     email = StringField('Adresse email', validators=[DataRequired(), Email(), Length(max=120)])
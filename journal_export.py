@@ -0,0 +1,167 @@
+import io
+import os
+import csv
+import logging
+import tempfile
+
+import xlsxwriter
+
+from app import db
+from models import Account, Transaction, TransactionItem
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_HEADERS = ['Date', 'Référence', 'N° Compte', 'Libellé', 'Débit', 'Crédit']
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 2000
+
+# Size of the chunks sent to the client when streaming a file
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def iter_journal_rows(exercise_id, start_date=None, end_date=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield the journal lines of an exercise, optionally between two dates, from a single
+    joined query read through a server-side cursor, in date order:
+    (transaction_id, date, reference, account_number, description, debit, credit)
+    """
+    query = db.session.query(
+        Transaction.id,
+        Transaction.transaction_date,
+        Transaction.reference,
+        Account.account_number,
+        db.func.coalesce(TransactionItem.description, Transaction.description),
+        TransactionItem.debit_amount,
+        TransactionItem.credit_amount
+    ).join(
+        TransactionItem, TransactionItem.transaction_id == Transaction.id
+    ).join(
+        Account, TransactionItem.account_id == Account.id
+    ).filter(
+        Transaction.exercise_id == exercise_id
+    )
+
+    if start_date:
+        query = query.filter(Transaction.transaction_date >= start_date)
+    if end_date:
+        query = query.filter(Transaction.transaction_date <= end_date)
+
+    query = query.order_by(
+        Transaction.transaction_date,
+        Transaction.id,
+        TransactionItem.id
+    ).execution_options(yield_per=batch_size)
+
+    for row in query:
+        yield row
+
+def iter_journal_csv(exercise_id):
+    """Yield the journal of an exercise as CSV text chunks (semicolon separated, UTF-8 with BOM)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+
+    buffer.write('\ufeff')
+    writer.writerow(JOURNAL_HEADERS)
+
+    for index, (_, transaction_date, reference, account_number, description, debit, credit) in enumerate(iter_journal_rows(exercise_id), 1):
+        writer.writerow([
+            transaction_date.strftime('%d/%m/%Y'),
+            reference,
+            account_number,
+            description or '',
+            f"{debit or 0:.2f}",
+            f"{credit or 0:.2f}"
+        ])
+
+        if index % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue()
+
+def write_journal_xlsx(exercise_id, file_path):
+    """Write the journal of an exercise to an XLSX file in xlsxwriter's constant memory mode"""
+    workbook = xlsxwriter.Workbook(file_path, {'constant_memory': True})
+    worksheet = workbook.add_worksheet('Journal')
+
+    # Add formats
+    header_format = workbook.add_format({
+        'bold': True,
+        'bg_color': '#333333',
+        'font_color': 'white',
+        'border': 1
+    })
+
+    date_format = workbook.add_format({
+        'num_format': 'dd/mm/yyyy',
+        'border': 1
+    })
+
+    cell_format = workbook.add_format({
+        'border': 1
+    })
+
+    number_format = workbook.add_format({
+        'num_format': '# ##0.00',
+        'border': 1
+    })
+
+    # Set column widths
+    worksheet.set_column('A:A', 12)  # Date
+    worksheet.set_column('B:B', 12)  # Référence
+    worksheet.set_column('C:C', 15)  # N° Compte
+    worksheet.set_column('D:D', 40)  # Libellé
+    worksheet.set_column('E:E', 15)  # Débit
+    worksheet.set_column('F:F', 15)  # Crédit
+
+    # Write headers
+    for col, header in enumerate(JOURNAL_HEADERS):
+        worksheet.write(0, col, header, header_format)
+
+    # Rows must be written in order in constant memory mode
+    row = 1
+    previous_transaction_id = None
+    for transaction_id, transaction_date, reference, account_number, description, debit, credit in iter_journal_rows(exercise_id):
+        # Add a blank row between transactions
+        if previous_transaction_id is not None and transaction_id != previous_transaction_id:
+            row += 1
+        previous_transaction_id = transaction_id
+
+        worksheet.write_datetime(row, 0, transaction_date, date_format)
+        worksheet.write_string(row, 1, reference or '', cell_format)
+        worksheet.write_string(row, 2, account_number, cell_format)
+        worksheet.write_string(row, 3, description or '', cell_format)
+        worksheet.write_number(row, 4, float(debit or 0), number_format)
+        worksheet.write_number(row, 5, float(credit or 0), number_format)
+        row += 1
+
+    workbook.close()
+
+def export_journal_xlsx(exercise_id):
+    """Write the journal to a temporary XLSX file and return its path"""
+    handle, file_path = tempfile.mkstemp(suffix='.xlsx', prefix='journal_')
+    os.close(handle)
+
+    try:
+        write_journal_xlsx(exercise_id, file_path)
+    except Exception:
+        os.remove(file_path)
+        raise
+
+    return file_path
+
+def iter_file_and_remove(file_path, chunk_size=STREAM_CHUNK_SIZE):
+    """Stream a temporary file in chunks and delete it once sent"""
+    try:
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        try:
+            os.remove(file_path)
+        except OSError as e:
+            logger.warning(f"Unable to remove temporary export {file_path}: {str(e)}")
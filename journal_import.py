@@ -0,0 +1,318 @@
+import io
+import csv
+import logging
+from datetime import date, datetime
+from functools import lru_cache
+from decimal import Decimal, InvalidOperation
+
+from app import db
+from models import Exercise, Transaction, TransactionItem
+from balance_store import apply_transactions, bump_ledger_version
+from account_index import get_account_index
+from ledger_money import to_cents, from_cents
+
+# openpyxl is only needed to read XLSX journals
+try:
+    import openpyxl
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Transactions inserted per bulk INSERT round
+IMPORT_BATCH_SIZE = 1000
+
+# Errors kept in the import report, the others are only counted
+MAX_REPORTED_ERRORS = 500
+
+# Accepted column headers (lower case), same layout as the journal export
+HEADER_ALIASES = {
+    'date': 'date',
+    'référence': 'reference',
+    'reference': 'reference',
+    'réf': 'reference',
+    'n° compte': 'account_number',
+    'compte': 'account_number',
+    'account': 'account_number',
+    'libellé': 'description',
+    'libelle': 'description',
+    'description': 'description',
+    'débit': 'debit',
+    'debit': 'debit',
+    'crédit': 'credit',
+    'credit': 'credit',
+}
+
+REQUIRED_COLUMNS = ('date', 'reference', 'account_number', 'debit', 'credit')
+
+DATE_FORMATS = ('%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%d.%m.%Y')
+
+class JournalImportError(Exception):
+    """Raised when a journal file cannot be read at all"""
+    pass
+
+def _parse_amount(value):
+    """Parse a French or plain amount ('1 234,56', '1234.56', 1234.56) into a Decimal"""
+    if value is None or value == '':
+        return Decimal('0')
+    if isinstance(value, (int, float, Decimal)):
+        return Decimal(str(value)).quantize(Decimal('0.01'))
+
+    clean = str(value).strip().replace('\xa0', '').replace('\u202f', '').replace(' ', '')
+    # The last separator is the decimal one ('1.234,56' or '1,234.56')
+    if ',' in clean and clean.rfind(',') > clean.rfind('.'):
+        clean = clean.replace('.', '').replace(',', '.')
+    else:
+        clean = clean.replace(',', '')
+    try:
+        return Decimal(clean).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f"Montant invalide: {value}")
+
+def _parse_date(value):
+    """Parse a date cell (date object or text in one of DATE_FORMATS)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return _parse_date_text(str(value or '').strip())
+
+@lru_cache(maxsize=4096)
+def _parse_date_text(text):
+    """Parse a date text, cached since a journal only spans a few hundred distinct days"""
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Date invalide: {text}")
+
+def iter_csv_rows(stream):
+    """Yield the rows of a CSV journal (UTF-8, with or without BOM, ; , or tab separated)"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    first_line = text.readline()
+    delimiter = max((';', ',', '\t'), key=first_line.count)
+
+    yield next(csv.reader([first_line], delimiter=delimiter), [])
+    yield from csv.reader(text, delimiter=delimiter)
+
+def iter_xlsx_rows(stream):
+    """Yield the rows of the first sheet of an XLSX journal, in read-only streaming mode"""
+    if not OPENPYXL_AVAILABLE:
+        raise JournalImportError("L'import XLSX nécessite le module openpyxl")
+
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield row
+    finally:
+        workbook.close()
+
+def iter_journal_lines(rows):
+    """
+    Map raw rows to journal lines using the header row.
+    Yields (line_number, {'date', 'reference', 'account_number', 'description', 'debit', 'credit'}),
+    skipping blank rows.
+    """
+    columns = None
+    for line_number, row in enumerate(rows, 1):
+        if not row or all(cell is None or str(cell).strip() == '' for cell in row):
+            continue
+
+        if columns is None:
+            columns = {}
+            for index, header in enumerate(row):
+                name = HEADER_ALIASES.get(str(header or '').strip().lower())
+                if name and name not in columns:
+                    columns[name] = index
+
+            missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+            if missing:
+                raise JournalImportError(f"Colonnes manquantes dans l'en-tête: {', '.join(missing)}")
+            continue
+
+        yield line_number, {
+            name: row[index] if index < len(row) else None
+            for name, index in columns.items()
+        }
+
+    if columns is None:
+        raise JournalImportError("Le fichier est vide")
+
+def iter_journal_entries(lines):
+    """Group consecutive lines sharing the same date and reference into entries"""
+    entry = None
+    for line_number, line in lines:
+        key = (str(line['date'] or '').strip(), str(line['reference'] or '').strip())
+        if entry is not None and entry['key'] != key:
+            yield entry
+            entry = None
+        if entry is None:
+            entry = {'key': key, 'lines': []}
+        entry['lines'].append((line_number, line))
+
+    if entry is not None:
+        yield entry
+
+def _validate_entry(entry, exercise, account_map):
+    """Return (transaction row, item rows, errors) for a journal entry"""
+    errors = []
+    items = []
+    first_line = entry['lines'][0][0]
+    reference = entry['key'][1]
+
+    try:
+        transaction_date = _parse_date(entry['lines'][0][1]['date'])
+        if not exercise.start_date <= transaction_date <= exercise.end_date:
+            errors.append((first_line, reference, f"Date {transaction_date.strftime('%d/%m/%Y')} hors de l'exercice"))
+    except ValueError as e:
+        transaction_date = None
+        errors.append((first_line, reference, str(e)))
+
+    if not reference:
+        errors.append((first_line, reference, "Référence manquante"))
+
+    total_debit = 0
+    total_credit = 0
+    for line_number, line in entry['lines']:
+        account_number = str(line['account_number'] or '').strip()
+        account_id = account_map.get(account_number)
+        if account_id is None:
+            errors.append((line_number, reference, f"Compte inconnu: {account_number or '(vide)'}"))
+
+        try:
+            debit = _parse_amount(line['debit'])
+            credit = _parse_amount(line['credit'])
+        except ValueError as e:
+            errors.append((line_number, reference, str(e)))
+            continue
+
+        if debit < 0 or credit < 0:
+            errors.append((line_number, reference, "Montant négatif"))
+            continue
+        if debit == 0 and credit == 0:
+            errors.append((line_number, reference, "Ligne sans montant"))
+            continue
+
+        total_debit += to_cents(debit)
+        total_credit += to_cents(credit)
+        description = str(line.get('description') or '').strip()
+        items.append({
+            'account_id': account_id,
+            'description': description[:200] or None,
+            'debit_amount': debit,
+            'credit_amount': credit
+        })
+
+    # Exact comparison in centimes, amounts are already rounded to the centime
+    if total_debit != total_credit:
+        errors.append((first_line, reference, f"Écriture non équilibrée (débit {from_cents(total_debit):.2f}, crédit {from_cents(total_credit):.2f})"))
+
+    transaction = {
+        'reference': reference[:50],
+        'transaction_date': transaction_date,
+        'description': next((item['description'] for item in items if item['description']), None),
+        # Stored totals, the items are inserted without ORM bookkeeping
+        'total_debit': from_cents(total_debit),
+        'total_credit': from_cents(total_credit)
+    }
+
+    return transaction, items, errors
+
+def _insert_batch(batch, exercise_id, user_id, is_posted):
+    """Bulk insert a batch of (transaction, items) and return the new transaction ids"""
+    transaction_rows = [dict(transaction, exercise_id=exercise_id, user_id=user_id, is_posted=is_posted)
+                        for transaction, _ in batch]
+
+    # Core multi-row INSERT ... RETURNING, ids come back in parameter order
+    transaction_ids = db.session.execute(
+        Transaction.__table__.insert().returning(Transaction.__table__.c.id, sort_by_parameter_order=True),
+        transaction_rows
+    ).scalars().all()
+
+    # Plain executemany for the items, no ORM bookkeeping
+    item_rows = [dict(item, transaction_id=transaction_id)
+                 for transaction_id, (_, items) in zip(transaction_ids, batch)
+                 for item in items]
+    db.session.execute(TransactionItem.__table__.insert(), item_rows)
+
+    if is_posted:
+        apply_transactions(transaction_ids)
+
+    return transaction_ids
+
+def import_journal(exercise_id, user_id, stream, file_format='csv', is_posted=False, dry_run=False):
+    """
+    Import a journal file (same columns as the journal export) into an exercise.
+    Consecutive lines with the same date and reference form one transaction.
+    Invalid transactions are skipped and reported, the valid ones are bulk inserted
+    and committed together. Returns the import report.
+    """
+    exercise = Exercise.query.get(exercise_id)
+    if not exercise:
+        raise JournalImportError(f"Exercice introuvable: {exercise_id}")
+    if exercise.is_closed:
+        raise JournalImportError("Impossible d'importer dans un exercice clôturé")
+
+    if file_format == 'csv':
+        rows = iter_csv_rows(stream)
+    elif file_format == 'xlsx':
+        rows = iter_xlsx_rows(stream)
+    else:
+        raise JournalImportError(f"Format non supporté: {file_format}")
+
+    account_map = {entry.account_number: entry.id for entry in get_account_index(exercise_id).active_accounts()}
+
+    report = {
+        'lines': 0,
+        'transactions': 0,
+        'rejected_transactions': 0,
+        'error_count': 0,
+        'errors': [],
+        'dry_run': dry_run
+    }
+    batch = []
+
+    try:
+        for entry in iter_journal_entries(iter_journal_lines(rows)):
+            report['lines'] += len(entry['lines'])
+            transaction, items, errors = _validate_entry(entry, exercise, account_map)
+
+            if errors:
+                report['rejected_transactions'] += 1
+                report['error_count'] += len(errors)
+                for line_number, reference, message in errors:
+                    if len(report['errors']) < MAX_REPORTED_ERRORS:
+                        report['errors'].append({'line': line_number, 'reference': reference, 'message': message})
+                continue
+
+            report['transactions'] += 1
+            if dry_run:
+                continue
+
+            batch.append((transaction, items))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                _insert_batch(batch, exercise_id, user_id, is_posted)
+                batch = []
+
+        if dry_run:
+            return report
+
+        if batch:
+            _insert_batch(batch, exercise_id, user_id, is_posted)
+
+        if report['transactions']:
+            bump_ledger_version(exercise_id)
+        db.session.commit()
+    except UnicodeDecodeError:
+        db.session.rollback()
+        raise JournalImportError("Encodage non supporté, enregistrez le fichier en UTF-8")
+    except Exception:
+        db.session.rollback()
+        raise
+
+    logger.info(f"Journal imported into exercise {exercise_id}: {report['transactions']} transaction(s), "
+                f"{report['rejected_transactions']} rejected, {report['lines']} line(s)")
+
+    return report
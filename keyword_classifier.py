@@ -0,0 +1,187 @@
+"""
+Keyword classification of transaction descriptions, operation texts and exercise statements.
+
+The rules are loaded from classification_rules.json. Each rule set is compiled
+into one regular expression built from a trie of its keywords, so a text is
+scanned once whatever the number of rules. Each search resumes one character
+after the previous match, so overlapping keywords ('nan' in 'banane') are all
+found. Small rule sets, such as the shipped ones, keep one C-level substring
+search per keyword, which CPython runs faster than a regular expression below
+about 30 keywords (see benchmark_classifier.py).
+"""
+import os
+import re
+import json
+import logging
+from collections import Counter
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+CLASSIFICATION_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'classification_rules.json')
+
+# Keyword count from which a single compiled scan beats one substring search per keyword
+COMPILED_MIN_KEYWORDS = 32
+
+def _trie_pattern(keywords):
+    """Build a regular expression matching any of the keywords, factored on their common prefixes"""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def pattern(node):
+        alternatives = [re.escape(char) + pattern(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ''
+        body = alternatives[0] if len(alternatives) == 1 else f"(?:{'|'.join(alternatives)})"
+        # Optional tail when a keyword ends here; greedy, so the longest keyword wins
+        return f"(?:{body})?" if '' in node else body
+
+    return pattern(trie)
+
+class KeywordMatcher:
+    """
+    Find and count the occurrences of a set of keywords in a text, with the same
+    results as one substring search (in / str.count) per keyword
+    """
+
+    def __init__(self, keywords, compiled=None):
+        self.keywords = sorted({keyword.lower() for keyword in keywords if keyword})
+        if compiled is None:
+            compiled = len(self.keywords) >= COMPILED_MIN_KEYWORDS
+        self._regex = re.compile(_trie_pattern(self.keywords)) if compiled and self.keywords else None
+        # The keywords starting at the same position are the prefixes of the longest one
+        self._prefixes = {
+            keyword: [other for other in self.keywords if keyword.startswith(other)]
+            for keyword in self.keywords
+        }
+
+    def _matches(self, text):
+        """
+        Yield (position, longest keyword starting there) for every position where a keyword starts.
+        Resuming one character after each match, rather than at its end, finds the keywords
+        starting inside it; the regex skips the other positions in C.
+        """
+        search = self._regex.search
+        match = search(text)
+        while match:
+            start = match.start()
+            yield start, match.group()
+            match = search(text, start + 1)
+
+    def count(self, text):
+        """Return a Counter of the keywords found in the text"""
+        counts = Counter()
+        if not text:
+            return counts
+        text = text.lower()
+        if self._regex is None:
+            for keyword in self.keywords:
+                occurrences = text.count(keyword)
+                if occurrences:
+                    counts[keyword] = occurrences
+            return counts
+        # str.count does not count the overlapping occurrences of a keyword with itself ('aa' in 'aaa')
+        next_start = {}
+        for start, longest in self._matches(text):
+            for keyword in self._prefixes[longest]:
+                if start >= next_start.get(keyword, 0):
+                    counts[keyword] += 1
+                    next_start[keyword] = start + len(keyword)
+        return counts
+
+    def found(self, text):
+        """Return the set of keywords present in the text"""
+        if not text:
+            return set()
+        text = text.lower()
+        if self._regex is None:
+            return {keyword for keyword in self.keywords if keyword in text}
+        return {other for _, keyword in self._matches(text) for other in self._prefixes[keyword]}
+
+    def contains(self, text):
+        """
+        Return a test of the presence of a keyword in the text; without compiled scan, each
+        keyword is only searched when tested, so rules checked in order can stop early
+        """
+        if not text:
+            return lambda keyword: False
+        if self._regex is None:
+            return text.lower().__contains__
+        return self.found(text).__contains__
+
+class KeywordClassifier:
+    """
+    Classification rules, one matcher per rule set:
+    - transaction_accounts: keyword -> account number prefix
+    - operations: operation type when all / any of its keywords are present, first rule wins
+    - exercise_categories: category with the most keyword occurrences
+    """
+
+    def __init__(self, rules):
+        self.transaction_accounts = [(rule['keyword'].lower(), rule['account']) for rule in rules.get('transaction_accounts', [])]
+        self.operations = [(
+            rule['operation'],
+            [keyword.lower() for keyword in rule.get('all', [])],
+            [keyword.lower() for keyword in rule.get('any', [])]
+        ) for rule in rules.get('operations', [])]
+        self.exercise_categories = [
+            (rule['category'], [keyword.lower() for keyword in rule['keywords']])
+            for rule in rules.get('exercise_categories', [])
+        ]
+
+        self.account_matcher = KeywordMatcher(keyword for keyword, _ in self.transaction_accounts)
+        self.operation_matcher = KeywordMatcher(
+            keyword for _, all_keywords, any_keywords in self.operations for keyword in all_keywords + any_keywords
+        )
+        self.category_matcher = KeywordMatcher(
+            keyword for _, keywords in self.exercise_categories for keyword in keywords
+        )
+
+    def match_accounts(self, text):
+        """Return {keyword: account number} for the transaction keywords found in the text, in rule order"""
+        present = self.account_matcher.contains(text)
+        return {keyword: account for keyword, account in self.transaction_accounts if present(keyword)}
+
+    def classify_operation(self, text):
+        """Return the operation type of the first rule satisfied by the text, or None"""
+        present = self.operation_matcher.contains(text)
+        for operation, all_keywords, any_keywords in self.operations:
+            if all(present(keyword) for keyword in all_keywords) and \
+                    (not any_keywords or any(present(keyword) for keyword in any_keywords)):
+                return operation
+        return None
+
+    def category_keywords(self, category):
+        """Return the keywords of a category, or an empty list for an unknown category"""
+        for name, keywords in self.exercise_categories:
+            if name == category:
+                return keywords
+        return []
+
+    def category_scores(self, text):
+        """Return {category: number of keyword occurrences} for the text"""
+        counts = self.category_matcher.count(text)
+        return {category: sum(counts[keyword] for keyword in keywords)
+                for category, keywords in self.exercise_categories}
+
+    def detect_category(self, text):
+        """Return the category with the highest score (first one on ties), or None if no keyword is found"""
+        scores = self.category_scores(text)
+        if scores:
+            best_category = max(scores.items(), key=lambda x: x[1])
+            if best_category[1] > 0:
+                return best_category[0]
+        return None
+
+@lru_cache(maxsize=None)
+def get_classifier(path=CLASSIFICATION_RULES_PATH):
+    """Load and compile the classification rules once per process"""
+    with open(path, encoding='utf-8') as f:
+        rules = json.load(f)
+    classifier = KeywordClassifier(rules)
+    logger.info(f"Classification rules loaded from {path}")
+    return classifier
@@ -0,0 +1,112 @@
+import logging
+from decimal import Decimal
+
+from app import db
+from models import Account, Transaction, TransactionItem
+
+logger = logging.getLogger(__name__)
+
+# Account types whose normal balance is on the debit side
+DEBIT_NORMAL_TYPES = ('asset', 'expense')
+
+def signed_balance(account_type, total_debit, total_credit):
+    """Return the balance of an account from its totals, following its normal side"""
+    if account_type in DEBIT_NORMAL_TYPES:
+        # For assets and expenses, debit increases, credit decreases
+        return total_debit - total_credit
+    # For liabilities, equity, and revenues, credit increases, debit decreases
+    return total_credit - total_debit
+
+def get_account_totals(exercise_id, start_date=None, end_date=None, active_only=True):
+    """
+    Get posted debit and credit totals for every account of an exercise
+    in a single grouped query.
+    Returns a list of dicts ordered by account number:
+    {'account': Account, 'total_debit': Decimal, 'total_credit': Decimal}
+    Accounts whose posted debit and credit both total zero in the range are not returned,
+    as in daily_cube.get_period_account_totals, so both paths list the same accounts.
+    """
+    query = db.session.query(
+        Account,
+        db.func.sum(TransactionItem.debit_amount).label('total_debit'),
+        db.func.sum(TransactionItem.credit_amount).label('total_credit')
+    ).join(
+        TransactionItem, TransactionItem.account_id == Account.id
+    ).join(
+        Transaction, TransactionItem.transaction_id == Transaction.id
+    ).filter(
+        Transaction.exercise_id == exercise_id,
+        Transaction.is_posted == True
+    )
+
+    if start_date:
+        query = query.filter(Transaction.transaction_date >= start_date)
+    if end_date:
+        query = query.filter(Transaction.transaction_date <= end_date)
+    if active_only:
+        query = query.filter(Account.is_active == True)
+
+    rows = query.group_by(Account.id).having(db.or_(
+        db.func.coalesce(db.func.sum(TransactionItem.debit_amount), 0) != 0,
+        db.func.coalesce(db.func.sum(TransactionItem.credit_amount), 0) != 0
+    )).order_by(Account.account_number).all()
+
+    return [{
+        'account': account,
+        'total_debit': total_debit or Decimal('0'),
+        'total_credit': total_credit or Decimal('0')
+    } for account, total_debit, total_credit in rows]
+
+# Number of leading digits of the account number kept by get_exercise_aggregates
+# (OHADA class, 2-digit and 3-digit groupings)
+PREFIX_DEPTH = 3
+
+def get_exercise_aggregates(exercise_id, end_date=None):
+    """
+    Aggregate the posted items of an exercise by account type and by
+    account-number prefix in a single grouped query.
+    Returns {'by_type': {account_type: balance}, 'by_prefix': {prefix: balance}}
+    where prefixes are the first PREFIX_DEPTH digits of the account numbers.
+    """
+    prefix = db.func.substr(Account.account_number, 1, PREFIX_DEPTH)
+
+    query = db.session.query(
+        Account.account_type,
+        prefix.label('prefix'),
+        db.func.sum(TransactionItem.debit_amount).label('total_debit'),
+        db.func.sum(TransactionItem.credit_amount).label('total_credit')
+    ).join(
+        TransactionItem, TransactionItem.account_id == Account.id
+    ).join(
+        Transaction, TransactionItem.transaction_id == Transaction.id
+    ).filter(
+        Transaction.exercise_id == exercise_id,
+        Transaction.is_posted == True,
+        Account.is_active == True
+    )
+
+    if end_date:
+        query = query.filter(Transaction.transaction_date <= end_date)
+
+    aggregates = {'by_type': {}, 'by_prefix': {}}
+
+    for account_type, account_prefix, total_debit, total_credit in query.group_by(Account.account_type, prefix).all():
+        balance = signed_balance(account_type, total_debit or Decimal('0'), total_credit or Decimal('0'))
+        aggregates['by_type'][account_type] = aggregates['by_type'].get(account_type, Decimal('0')) + balance
+        aggregates['by_prefix'][account_prefix] = aggregates['by_prefix'].get(account_prefix, Decimal('0')) + balance
+
+    return aggregates
+
+def prefix_balance(aggregates, account_prefixes):
+    """Sum the balances of the accounts starting with any of the given prefixes"""
+    total_balance = Decimal('0')
+
+    for account_prefix in account_prefixes:
+        if len(account_prefix) > PREFIX_DEPTH:
+            raise ValueError(f"Account prefixes are aggregated on {PREFIX_DEPTH} digits at most: {account_prefix}")
+        total_balance += sum(
+            (balance for key, balance in aggregates['by_prefix'].items() if key.startswith(account_prefix)),
+            Decimal('0')
+        )
+
+    return total_balance
@@ -0,0 +1,111 @@
+import logging
+
+import numpy as np
+
+from app import db
+from models import Account, Transaction, TransactionItem
+from ledger_aggregates import DEBIT_NORMAL_TYPES
+from ledger_money import from_cents, cents_column
+
+logger = logging.getLogger(__name__)
+
+def build_ledger(exercise_id, start_date, end_date, account_id=None):
+    """
+    Build the ledger lines of an exercise from a single date-ordered query.
+    Opening balances, running balances and totals are computed per account with
+    NumPy cumulative sums over the lines, segmented by account.
+    Returns a list of account entries in the same shape as the general ledger:
+    {'account', 'transactions', 'opening_balance', 'closing_balance', 'total_debit', 'total_credit'}
+    Only accounts with at least one posted line up to end_date are returned.
+    """
+    query = db.session.query(
+        TransactionItem.account_id,
+        Account.account_type,
+        Transaction.transaction_date,
+        Transaction.reference,
+        TransactionItem.description,
+        Transaction.description,
+        cents_column(TransactionItem.debit_amount),
+        cents_column(TransactionItem.credit_amount)
+    ).join(
+        Transaction, TransactionItem.transaction_id == Transaction.id
+    ).join(
+        Account, TransactionItem.account_id == Account.id
+    ).filter(
+        Transaction.exercise_id == exercise_id,
+        Transaction.transaction_date <= end_date,
+        Transaction.is_posted == True
+    )
+
+    if account_id is not None:
+        query = query.filter(TransactionItem.account_id == account_id)
+    else:
+        query = query.filter(Account.is_active == True)
+
+    # Lines before start_date come first in each account and only feed the opening balance
+    rows = query.order_by(
+        Account.account_number,
+        Account.id,
+        Transaction.transaction_date,
+        Transaction.id,
+        TransactionItem.id
+    ).all()
+
+    if not rows:
+        return []
+
+    account_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    debits = np.fromiter((row[6] for row in rows), dtype=np.int64, count=len(rows))
+    credits = np.fromiter((row[7] for row in rows), dtype=np.int64, count=len(rows))
+    in_period = np.fromiter((row[2] >= start_date for row in rows), dtype=bool, count=len(rows))
+    debit_normal = np.fromiter((row[1] in DEBIT_NORMAL_TYPES for row in rows), dtype=bool, count=len(rows))
+
+    # Signed movement of each line following the normal side of its account
+    deltas = np.where(debit_normal, debits - credits, credits - debits)
+
+    # Segment boundaries: one segment per account
+    starts = np.flatnonzero(np.r_[True, account_ids[1:] != account_ids[:-1]])
+    lengths = np.diff(np.r_[starts, len(rows)])
+
+    cumulative = np.cumsum(deltas)
+    segment_offsets = np.repeat(cumulative[starts] - deltas[starts], lengths)
+    running = cumulative - segment_offsets
+
+    openings = np.add.reduceat(np.where(in_period, 0, deltas), starts)
+    total_debits = np.add.reduceat(np.where(in_period, debits, 0), starts)
+    total_credits = np.add.reduceat(np.where(in_period, credits, 0), starts)
+    closings = running[starts + lengths - 1]
+
+    accounts = {
+        account.id: account
+        for account in Account.query.filter(Account.id.in_(np.unique(account_ids).tolist())).all()
+    }
+
+    ledger = []
+    running_list = running.tolist()
+    debit_list = debits.tolist()
+    credit_list = credits.tolist()
+    in_period_list = in_period.tolist()
+
+    for segment, start in enumerate(starts.tolist()):
+        end = start + int(lengths[segment])
+
+        transactions = [{
+            'date': rows[i][2],
+            'reference': rows[i][3],
+            'description': rows[i][4] or rows[i][5],
+            'debit': from_cents(debit_list[i]),
+            'credit': from_cents(credit_list[i]),
+            'balance': from_cents(running_list[i])
+        } for i in range(start, end) if in_period_list[i]]
+
+        ledger.append({
+            'account': accounts[rows[start][0]],
+            'transactions': transactions,
+            'opening_balance': from_cents(openings[segment]),
+            'closing_balance': from_cents(closings[segment]),
+            'total_debit': from_cents(total_debits[segment]),
+            'total_credit': from_cents(total_credits[segment])
+        })
+
+    return ledger
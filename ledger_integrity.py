@@ -0,0 +1,300 @@
+"""
+Streaming integrity verifier of the ledger.
+
+Reads transaction_item joined to its transaction and account in one ordered
+pass, chunk by chunk through a server-side cursor, and checks with NumPy on
+each chunk:
+- posted transactions are balanced
+- the stored totals of each transaction match its items
+- each item's account exists and belongs to the exercise of its transaction
+- amounts are neither negative nor both zero
+- the stored balances (account_balance, account_daily_balance), when the
+  balance store is in use, match the posted items
+
+Memory is bounded by the chunk size and the number of (account, day) pairs,
+not by the number of items.
+"""
+import time
+import logging
+from datetime import date, timedelta
+from itertools import chain
+
+import numpy as np
+
+from app import db
+from models import Account, Transaction, TransactionItem, AccountBalance, AccountDailyBalance
+from ledger_money import cents_column, epoch_day, cents_to_float
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 50000
+
+# Examples kept per check in the report
+MAX_EXAMPLES = 100
+
+# Columns of the item stream
+(ITEM_ID, TRANSACTION_ID, EXERCISE_ID, IS_POSTED, ACCOUNT_ID, ACCOUNT_EXERCISE_ID,
+ DAY, DEBIT, CREDIT, STORED_DEBIT, STORED_CREDIT) = range(11)
+COLUMN_COUNT = 11
+
+EPOCH = date(1970, 1, 1)
+
+def _day(epoch_days):
+    return (EPOCH + timedelta(days=int(epoch_days))).isoformat()
+
+class _Check:
+    """Violation counter of one invariant, with a few examples"""
+
+    def __init__(self):
+        self.count = 0
+        self.examples = []
+
+    def add(self, count, examples):
+        self.count += count
+        room = MAX_EXAMPLES - len(self.examples)
+        if room > 0:
+            self.examples.extend(examples(room))
+
+    def report(self, **extra):
+        return dict(extra, count=self.count, examples=self.examples)
+
+def _item_statement(exercise_id=None):
+    """Items with their transaction and account, ordered by transaction, as plain integers"""
+    statement = db.select(
+        TransactionItem.id,
+        TransactionItem.transaction_id,
+        Transaction.exercise_id,
+        db.case((Transaction.is_posted == True, 1), else_=0),
+        TransactionItem.account_id,
+        db.func.coalesce(Account.exercise_id, -1),
+        epoch_day(Transaction.transaction_date),
+        cents_column(TransactionItem.debit_amount),
+        cents_column(TransactionItem.credit_amount),
+        cents_column(Transaction.total_debit),
+        cents_column(Transaction.total_credit)
+    ).join(
+        Transaction, TransactionItem.transaction_id == Transaction.id
+    ).outerjoin(
+        Account, TransactionItem.account_id == Account.id
+    )
+
+    if exercise_id is not None:
+        statement = statement.where(Transaction.exercise_id == exercise_id)
+
+    return statement.order_by(TransactionItem.transaction_id, TransactionItem.id)
+
+class LedgerVerifier:
+    """One-pass verification state, fed with chunks of the ordered item stream"""
+
+    def __init__(self):
+        self.items = 0
+        self.transactions = 0
+        self.unbalanced = _Check()
+        self.stored_totals = _Check()
+        self.account_exercise = _Check()
+        self.missing_accounts = _Check()
+        self.invalid_amounts = _Check()
+        # Posted debit/credit per (exercise, account, day), in centimes
+        self.daily = {}
+        self._carry = np.zeros((0, COLUMN_COUNT), dtype=np.int64)
+
+    def feed(self, rows):
+        """Check a chunk of rows; the last transaction is held back until it is complete"""
+        values = np.fromiter(chain.from_iterable(rows), dtype=np.int64,
+                             count=COLUMN_COUNT * len(rows)).reshape(-1, COLUMN_COUNT)
+        values = np.concatenate((self._carry, values))
+        if not len(values):
+            return
+        last_start = np.flatnonzero(values[:, TRANSACTION_ID] != values[-1, TRANSACTION_ID])
+        split = last_start[-1] + 1 if len(last_start) else 0
+        self._carry = values[split:]
+        self._check(values[:split])
+
+    def finish(self):
+        """Check the transaction still held back"""
+        carry, self._carry = self._carry, np.zeros((0, COLUMN_COUNT), dtype=np.int64)
+        self._check(carry)
+
+    def _check(self, values):
+        if not len(values):
+            return
+        self.items += len(values)
+
+        # Per transaction: the rows are ordered by transaction
+        transaction_ids = values[:, TRANSACTION_ID]
+        starts = np.flatnonzero(np.r_[True, transaction_ids[1:] != transaction_ids[:-1]])
+        self.transactions += len(starts)
+        debits = np.add.reduceat(values[:, DEBIT], starts)
+        credits = np.add.reduceat(values[:, CREDIT], starts)
+        heads = values[starts]
+
+        unbalanced = np.flatnonzero((heads[:, IS_POSTED] == 1) & (debits != credits))
+        self.unbalanced.add(len(unbalanced), lambda room: [{
+            'transaction_id': int(heads[i, TRANSACTION_ID]),
+            'exercise_id': int(heads[i, EXERCISE_ID]),
+            'debit': cents_to_float(debits[i]),
+            'credit': cents_to_float(credits[i])
+        } for i in unbalanced[:room]])
+
+        drifted = np.flatnonzero((heads[:, STORED_DEBIT] != debits) | (heads[:, STORED_CREDIT] != credits))
+        self.stored_totals.add(len(drifted), lambda room: [{
+            'transaction_id': int(heads[i, TRANSACTION_ID]),
+            'stored_debit': cents_to_float(heads[i, STORED_DEBIT]),
+            'stored_credit': cents_to_float(heads[i, STORED_CREDIT]),
+            'expected_debit': cents_to_float(debits[i]),
+            'expected_credit': cents_to_float(credits[i])
+        } for i in drifted[:room]])
+
+        # Per item
+        missing = np.flatnonzero(values[:, ACCOUNT_EXERCISE_ID] == -1)
+        self.missing_accounts.add(len(missing), lambda room: [{
+            'item_id': int(values[i, ITEM_ID]),
+            'transaction_id': int(values[i, TRANSACTION_ID]),
+            'account_id': int(values[i, ACCOUNT_ID])
+        } for i in missing[:room]])
+
+        foreign = np.flatnonzero((values[:, ACCOUNT_EXERCISE_ID] != -1) &
+                                 (values[:, ACCOUNT_EXERCISE_ID] != values[:, EXERCISE_ID]))
+        self.account_exercise.add(len(foreign), lambda room: [{
+            'item_id': int(values[i, ITEM_ID]),
+            'transaction_id': int(values[i, TRANSACTION_ID]),
+            'account_id': int(values[i, ACCOUNT_ID]),
+            'transaction_exercise_id': int(values[i, EXERCISE_ID]),
+            'account_exercise_id': int(values[i, ACCOUNT_EXERCISE_ID])
+        } for i in foreign[:room]])
+
+        invalid = np.flatnonzero((values[:, DEBIT] < 0) | (values[:, CREDIT] < 0) |
+                                 ((values[:, DEBIT] == 0) & (values[:, CREDIT] == 0)))
+        self.invalid_amounts.add(len(invalid), lambda room: [{
+            'item_id': int(values[i, ITEM_ID]),
+            'transaction_id': int(values[i, TRANSACTION_ID]),
+            'debit': cents_to_float(values[i, DEBIT]),
+            'credit': cents_to_float(values[i, CREDIT])
+        } for i in invalid[:room]])
+
+        # Posted movements reduced per (exercise, account, day) before reaching Python
+        posted = values[values[:, IS_POSTED] == 1]
+        if not len(posted):
+            return
+        posted = posted[np.lexsort((posted[:, DAY], posted[:, ACCOUNT_ID], posted[:, EXERCISE_ID]))]
+        keys = posted[:, (EXERCISE_ID, ACCOUNT_ID, DAY)]
+        key_starts = np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]).any(axis=1)])
+        day_debits = np.add.reduceat(posted[:, DEBIT], key_starts)
+        day_credits = np.add.reduceat(posted[:, CREDIT], key_starts)
+
+        daily = self.daily
+        for key, debit, credit in zip(map(tuple, keys[key_starts].tolist()), day_debits.tolist(), day_credits.tolist()):
+            total = daily.get(key)
+            if total is None:
+                daily[key] = [debit, credit]
+            else:
+                total[0] += debit
+                total[1] += credit
+
+def _compare_stored(rows, expected, key_report):
+    """
+    Compare stored (key..., debit, credit) rows with the expected {key: [debit, credit]}.
+    Returns (stored row count, check); missing rows count as zero totals.
+    """
+    check = _Check()
+    seen = set()
+    stored_count = 0
+
+    for row in rows:
+        *key, debit, credit = row
+        key = tuple(key)
+        stored_count += 1
+        seen.add(key)
+        expected_debit, expected_credit = expected.get(key, (0, 0))
+        if debit != expected_debit or credit != expected_credit:
+            check.add(1, lambda room: [dict(
+                key_report(key),
+                stored_debit=cents_to_float(debit), stored_credit=cents_to_float(credit),
+                expected_debit=cents_to_float(expected_debit), expected_credit=cents_to_float(expected_credit)
+            )])
+
+    for key, (debit, credit) in expected.items():
+        if key not in seen and (debit or credit):
+            check.add(1, lambda room: [dict(
+                key_report(key),
+                stored_debit=None, stored_credit=None,
+                expected_debit=cents_to_float(debit), expected_credit=cents_to_float(credit)
+            )])
+
+    return stored_count, check
+
+def verify_ledger(exercise_id=None, chunk_size=DEFAULT_CHUNK_SIZE, engine=None):
+    """
+    Verify the ledger invariants of one exercise (all by default) in one streamed pass.
+    Returns a JSON-serializable report; report['ok'] is False when any check fails.
+    """
+    engine = engine or db.engine
+    started = time.perf_counter()
+    verifier = LedgerVerifier()
+    chunks = 0
+
+    with engine.connect() as connection:
+        # Server-side cursor where the driver has one, rows fetched chunk_size at a time
+        result = connection.execution_options(yield_per=chunk_size).execute(_item_statement(exercise_id))
+        for rows in result.partitions():
+            verifier.feed(rows)
+            chunks += 1
+        verifier.finish()
+
+        # Stored balances, compared only where the balance store is in use
+        account_rows = db.select(
+            AccountBalance.exercise_id, AccountBalance.account_id,
+            cents_column(AccountBalance.total_debit), cents_column(AccountBalance.total_credit)
+        )
+        daily_rows = db.select(
+            AccountDailyBalance.exercise_id, AccountDailyBalance.account_id, epoch_day(AccountDailyBalance.day),
+            cents_column(AccountDailyBalance.debit), cents_column(AccountDailyBalance.credit)
+        )
+        if exercise_id is not None:
+            account_rows = account_rows.where(AccountBalance.exercise_id == exercise_id)
+            daily_rows = daily_rows.where(AccountDailyBalance.exercise_id == exercise_id)
+
+        expected_accounts = {}
+        for (row_exercise_id, account_id, _), (debit, credit) in verifier.daily.items():
+            total = expected_accounts.setdefault((row_exercise_id, account_id), [0, 0])
+            total[0] += debit
+            total[1] += credit
+
+        stored_accounts, account_check = _compare_stored(
+            connection.execution_options(yield_per=chunk_size).execute(account_rows),
+            expected_accounts,
+            lambda key: {'exercise_id': key[0], 'account_id': key[1]}
+        )
+        stored_days, daily_check = _compare_stored(
+            connection.execution_options(yield_per=chunk_size).execute(daily_rows),
+            verifier.daily,
+            lambda key: {'exercise_id': key[0], 'account_id': key[1], 'day': _day(key[2])}
+        )
+
+    balance_store_used = bool(stored_accounts or stored_days)
+    checks = {
+        'unbalanced_transactions': verifier.unbalanced.report(),
+        'stored_transaction_totals': verifier.stored_totals.report(),
+        'missing_accounts': verifier.missing_accounts.report(),
+        'account_exercise_mismatch': verifier.account_exercise.report(),
+        'invalid_amounts': verifier.invalid_amounts.report(),
+        'account_balances': account_check.report(skipped=not balance_store_used, stored_rows=stored_accounts),
+        'daily_balances': daily_check.report(skipped=not balance_store_used, stored_rows=stored_days),
+    }
+    if not balance_store_used:
+        checks['account_balances'].update(count=0, examples=[])
+        checks['daily_balances'].update(count=0, examples=[])
+
+    elapsed = time.perf_counter() - started
+    report = {
+        'exercise_id': exercise_id,
+        'items_checked': verifier.items,
+        'transactions_checked': verifier.transactions,
+        'chunks': chunks,
+        'chunk_size': chunk_size,
+        'elapsed_seconds': round(elapsed, 3),
+        'ok': all(check['count'] == 0 for check in checks.values()),
+        'checks': checks
+    }
+    logger.info(f"Ledger verified: {verifier.items} items in {elapsed:.2f}s, ok={report['ok']}")
+    return report
@@ -0,0 +1,81 @@
+"""
+Fixed-point ledger arithmetic.
+
+Amounts are handled as integer centimes: Python ints for single values and
+NumPy int64 arrays for columns, which hold any Numeric(15, 2) amount exactly.
+Conversion happens at the boundaries only: Decimal columns read from the models,
+floats parsed from documents and user input, and the Decimal or float values
+handed back to the templates, reports and JSON responses.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+from sqlalchemy import BigInteger, Integer, cast, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+CENTS_PER_UNIT = 100
+_UNIT = Decimal('1')
+
+def to_cents(amount):
+    """Convert an amount (Decimal, int, float or string) to integer centimes, rounded half up"""
+    if amount is None:
+        return 0
+    if isinstance(amount, int):
+        return amount * CENTS_PER_UNIT
+    if not isinstance(amount, Decimal):
+        # str() keeps the shortest decimal form of a float: 0.1 -> '0.1', not 0.1000000000000000055
+        amount = Decimal(str(amount).replace(' ', '').replace(',', '.'))
+    return int(amount.scaleb(2).quantize(_UNIT, rounding=ROUND_HALF_UP))
+
+def from_cents(cents):
+    """Convert integer centimes back to a Decimal amount with two decimal places"""
+    return Decimal(int(cents)).scaleb(-2)
+
+def cents_to_float(cents):
+    """Convert integer centimes to a float, for JSON and chart payloads"""
+    return int(cents) / CENTS_PER_UNIT
+
+def cents_array(amounts, count=-1):
+    """Convert an iterable of amounts to a NumPy int64 array of centimes"""
+    return np.fromiter((to_cents(amount) for amount in amounts), dtype=np.int64, count=count)
+
+def sum_cents(amounts):
+    """Exact sum of amounts, in centimes"""
+    return sum(to_cents(amount) for amount in amounts)
+
+def sum_amounts(amounts):
+    """Exact sum of amounts, as a Decimal"""
+    return from_cents(sum_cents(amounts))
+
+def percent_cents(cents, rate):
+    """Apply a percentage rate (e.g. a VAT rate of 18) to centimes, rounded half up to the centime"""
+    rate = rate if isinstance(rate, Decimal) else Decimal(str(rate))
+    return int((Decimal(int(cents)) * rate / 100).quantize(_UNIT, rounding=ROUND_HALF_UP))
+
+def included_tax_cents(cents, rate):
+    """Return the tax part of a tax-inclusive amount in centimes, rounded half up to the centime"""
+    rate = rate if isinstance(rate, Decimal) else Decimal(str(rate))
+    return int((Decimal(int(cents)) * rate / (100 + rate)).quantize(_UNIT, rounding=ROUND_HALF_UP))
+
+def cents_column(column):
+    """
+    SQL expression reading a Numeric(15, 2) column as integer centimes, so large
+    result sets reach NumPy without building a Decimal per value
+    """
+    return cast(func.round(func.coalesce(column, 0) * CENTS_PER_UNIT), BigInteger)
+
+class epoch_day(FunctionElement):
+    """Number of days since 1970-01-01 of a date column, read straight into datetime64[D]"""
+    type = Integer()
+    inherit_cache = True
+
+@compiles(epoch_day)
+def _epoch_day_default(element, compiler, **kw):
+    column = compiler.process(list(element.clauses)[0], **kw)
+    return f"({column} - DATE '1970-01-01')"
+
+@compiles(epoch_day, 'sqlite')
+def _epoch_day_sqlite(element, compiler, **kw):
+    column = compiler.process(list(element.clauses)[0], **kw)
+    return f"CAST(julianday({column}) - 2440587.5 AS INTEGER)"
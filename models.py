@@ -4,6 +4,7 @@ import json
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
+from ledger_money import to_cents
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -146,14 +147,20 @@ class Exercise(db.Model):
     description = db.Column(db.Text)
     is_closed = db.Column(db.Boolean, default=False)
     is_published = db.Column(db.Boolean, default=False)
+    ledger_version = db.Column(db.Integer, default=0, nullable=False)  # Bumped on every transaction change
+    chart_version = db.Column(db.Integer, default=0, nullable=False)  # Bumped on every account change
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
+    # Keyset pagination of the exercise list
+    __table_args__ = (db.Index('ix_exercise_user_start_id', 'user_id', 'start_date', 'id'),)
+    
     # Relationships
     accounts = db.relationship('Account', backref='exercise', lazy='dynamic')
     transactions = db.relationship('Transaction', backref='exercise', lazy='dynamic')
     documents = db.relationship('Document', backref='exercise', lazy='dynamic')
+    closing_snapshots = db.relationship('ClosingSnapshot', backref='exercise', lazy='dynamic', cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Exercise {self.name}>'
@@ -187,6 +194,12 @@ class Account(db.Model):
     parent_id = db.Column(db.Integer, db.ForeignKey('account.id'))
     exercise_id = db.Column(db.Integer, db.ForeignKey('exercise.id'), nullable=False)
     is_system = db.Column(db.Boolean, default=False)  # Indicates if it's a system account (from OHADA)
+    path = db.Column(db.String(255))  # Materialized path of ancestor ids: '/<root id>/.../<id>/'
+    
+    __table_args__ = (
+        db.Index('ix_account_exercise_number', 'exercise_id', 'account_number'),
+        db.Index('ix_account_exercise_path', 'exercise_id', 'path', postgresql_ops={'path': 'varchar_pattern_ops'}),
+    )
     
     # Relationships
     children = db.relationship('Account', backref=db.backref('parent', remote_side=[id]), lazy='dynamic')
@@ -210,6 +223,17 @@ class Transaction(db.Model):
     document_id = db.Column(db.Integer, db.ForeignKey('document.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     exercise_id = db.Column(db.Integer, db.ForeignKey('exercise.id'), nullable=False)
+    # Totals of the items, kept up to date by balance_store.refresh_transaction_totals
+    total_debit = db.Column(db.Numeric(15, 2), default=0, nullable=False)
+    total_credit = db.Column(db.Numeric(15, 2), default=0, nullable=False)
+    
+    __table_args__ = (
+        # Partial index for the reporting queries, which only read posted transactions
+        db.Index('ix_transaction_posted_exercise_date', 'exercise_id', 'transaction_date',
+                 postgresql_where=db.text('is_posted'), sqlite_where=db.text('is_posted = 1')),
+        # Period queries of an exercise and keyset pagination of the journal
+        db.Index('ix_transaction_exercise_date_id', 'exercise_id', 'transaction_date', 'id'),
+    )
     
     # Relationships
     items = db.relationship('TransactionItem', backref='transaction', lazy='dynamic', cascade='all, delete-orphan')
@@ -217,17 +241,10 @@ class Transaction(db.Model):
     def __repr__(self):
         return f'<Transaction {self.reference}>'
     
-    @property
-    def total_debit(self):
-        return sum(item.debit_amount for item in self.items)
-    
-    @property
-    def total_credit(self):
-        return sum(item.credit_amount for item in self.items)
-    
     @property
     def is_balanced(self):
-        return abs(self.total_debit - self.total_credit) < 0.01  # Allow rounding errors
+        # Exact comparison of the stored totals in centimes, no float tolerance
+        return to_cents(self.total_debit) == to_cents(self.total_credit)
 
 class TransactionItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -239,9 +256,56 @@ class TransactionItem(db.Model):
     transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id'), nullable=False)
     account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
     
+    __table_args__ = (
+        db.Index('ix_transaction_item_account_transaction', 'account_id', 'transaction_id'),
+        db.Index('ix_transaction_item_transaction', 'transaction_id'),
+    )
+    
     def __repr__(self):
         return f'<TransactionItem {self.id} - {self.description}>'
 
+class AccountBalance(db.Model):
+    """Cumulative posted debit/credit per (exercise, account), maintained on posting"""
+    id = db.Column(db.Integer, primary_key=True)
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercise.id'), nullable=False)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
+    total_debit = db.Column(db.Numeric(15, 2), default=0, nullable=False)
+    total_credit = db.Column(db.Numeric(15, 2), default=0, nullable=False)
+    last_transaction_date = db.Column(db.Date)  # Latest posted date included in the totals
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('exercise_id', 'account_id', name='account_balance_uc'),)
+
+    def __repr__(self):
+        return f'<AccountBalance {self.exercise_id}/{self.account_id}>'
+
+class AccountDailyBalance(db.Model):
+    """Posted debit/credit per (exercise, account, day)"""
+    id = db.Column(db.Integer, primary_key=True)
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercise.id'), nullable=False)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    debit = db.Column(db.Numeric(15, 2), default=0, nullable=False)
+    credit = db.Column(db.Numeric(15, 2), default=0, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('exercise_id', 'account_id', 'day', name='account_daily_balance_uc'),)
+
+    def __repr__(self):
+        return f'<AccountDailyBalance {self.exercise_id}/{self.account_id} {self.day}>'
+
+class ClosingSnapshot(db.Model):
+    """Report data frozen when an exercise is closed (zlib-compressed JSON)"""
+    id = db.Column(db.Integer, primary_key=True)
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercise.id'), nullable=False)
+    report_type = db.Column(db.String(50), nullable=False)  # trial_balance, balance_sheet, income_statement, general_ledger
+    payload = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('exercise_id', 'report_type', name='closing_snapshot_uc'),)
+
+    def __repr__(self):
+        return f'<ClosingSnapshot {self.report_type} of exercise {self.exercise_id}>'
+
 class Document(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     original_filename = db.Column(db.String(255), nullable=False)
@@ -254,6 +318,12 @@ class Document(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     exercise_id = db.Column(db.Integer, db.ForeignKey('exercise.id'), nullable=False)
     
+    __table_args__ = (
+        # Keyset pagination of the document lists
+        db.Index('ix_document_exercise_upload_id', 'exercise_id', 'upload_date', 'id'),
+        db.Index('ix_document_user_upload_id', 'user_id', 'upload_date', 'id'),
+    )
+    
     # Relationships
     transactions = db.relationship('Transaction', backref='document', lazy='dynamic')
     
@@ -291,6 +361,8 @@ class ExerciseSolution(db.Model):
     # Référence aux exemples utilisés pour générer la solution
     examples_used = db.Column(db.Text)  # Liste des IDs d'exemples au format JSON
     
+    __table_args__ = (db.Index('ix_exercise_solution_user_created_id', 'user_id', 'created_at', 'id'),)
+    
     # Utilisateur propriétaire
     user = db.relationship('User', backref=db.backref('exercise_solutions', lazy='dynamic'))
     
@@ -442,6 +514,8 @@ class Post(db.Model):
     tags = db.Column(db.Text)  # Utilisateurs tagués (JSON array d'IDs)
     exercise_solution_id = db.Column(db.Integer, db.ForeignKey('exercise_solution.id'), nullable=True)
     
+    __table_args__ = (db.Index('ix_post_workgroup_created', 'workgroup_id', 'created_at'),)
+    
     # Relationships
     comments = db.relationship('Comment', backref='post', lazy='dynamic', cascade='all, delete-orphan')
     likes = db.relationship('Like', backref='post', lazy='dynamic', cascade='all, delete-orphan')
@@ -505,6 +579,11 @@ class Like(db.Model):
     comment_id = db.Column(db.Integer, db.ForeignKey('comment.id'), nullable=True)
     reaction_type = db.Column(db.String(20), default='like')  # like, love, haha, wow, sad, angry
     
+    __table_args__ = (
+        db.Index('ix_like_post', 'post_id'),
+        db.Index('ix_like_user_post', 'user_id', 'post_id'),
+    )
+    
     def __repr__(self):
         target = f"Post {self.post_id}" if self.post_id else f"Comment {self.comment_id}"
         return f'<Like {self.reaction_type} on {target}>'
@@ -553,6 +632,8 @@ class PrivateMessage(db.Model):
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
+    __table_args__ = (db.Index('ix_private_message_recipient_read', 'recipient_id', 'is_read'),)
+    
     # Relationships
     sender = db.relationship('User', foreign_keys=[sender_id], backref=db.backref('sent_private_messages', lazy='dynamic'))
     recipient = db.relationship('User', foreign_keys=[recipient_id], backref=db.backref('received_private_messages', lazy='dynamic'))
@@ -605,6 +686,12 @@ class Notification(db.Model):
     source_id = db.Column(db.Integer)  # ID of the source object (workgroup, message, etc.)
     source_type = db.Column(db.String(20))  # Type of the source (workgroup, message, etc.)
     
+    __table_args__ = (
+        db.Index('ix_notification_user_read_created', 'user_id', 'is_read', 'created_at'),
+        # Keyset pagination of the notification list
+        db.Index('ix_notification_user_created_id', 'user_id', 'created_at', 'id'),
+    )
+    
     # Relationships
     user = db.relationship('User', backref=db.backref('notifications', lazy='dynamic'))
     
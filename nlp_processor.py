@@ -3,6 +3,8 @@ import json
 import logging
 from datetime import datetime
 
+from ledger_money import to_cents, cents_to_float, included_tax_cents
+
 logger = logging.getLogger(__name__)
 
 # Patterns réguliers pour l'extraction d'informations
@@ -94,7 +96,8 @@ def extract_data_from_text(text):
             # If we have a total amount, calculate TVA amount
             if result['total_amount']:
                 # Assuming the total is tax inclusive
-                result['tva_amount'] = round(result['total_amount'] * tva_rate / (100 + tva_rate), 2)
+                tva_cents = included_tax_cents(to_cents(result['total_amount']), tva_rate)
+                result['tva_amount'] = cents_to_float(tva_cents)
         except (ValueError, IndexError):
             pass
     
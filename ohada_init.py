@@ -5,6 +5,8 @@ from datetime import datetime
 
 from app import app, db
 from models import Account, Exercise
+from account_hierarchy import compute_account_paths, rebuild_account_paths
+from account_index import bump_chart_version
 
 logger = logging.getLogger(__name__)
 
@@ -252,25 +254,110 @@ OHADA_ACCOUNTS = [
     {"account_number": "89", "name": "Résultat net", "account_type": "equity"}
 ]
 
-def create_account(exercise_id, account_data, parent_id=None):
-    """Create an account and its children"""
-    
-    # Create the account
-    account = Account(
-        account_number=account_data["account_number"],
-        name=account_data["name"],
-        account_type=account_data["account_type"],
-        parent_id=parent_id,
-        exercise_id=exercise_id,
-        is_system=True
+def iter_chart_accounts(chart, parent_number=None):
+    """Flatten a nested chart into (account_data, parent account number), parents first"""
+    for account_data in chart:
+        yield account_data, parent_number
+        yield from iter_chart_accounts(account_data.get("children", ()), account_data["account_number"])
+
+# Accounts of OHADA_ACCOUNTS making up the minimal chart created with every new exercise
+BASE_ACCOUNT_NUMBERS = ("10", "21", "41", "51", "52", "53", "60", "70")
+
+# Minimal chart created with every new exercise, taken from OHADA_ACCOUNTS without the sub-accounts
+BASE_ACCOUNTS = [
+    {key: value for key, value in account_data.items() if key != "children"}
+    for account_data, _ in iter_chart_accounts(OHADA_ACCOUNTS)
+    if account_data["account_number"] in BASE_ACCOUNT_NUMBERS
+]
+
+def seed_chart(exercise_id, chart=OHADA_ACCOUNTS, is_system=True):
+    """
+    Create a chart of accounts for an exercise with one multi-row INSERT, then
+    link the parents (resolved by account number) and set the paths with one
+    executemany UPDATE. Returns the number of accounts created. Does not commit.
+    """
+    rows = list(iter_chart_accounts(chart))
+    if not rows:
+        return 0
+
+    table = Account.__table__
+    # Rows come back in any order, they are matched by account number
+    ids_by_number = dict(db.session.execute(
+        table.insert().returning(table.c.account_number, table.c.id),
+        [{
+            'account_number': account_data["account_number"],
+            'name': account_data["name"],
+            'account_type': account_data["account_type"],
+            'description': account_data.get("description"),
+            'exercise_id': exercise_id,
+            'is_system': is_system,
+            'is_active': True
+        } for account_data, _ in rows]
+    ).all())
+
+    parents = [(ids_by_number[account_data["account_number"]], ids_by_number.get(parent_number))
+               for account_data, parent_number in rows]
+    paths = compute_account_paths(parents)
+
+    db.session.execute(
+        table.update().where(table.c.id == db.bindparam('account_id')).values(
+            parent_id=db.bindparam('account_parent_id'),
+            path=db.bindparam('account_path')
+        ),
+        [{'account_id': account_id, 'account_parent_id': parent_id, 'account_path': paths[account_id]}
+         for account_id, parent_id in parents]
     )
-    db.session.add(account)
-    db.session.flush()  # To get the account ID
-    
-    # Create children if present
-    if "children" in account_data:
-        for child_data in account_data["children"]:
-            create_account(exercise_id, child_data, account.id)
+
+    bump_chart_version(exercise_id)
+
+    logger.info(f"{len(parents)} account(s) seeded for exercise {exercise_id}")
+    return len(parents)
+
+def clone_chart(source_exercise_id, target_exercise_id):
+    """
+    Copy the chart of accounts of an exercise into another one with a single
+    INSERT ... SELECT, then relink the parents by account number and rebuild
+    the paths. Returns the number of accounts copied. Does not commit.
+    """
+    table = Account.__table__
+    now = datetime.utcnow()
+    columns = ['account_number', 'name', 'description', 'account_type', 'is_active', 'is_system']
+
+    result = db.session.execute(table.insert().from_select(
+        columns + ['exercise_id', 'created_at', 'updated_at'],
+        db.select(
+            *[table.c[column] for column in columns],
+            db.literal(target_exercise_id),
+            db.literal(now),
+            db.literal(now)
+        ).where(
+            table.c.exercise_id == source_exercise_id
+        ).order_by(table.c.id)
+    ))
+
+    # Parent of a copy = copy of the parent of its source account, matched by account number
+    source_child = table.alias('source_child')
+    source_parent = table.alias('source_parent')
+    target_parent = table.alias('target_parent')
+    parent_copy_id = db.select(db.func.max(target_parent.c.id)).select_from(
+        source_child.join(source_parent, source_child.c.parent_id == source_parent.c.id)
+    ).join(
+        target_parent, target_parent.c.account_number == source_parent.c.account_number
+    ).where(
+        source_child.c.exercise_id == source_exercise_id,
+        source_child.c.account_number == table.c.account_number,
+        target_parent.c.exercise_id == target_exercise_id
+    ).scalar_subquery()
+
+    db.session.execute(table.update().where(
+        table.c.exercise_id == target_exercise_id
+    ).values(parent_id=parent_copy_id))
+
+    rebuild_account_paths(target_exercise_id)
+    bump_chart_version(target_exercise_id)
+
+    logger.info(f"{result.rowcount} account(s) copied from exercise {source_exercise_id} to {target_exercise_id}")
+    return result.rowcount
 
 def initialize_ohada_accounts(exercise_id):
     """Initialize OHADA accounts for an exercise"""
@@ -289,8 +376,7 @@ def initialize_ohada_accounts(exercise_id):
             return True
         
         # Create the OHADA accounts
-        for account_data in OHADA_ACCOUNTS:
-            create_account(exercise_id, account_data)
+        seed_chart(exercise_id)
         
         db.session.commit()
         logger.info(f"OHADA accounts initialized for exercise {exercise_id}")
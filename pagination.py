@@ -0,0 +1,68 @@
+import json
+import base64
+import logging
+from datetime import date, datetime
+
+from flask import render_template, jsonify
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def page_size_arg(value, default=DEFAULT_PAGE_SIZE):
+    """Clamp a requested page size (e.g. from request.args) to [1, MAX_PAGE_SIZE]"""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return min(max(size, 1), MAX_PAGE_SIZE)
+
+def encode_cursor(sort_value, row_id):
+    """Encode the position after a row as an opaque URL-safe cursor"""
+    if isinstance(sort_value, (date, datetime)):
+        sort_value = sort_value.isoformat()
+    payload = json.dumps([sort_value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, sort_column):
+    """Decode a cursor into (sort value, id), typed after the sort column. Raises ValueError if invalid."""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(payload)
+        python_type = sort_column.type.python_type
+        if python_type is datetime:
+            sort_value = datetime.fromisoformat(sort_value)
+        elif python_type is date:
+            sort_value = date.fromisoformat(sort_value)
+        return sort_value, int(row_id)
+    except (ValueError, TypeError, json.JSONDecodeError, NotImplementedError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def keyset_page(query, sort_column, id_column, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return one page of a query ordered by (sort_column, id_column) descending,
+    seeking past the cursor with a row-value comparison instead of an OFFSET, so every
+    page costs the same on an index ending with (sort_column, id).
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor, sort_column)
+        query = query.filter(db.tuple_(sort_column, id_column) < db.tuple_(sort_value, row_id))
+
+    # One extra row tells whether another page follows
+    rows = query.order_by(sort_column.desc(), id_column.desc()).limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+
+    return rows, next_cursor
+
+def page_response(template_name, next_cursor, **context):
+    """JSON response of a "load more" request: the rendered rows and the cursor of the next page"""
+    return jsonify({'html': render_template(template_name, **context), 'next_cursor': next_cursor})
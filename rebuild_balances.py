@@ -0,0 +1,23 @@
+import sys
+import json
+from app import app
+from balance_store import rebuild_balances
+
+def main():
+    """Recalcule les soldes stockés à partir des écritures comptabilisées et signale les écarts"""
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    exercise_id = int(args[0]) if args else None
+    dry_run = '--dry-run' in sys.argv
+
+    with app.app_context():
+        report = rebuild_balances(exercise_id, dry_run=dry_run)
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if report['drift']:
+        print(f"\n{len(report['drift'])} compte(s) présentaient un écart avec les écritures.")
+    else:
+        print("\nAucun écart détecté.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os
+import atexit
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from models import Exercise
+from daily_cube import get_period_account_totals
+from ledger_builder import build_ledger
+from journal_export import iter_journal_rows
+from closing_snapshot import get_closing_snapshot, SNAPSHOT_REPORTS
+from report_cache import remove_stale_reports, report_version
+from document_generator import (report_file_path, write_report_file, journal_from_rows,
+                                balance_sheet_from_totals, income_statement_from_totals,
+                                trial_balance_from_totals, general_ledger_from_ledger)
+
+logger = logging.getLogger(__name__)
+
+# Year-end pack of an exercise
+BUNDLE_REPORTS = ('journal', 'general_ledger', 'trial_balance', 'balance_sheet', 'income_statement')
+
+# Statements built from the per-account totals
+TOTALS_REPORTS = ('trial_balance', 'balance_sheet', 'income_statement')
+
+# Processes writing the report files. 1 (default) renders in the calling process, as a web
+# worker should; batch jobs can set more, rendering is CPU-bound and threads would share the GIL
+BUNDLE_WORKERS = int(os.environ.get('REPORT_BUNDLE_WORKERS', 1))
+
+# Start method of the rendering processes: forked children inherit the loaded modules, while
+# spawn and forkserver (the default from Python 3.14) would re-import the app in each of them
+BUNDLE_START_METHOD = os.environ.get('REPORT_BUNDLE_START_METHOD', 'fork')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor(max_workers):
+    """Return the process pool of the report rendering, created once per process"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=max_workers,
+                                            mp_context=multiprocessing.get_context(BUNDLE_START_METHOD))
+            atexit.register(_executor.shutdown)
+            logger.info(f"Report rendering pool started ({max_workers} {BUNDLE_START_METHOD} workers)")
+        return _executor
+
+def build_bundle_data(exercise, report_types=BUNDLE_REPORTS):
+    """
+    Build the data of several statements of a whole exercise from shared aggregates:
+    the per-account totals are read once from the daily cube for the trial balance, balance sheet and
+    income statement (which therefore share the same net income), and the ledger
+    lines once for the general ledger. Closed exercises use their snapshots.
+    Returns {report_type: data}.
+    """
+    unsupported = [report_type for report_type in report_types if report_type not in BUNDLE_REPORTS]
+    if unsupported:
+        raise ValueError(f"Unsupported report type: {', '.join(unsupported)}")
+
+    start_date, end_date = exercise.start_date, exercise.end_date
+    bundle = {}
+
+    for report_type in report_types:
+        if report_type in SNAPSHOT_REPORTS:
+            snapshot = get_closing_snapshot(exercise, report_type)
+            if snapshot is not None:
+                bundle[report_type] = snapshot
+
+    pending = [report_type for report_type in report_types if report_type not in bundle]
+
+    if any(report_type in TOTALS_REPORTS for report_type in pending):
+        account_totals = get_period_account_totals(exercise.id, start_date=start_date, end_date=end_date)
+        if 'trial_balance' in pending:
+            bundle['trial_balance'] = trial_balance_from_totals(exercise, end_date, account_totals)
+        if 'balance_sheet' in pending:
+            bundle['balance_sheet'] = balance_sheet_from_totals(exercise, end_date, account_totals)
+        if 'income_statement' in pending:
+            bundle['income_statement'] = income_statement_from_totals(exercise, start_date, end_date, account_totals)
+
+    if 'general_ledger' in pending:
+        ledger = build_ledger(exercise.id, start_date, end_date)
+        bundle['general_ledger'] = general_ledger_from_ledger(exercise, start_date, end_date, ledger)
+
+    if 'journal' in pending:
+        bundle['journal'] = journal_from_rows(exercise, start_date, end_date, iter_journal_rows(exercise.id, start_date, end_date))
+
+    return bundle
+
+def generate_report_bundle(exercise_id, report_types=BUNDLE_REPORTS, formats=('html',), max_workers=BUNDLE_WORKERS):
+    """
+    Generate several statements of an exercise in the given formats.
+    Files already rendered for the current ledger and chart versions are reused, the data of the
+    others is built once by build_bundle_data and their files are written in this process,
+    or in parallel by the shared pool of worker processes when max_workers is above 1.
+    Returns ({report_type: {format: file path}}, {report_type: error message}).
+    """
+    exercise = Exercise.query.get_or_404(exercise_id)
+
+    paths = {}
+    missing = {}
+    reports_dir = None
+    for report_type in report_types:
+        for format in formats:
+            reports_dir, file_path = report_file_path(exercise, report_type, format)
+            paths.setdefault(report_type, {})[format] = file_path
+            if not os.path.exists(file_path):
+                missing.setdefault(report_type, []).append(format)
+
+    if not missing:
+        return paths, {}
+
+    bundle = build_bundle_data(exercise, list(missing))
+
+    jobs = [(report_type, format) for report_type, report_formats in missing.items() for format in report_formats]
+    errors = {}
+
+    def record_error(report_type, e):
+        logger.error(f"Error writing the {report_type} report of exercise {exercise_id}: {str(e)}")
+        errors[report_type] = str(e)
+        paths.pop(report_type, None)
+
+    if max_workers <= 1 or len(jobs) == 1:
+        for report_type, format in jobs:
+            try:
+                write_report_file(bundle[report_type], paths[report_type][format], report_type, format)
+            except Exception as e:
+                record_error(report_type, e)
+    else:
+        # The report data (loaded accounts, Decimals, dates) is pickled to the workers,
+        # rendering only reads it so it needs no session or app context
+        executor = _get_executor(max_workers)
+        futures = {
+            executor.submit(write_report_file, bundle[report_type], paths[report_type][format], report_type, format): report_type
+            for report_type, format in jobs
+        }
+        for future, report_type in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                record_error(report_type, e)
+
+    remove_stale_reports(reports_dir, exercise.id, report_version(exercise.ledger_version, exercise.chart_version))
+
+    return paths, errors
@@ -0,0 +1,108 @@
+import os
+import glob
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Bounds of the in-memory cache of rendered reports
+REPORT_CACHE_MAX_ENTRIES = 64
+REPORT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+class ReportCache:
+    """Thread-safe LRU cache of rendered report files, bounded by entries and total size"""
+
+    def __init__(self, max_entries=REPORT_CACHE_MAX_ENTRIES, max_bytes=REPORT_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached content for a key, or None"""
+        with self._lock:
+            content = self._entries.get(key)
+            if content is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return content
+
+    def set(self, key, content):
+        """Store content, evicting the least recently used entries if needed"""
+        if len(content) > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+
+            self._entries[key] = content
+            self.size += len(content)
+
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def invalidate_stale(self, exercise_id, version):
+        """Drop the cached reports of an exercise rendered for an older version (see report_version)"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == exercise_id and key[-1] != version]:
+                self.size -= len(self._entries.pop(key))
+
+    def stats(self):
+        """Return hit/miss statistics of the cache"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits / total) * 100 if total > 0 else 0
+            }
+
+report_cache = ReportCache()
+
+def report_version(ledger_version, chart_version):
+    """
+    Version of the reports of an exercise: they change with its transactions (ledger version)
+    and with its accounts, renamed or deactivated (chart version)
+    """
+    return f"{ledger_version or 0}.{chart_version or 0}"
+
+def report_cache_key(exercise_id, report_type, format, start_date, end_date, account_id, version):
+    """Build the cache key of a rendered report for a version returned by report_version"""
+    return (
+        exercise_id,
+        report_type,
+        format,
+        start_date.isoformat() if start_date else None,
+        end_date.isoformat() if end_date else None,
+        account_id,
+        version
+    )
+
+def report_cache_filename(key):
+    """Return the deterministic file name of a rendered report"""
+    exercise_id, report_type, format = key[:3]
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:12]
+    return f"{report_type}_{exercise_id}_v{key[-1]}_{digest}.{format}"
+
+def remove_stale_reports(reports_dir, exercise_id, version):
+    """Delete the report files rendered for older versions of an exercise"""
+    current = f"_{exercise_id}_v{version}_"
+    for file_path in glob.glob(os.path.join(reports_dir, f"*_{exercise_id}_v*_*")):
+        if current in os.path.basename(file_path):
+            continue
+        try:
+            os.remove(file_path)
+        except OSError as e:
+            logger.warning(f"Unable to remove stale report {file_path}: {str(e)}")
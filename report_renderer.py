@@ -0,0 +1,78 @@
+import os
+import logging
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, TemplateNotFound, select_autoescape
+
+from utils import format_currency, format_date
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+REPORT_TEMPLATE_PREFIX = 'reports/'
+GENERIC_REPORT_TEMPLATE = 'reports/generic.html'
+
+# Compiled templates survive restarts in this directory (a per-user temporary directory by default)
+REPORT_BYTECODE_CACHE_DIR = os.environ.get('REPORT_BYTECODE_CACHE_DIR')
+
+class ReportRenderer:
+    """
+    Long-lived Jinja2 environment of the report templates.
+    Templates are compiled once, kept in memory and in a bytecode cache on disk,
+    and can be rendered as a stream so a large ledger is never held as one string.
+    """
+
+    def __init__(self, template_dir=TEMPLATE_DIR, bytecode_cache_dir=REPORT_BYTECODE_CACHE_DIR):
+        if bytecode_cache_dir:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+        self.environment = Environment(
+            loader=FileSystemLoader(template_dir),
+            bytecode_cache=FileSystemBytecodeCache(bytecode_cache_dir),
+            autoescape=select_autoescape(['html']),
+            # Templates are only reloaded on restart, no stat() of the file per render
+            auto_reload=False,
+            cache_size=-1
+        )
+        self.environment.globals.update(format_currency=format_currency, format_date=format_date)
+
+    def precompile(self):
+        """Compile every report template up front and return their names"""
+        names = self.environment.list_templates(filter_func=lambda name: name.startswith(REPORT_TEMPLATE_PREFIX))
+        for name in names:
+            self.environment.get_template(name)
+        logger.info(f"{len(names)} report templates compiled")
+        return names
+
+    def get_template(self, report_type):
+        """Return the compiled template of a report type, or the generic one"""
+        try:
+            return self.environment.get_template(f"{REPORT_TEMPLATE_PREFIX}{report_type}.html")
+        except TemplateNotFound:
+            logger.debug(f"No template for report type {report_type}, using the generic one")
+            return self.environment.get_template(GENERIC_REPORT_TEMPLATE)
+
+    def render(self, report_type, data):
+        """Render a report to a string"""
+        return self.get_template(report_type).render(report_type=report_type, **data)
+
+    def generate(self, report_type, data):
+        """Render a report as a generator of text fragments, e.g. for a streamed response"""
+        return self.get_template(report_type).generate(report_type=report_type, **data)
+
+    def stream(self, report_type, data, buffer_size=None):
+        """Render a report as a TemplateStream, optionally buffered by buffer_size fragments"""
+        stream = self.get_template(report_type).stream(report_type=report_type, **data)
+        if buffer_size:
+            stream.enable_buffering(buffer_size)
+        return stream
+
+    def render_to_file(self, report_type, data, file_path, buffer_size=64):
+        """Stream a report straight into a file"""
+        self.stream(report_type, data, buffer_size).dump(file_path, encoding='utf-8')
+
+report_renderer = ReportRenderer()
+
+# Compile the report templates at startup rather than on the first request
+try:
+    report_renderer.precompile()
+except Exception as e:
+    logger.error(f"Report templates could not be compiled: {str(e)}")
@@ -1,7 +1,6 @@
 import os
 import uuid
 import logging
-import xlsxwriter
 import traceback
 
 # Configurez le logger
@@ -10,9 +9,10 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-from flask import render_template, request, redirect, url_for, flash, abort, send_file, jsonify, session
+from flask import render_template, request, redirect, url_for, flash, abort, send_file, jsonify, session, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import HTTPException
 from datetime import datetime
 from sqlalchemy.exc import SQLAlchemyError
 from ecriture_generator import ComptableIA
@@ -29,7 +29,7 @@ from models import User, Exercise, Account, Transaction, TransactionItem, Docume
 from routes_social import *
 from forms import (
     LoginForm, RegistrationForm, ProfileForm, ExerciseForm, AccountForm, 
-    TransactionForm, DocumentUploadForm, ReportGenerationForm, ForgotPasswordForm, 
+    TransactionForm, DocumentUploadForm, JournalImportForm, ReportGenerationForm, ForgotPasswordForm, 
     ResetPasswordForm, TextProcessingForm, ExerciseExampleUploadForm, ExerciseSolverForm,
     WorkgroupForm, MessageForm, NoteForm, MemberInviteForm, WorkgroupExerciseForm, SearchForm,
     CompleteExerciseSolverForm
@@ -65,33 +65,29 @@ from models import ExerciseExample, ExerciseSolution
 import json
 import os
 from utils import allowed_file, ensure_upload_dir, format_amount, parse_amount
-from accounting_processor import create_transaction_from_document, post_transaction, auto_categorize_transaction
+from accounting_processor import create_transaction_from_document, post_transaction, post_transactions, auto_categorize_transaction
+from balance_store import apply_transaction, bump_ledger_version, refresh_transaction_totals
+from ohada_init import BASE_ACCOUNTS, seed_chart, clone_chart
+from account_index import get_account_index, bump_chart_version
+from account_hierarchy import set_account_path, move_account, ensure_account_paths, get_hierarchy_balances
+from closing_snapshot import create_closing_snapshots
+from journal_export import iter_journal_csv, export_journal_xlsx, iter_file_and_remove
+from columnar_export import export_columnar, scope_exercise_ids, COLUMNAR_FORMATS, ColumnarExportError
+from journal_import import import_journal, JournalImportError
+from document_generator import get_report_content, stream_html_report
+from comparative_reports import get_comparative_report, DEFAULT_YEARS
+from pagination import keyset_page, page_size_arg, page_response
+from balance_series import get_balance_series_json
 from ocr_processor import process_document_ocr
 from nlp_processor import extract_data_from_text
 
-def create_base_chart_of_accounts(exercise_id):
-    """Crée un plan comptable de base OHADA pour un exercice"""
+def create_base_chart_of_accounts(exercise_id, source_exercise_id=None):
+    """Crée le plan comptable d'un nouvel exercice : copie de celui d'un autre exercice ou plan de base OHADA"""
     try:
-        base_accounts = [
-            {'number': '10', 'name': 'Capital', 'type': 'capital'},
-            {'number': '21', 'name': 'Immobilisations corporelles', 'type': 'actif'},
-            {'number': '41', 'name': 'Clients et comptes rattachés', 'type': 'actif'},
-            {'number': '51', 'name': 'Valeurs mobilières de placement', 'type': 'actif'},
-            {'number': '52', 'name': 'Banques et établissements financiers', 'type': 'actif'},
-            {'number': '53', 'name': 'Caisse', 'type': 'actif'},
-            {'number': '60', 'name': 'Achats et variations de stocks', 'type': 'charge'},
-            {'number': '70', 'name': 'Ventes', 'type': 'produit'},
-        ]
-
-        for acc_data in base_accounts:
-            account = Account(
-                account_number=acc_data['number'],
-                name=acc_data['name'],
-                account_type=acc_data['type'],
-                exercise_id=exercise_id,
-                is_active=True
-            )
-            db.session.add(account)
+        if source_exercise_id:
+            clone_chart(source_exercise_id, exercise_id)
+        else:
+            seed_chart(exercise_id, BASE_ACCOUNTS, is_system=False)
 
         logger.info(f"Plan comptable de base créé pour l'exercice {exercise_id}")
     except Exception as e:
@@ -612,8 +608,35 @@ def dashboard():
 @app.route('/exercises')
 @login_required
 def exercises_list():
-    exercises = Exercise.query.filter_by(user_id=current_user.id).order_by(Exercise.start_date.desc()).all()
-    return render_template('exercises/list.html', title='Exercices', exercises=exercises)
+    exercises, next_cursor, transaction_counts = _exercises_page()
+    return render_template('exercises/list.html', title='Exercices', exercises=exercises,
+                           next_cursor=next_cursor, transaction_counts=transaction_counts)
+
+@app.route('/api/exercises')
+@login_required
+def exercises_page():
+    """Page suivante de la liste des exercices (défilement infini)"""
+    exercises, next_cursor, transaction_counts = _exercises_page()
+    return page_response('exercises/_rows.html', next_cursor, exercises=exercises, transaction_counts=transaction_counts)
+
+def _exercises_page():
+    """Load the page of exercises after request.args['cursor'], with their transaction counts in one grouped query"""
+    try:
+        exercises, next_cursor = keyset_page(
+            Exercise.query.filter_by(user_id=current_user.id),
+            Exercise.start_date, Exercise.id,
+            request.args.get('cursor'), page_size_arg(request.args.get('page_size'))
+        )
+    except ValueError:
+        abort(400)
+
+    transaction_counts = dict(db.session.query(
+        Transaction.exercise_id, db.func.count(Transaction.id)
+    ).filter(
+        Transaction.exercise_id.in_([exercise.id for exercise in exercises])
+    ).group_by(Transaction.exercise_id).all()) if exercises else {}
+
+    return exercises, next_cursor, transaction_counts
 
 @app.route('/exercises/<int:exercise_id>')
 @login_required
@@ -642,6 +665,9 @@ def view_exercise(exercise_id):
 def exercise_new():
     """Créer un nouvel exercice."""
     form = ExerciseForm()
+    form.source_exercise_id.choices = [(0, 'Plan comptable de base')] + [
+        (e.id, e.name) for e in Exercise.query.filter_by(user_id=current_user.id).order_by(Exercise.start_date.desc()).all()
+    ]
 
     if form.validate_on_submit():
         try:
@@ -658,7 +684,7 @@ def exercise_new():
 
             # Créer le plan comptable de base pour cet exercice
             try:
-                create_base_chart_of_accounts(exercise.id)
+                create_base_chart_of_accounts(exercise.id, form.source_exercise_id.data or None)
                 db.session.commit()
             except Exception as e:
                 logger.error(f"Erreur lors de la création du plan comptable: {e}")
@@ -693,6 +719,7 @@ def exercise_edit(exercise_id):
         abort(403)
 
     form = ExerciseForm(obj=exercise)
+    del form.source_exercise_id  # The chart is only chosen at creation
 
     if form.validate_on_submit():
         exercise.name = form.name.data
@@ -716,6 +743,12 @@ def exercise_close(exercise_id):
     if exercise.user_id != current_user.id:
         abort(403)
 
+    if exercise.is_closed:
+        flash('Cet exercice est déjà clôturé.', 'info')
+        return redirect(url_for('exercises_list'))
+
+    # Freeze the final reports before closing so historical reporting reads the snapshot
+    create_closing_snapshots(exercise)
     exercise.is_closed = True
     db.session.commit()
 
@@ -844,9 +877,10 @@ def accounts_list(exercise_id):
     if exercise.user_id != current_user.id:
         abort(403)
 
-    accounts = Account.query.filter_by(exercise_id=exercise_id, parent_id=None).order_by(Account.account_number).all()
+    # Accounts in tree order with their subtree totals, from a single query
+    hierarchy = get_hierarchy_balances(exercise_id)
 
-    return render_template('accounts/list.html', title='Plan comptable', exercise=exercise, accounts=accounts)
+    return render_template('accounts/list.html', title='Plan comptable', exercise=exercise, hierarchy=hierarchy)
 
 @app.route('/exercises/<int:exercise_id>/accounts/new', methods=['GET', 'POST'])
 @login_required
@@ -865,9 +899,7 @@ def account_new(exercise_id):
     form = AccountForm()
 
     # Load parent accounts for dropdown
-    form.parent_id.choices = [(0, 'Aucun')] + [
-        (a.id, a.full_name) for a in Account.query.filter_by(exercise_id=exercise_id).order_by(Account.account_number).all()
-    ]
+    form.parent_id.choices = [(0, 'Aucun')] + get_account_index(exercise_id).choices(active_only=False)
 
     if form.validate_on_submit():
         parent_id = form.parent_id.data if form.parent_id.data != 0 else None
@@ -882,6 +914,8 @@ def account_new(exercise_id):
         )
 
         db.session.add(account)
+        set_account_path(account)
+        bump_chart_version(exercise_id)
         db.session.commit()
 
         flash('Compte créé avec succès!', 'success')
@@ -916,9 +950,7 @@ def create_account():
     form = AccountForm()
 
     # Load parent accounts for dropdown
-    form.parent_id.choices = [(0, 'Aucun')] + [
-        (a.id, a.full_name) for a in Account.query.filter_by(exercise_id=exercise_id).order_by(Account.account_number).all()
-    ]
+    form.parent_id.choices = [(0, 'Aucun')] + get_account_index(exercise_id).choices(active_only=False)
 
     if form.validate_on_submit():
         parent_id = form.parent_id.data if form.parent_id.data != 0 else None
@@ -933,6 +965,8 @@ def create_account():
         )
 
         db.session.add(account)
+        set_account_path(account)
+        bump_chart_version(exercise_id)
         db.session.commit()
 
         flash('Compte créé avec succès!', 'success')
@@ -957,19 +991,11 @@ def account_edit(account_id):
 
     form = AccountForm(obj=account)
 
-    # Load parent accounts for dropdown, excluding the current account and its children
-    def get_child_ids(account_id):
-        ids = [account_id]
-        children = Account.query.filter_by(parent_id=account_id).all()
-        for child in children:
-            ids.extend(get_child_ids(child.id))
-        return ids
-
-    excluded_ids = get_child_ids(account_id)
-
+    # Load parent accounts for dropdown, excluding the current account and its subtree
+    ensure_account_paths(exercise.id)
     form.parent_id.choices = [(0, 'Aucun')] + [
         (a.id, a.full_name) for a in Account.query.filter_by(exercise_id=exercise.id).filter(
-            Account.id.notin_(excluded_ids)
+            ~Account.path.startswith(account.path)
         ).order_by(Account.account_number).all()
     ]
 
@@ -980,7 +1006,10 @@ def account_edit(account_id):
         account.name = form.name.data
         account.account_type = form.account_type.data
         account.description = form.description.data
-        account.parent_id = parent_id
+        if account.parent_id != parent_id:
+            move_account(account, parent_id)
+            bump_ledger_version(exercise.id)
+        bump_chart_version(exercise.id)
 
         db.session.commit()
 
@@ -1005,6 +1034,7 @@ def account_toggle(account_id):
         return redirect(url_for('accounts_list', exercise_id=exercise.id))
 
     account.is_active = not account.is_active
+    bump_chart_version(exercise.id)
     db.session.commit()
 
     status = 'activé' if account.is_active else 'désactivé'
@@ -1022,9 +1052,47 @@ def transactions_list(exercise_id):
     if exercise.user_id != current_user.id:
         abort(403)
 
-    transactions = Transaction.query.filter_by(exercise_id=exercise_id).order_by(Transaction.transaction_date.desc()).all()
+    journal, next_cursor = _journal_page(exercise_id)
+    return render_template('transactions/list.html', title='Journal', exercise=exercise, journal=journal, next_cursor=next_cursor)
 
-    return render_template('transactions/list.html', title='Journal', exercise=exercise, transactions=transactions)
+@app.route('/api/exercises/<int:exercise_id>/transactions')
+@login_required
+def transactions_page(exercise_id):
+    """Page suivante du journal (défilement infini)"""
+    exercise = Exercise.query.get_or_404(exercise_id)
+
+    if exercise.user_id != current_user.id:
+        abort(403)
+
+    journal, next_cursor = _journal_page(exercise_id)
+    return page_response('transactions/_rows.html', next_cursor, exercise=exercise, journal=journal)
+
+def _journal_page(exercise_id):
+    """
+    Load the page of transactions after request.args['cursor'], then their lines and
+    account numbers in one query; totals are stored on the transaction
+    """
+    try:
+        transactions, next_cursor = keyset_page(
+            Transaction.query.filter(Transaction.exercise_id == exercise_id),
+            Transaction.transaction_date, Transaction.id,
+            request.args.get('cursor'), page_size_arg(request.args.get('page_size'))
+        )
+    except ValueError:
+        abort(400)
+
+    journal = [(transaction, []) for transaction in transactions]
+    lines = {transaction.id: transaction_lines for transaction, transaction_lines in journal}
+    if transactions:
+        rows = db.session.query(TransactionItem, Account.account_number).outerjoin(
+            Account, TransactionItem.account_id == Account.id
+        ).filter(
+            TransactionItem.transaction_id.in_(lines)
+        ).order_by(TransactionItem.id).all()
+        for item, account_number in rows:
+            lines[item.transaction_id].append((item, account_number))
+
+    return journal, next_cursor
 
 @app.route('/exercises/<int:exercise_id>/transactions/new', methods=['GET', 'POST'])
 @login_required
@@ -1071,13 +1139,18 @@ def transaction_new(exercise_id):
                 )
                 db.session.add(transaction_item)
 
+        refresh_transaction_totals([transaction.id])
+        if transaction.is_posted:
+            apply_transaction(transaction)
+        bump_ledger_version(transaction.exercise_id)
+
         db.session.commit()
 
         flash('Transaction créée avec succès!', 'success')
         return redirect(url_for('transactions_list', exercise_id=exercise_id))
 
     # Load accounts for dropdown
-    accounts = Account.query.filter_by(exercise_id=exercise_id, is_active=True).order_by(Account.account_number).all()
+    accounts = get_account_index(exercise_id).active_accounts()
 
     return render_template('transactions/form.html', title='Nouvelle transaction', form=form, exercise=exercise, accounts=accounts)
 
@@ -1107,6 +1180,10 @@ def transaction_edit(transaction_id):
     form.setup_transaction_items(transaction)
 
     if form.validate_on_submit():
+        # Take the previous version out of the stored balances before changing it
+        if transaction.is_posted:
+            apply_transaction(transaction, direction=-1)
+
         transaction.reference = form.reference.data
         transaction.transaction_date = form.transaction_date.data
         transaction.description = form.description.data
@@ -1128,13 +1205,18 @@ def transaction_edit(transaction_id):
                 )
                 db.session.add(transaction_item)
 
+        refresh_transaction_totals([transaction.id])
+        if transaction.is_posted:
+            apply_transaction(transaction)
+        bump_ledger_version(transaction.exercise_id)
+
         db.session.commit()
 
         flash('Transaction mise à jour avec succès!', 'success')
         return redirect(url_for('transactions_list', exercise_id=exercise.id))
 
     # Load accounts for dropdown
-    accounts = Account.query.filter_by(exercise_id=exercise.id, is_active=True).order_by(Account.account_number).all()
+    accounts = get_account_index(exercise.id).active_accounts()
 
     return render_template('transactions/form.html', title='Modifier transaction', form=form, exercise=exercise, transaction=transaction, accounts=accounts)
 
@@ -1173,6 +1255,54 @@ def transaction_post(transaction_id):
 
     return redirect(url_for('transaction_view', transaction_id=transaction_id))
 
+@app.route('/exercises/<int:exercise_id>/transactions/post', methods=['POST'])
+@login_required
+def transactions_bulk_post(exercise_id):
+    exercise = Exercise.query.get_or_404(exercise_id)
+
+    # Check if user has permission
+    if exercise.user_id != current_user.id:
+        abort(403)
+
+    # Ids from a JSON body or from the form, all the drafts of the exercise by default
+    if request.is_json:
+        transaction_ids = (request.get_json(silent=True) or {}).get('transaction_ids') or []
+    else:
+        transaction_ids = request.form.getlist('transaction_ids')
+
+    try:
+        transaction_ids = [int(transaction_id) for transaction_id in transaction_ids]
+    except (TypeError, ValueError):
+        if request.is_json:
+            return jsonify({'success': False, 'message': 'Identifiants de transaction invalides'}), 400
+        abort(400)
+
+    if not transaction_ids:
+        transaction_ids = [transaction_id for transaction_id, in db.session.query(Transaction.id).filter(
+            Transaction.exercise_id == exercise_id,
+            Transaction.is_posted == False
+        ).all()]
+
+    result = post_transactions(transaction_ids, exercise_id)
+
+    if request.is_json:
+        return jsonify({
+            'success': bool(result['posted']) or not result['rejected'],
+            'posted': result['posted'],
+            'rejected': {str(transaction_id): reason for transaction_id, reason in result['rejected'].items()}
+        })
+
+    if result['posted']:
+        flash(f"{len(result['posted'])} transaction(s) comptabilisée(s) avec succès!", 'success')
+    if result['rejected']:
+        flash(f"{len(result['rejected'])} transaction(s) rejetée(s): " + '; '.join(
+            f"#{transaction_id} {reason}" for transaction_id, reason in sorted(result['rejected'].items())[:10]
+        ), 'warning')
+    if not result['posted'] and not result['rejected']:
+        flash('Aucune transaction en brouillon à comptabiliser.', 'info')
+
+    return redirect(url_for('transactions_list', exercise_id=exercise_id))
+
 @app.route('/transactions/<int:transaction_id>/delete', methods=['POST'])
 @login_required
 def transaction_delete(transaction_id):
@@ -1193,6 +1323,10 @@ def transaction_delete(transaction_id):
         flash('Impossible de supprimer une transaction déjà comptabilisée.', 'danger')
         return redirect(url_for('transaction_view', transaction_id=transaction_id))
 
+    if transaction.is_posted:
+        apply_transaction(transaction, direction=-1)
+    bump_ledger_version(transaction.exercise_id)
+
     # Delete transaction (cascade will delete items)
     db.session.delete(transaction)
     db.session.commit()
@@ -1209,74 +1343,206 @@ def journal_export(exercise_id):
     if exercise.user_id != current_user.id:
         abort(403)
 
-    # Get all transactions for the exercise
-    transactions = Transaction.query.filter_by(exercise_id=exercise_id).order_by(Transaction.transaction_date).all()
-
-    # Create Excel file
-    filename = f"journal_{exercise.name}_{datetime.now().strftime('%Y%m%d%H%M%S')}.xlsx"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-
-    workbook = xlsxwriter.Workbook(filepath)
-    worksheet = workbook.add_worksheet('Journal')
-
-    # Add formats
-    header_format = workbook.add_format({
-        'bold': True,
-        'bg_color': '#333333',
-        'font_color': 'white',
-        'border': 1
-    })
-
-    date_format = workbook.add_format({
-        'num_format': 'dd/mm/yyyy',
-        'border': 1
-    })
-
-    cell_format = workbook.add_format({
-        'border': 1
-    })
-
-    number_format = workbook.add_format({
-        'num_format': '# ##0.00',
-        'border': 1
-    })
-
-    # Set column widths
-    worksheet.set_column('A:A', 12)  # Date
-    worksheet.set_column('B:B', 12)  # Référence
-    worksheet.set_column('C:C', 15)  # N° Compte
-    worksheet.set_column('D:D', 40)  # Libellé
-    worksheet.set_column('E:E', 15)  # Débit
-    worksheet.set_column('F:F', 15)  # Crédit
-
-    # Write headers
-    headers = ['Date', 'Référence', 'N° Compte', 'Libellé', 'Débit', 'Crédit']
-    for col, header in enumerate(headers):
-        worksheet.write(0, col, header, header_format)
-
-    # Write data
-    row = 1
-    for transaction in transactions:
-        # Write transaction date and reference for first item only
-        first_item = True
-
-        for item in transaction.items:
-            worksheet.write(row, 0, transaction.transaction_date, date_format if first_item else cell_format)
-            worksheet.write(row, 1, transaction.reference, cell_format if first_item else cell_format)
-            worksheet.write(row, 2, item.account.account_number, cell_format)
-            worksheet.write(row, 3, item.description or transaction.description, cell_format)
-            worksheet.write(row, 4, float(item.debit_amount), number_format)
-            worksheet.write(row, 5, float(item.credit_amount), number_format)
-
-            first_item = False
-            row += 1
-
-        # Add a blank row between transactions
-        row += 1
-
-    workbook.close()
-
-    return send_file(filepath, as_attachment=True)
+    export_format = request.args.get('format', 'xlsx')
+    basename = secure_filename(f"journal_{exercise.name}_{datetime.now().strftime('%Y%m%d%H%M%S')}") or 'journal'
+
+    if export_format == 'csv':
+        # Rows are read and sent progressively, nothing is kept on disk
+        return Response(
+            stream_with_context(iter_journal_csv(exercise_id)),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename={basename}.csv'}
+        )
+
+    if export_format in ('parquet', 'arrow'):
+        return _columnar_export_response([exercise_id], export_format, basename,
+                                         url_for('transactions_list', exercise_id=exercise_id))
+
+    if export_format != 'xlsx':
+        abort(400)
+
+    # The workbook is built in constant memory mode, then streamed and removed
+    filepath = export_journal_xlsx(exercise_id)
+
+    return Response(
+        iter_file_and_remove(filepath),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        headers={
+            'Content-Disposition': f'attachment; filename={basename}.xlsx',
+            'Content-Length': str(os.path.getsize(filepath))
+        }
+    )
+
+@app.route('/exports/columnar')
+@login_required
+def columnar_export():
+    """Export en Parquet, Arrow ou CSV des écritures de tous les exercices de l'utilisateur ou d'un groupe de travail"""
+    export_format = request.args.get('format', 'parquet')
+    if export_format not in COLUMNAR_FORMATS:
+        abort(400)
+
+    workgroup_id = request.args.get('workgroup_id', type=int)
+    if workgroup_id is not None:
+        workgroup = Workgroup.query.get_or_404(workgroup_id)
+        if workgroup.owner_id != current_user.id and current_user not in workgroup.members:
+            abort(403)
+        exercise_ids = scope_exercise_ids(workgroup_id=workgroup_id)
+        basename = secure_filename(f"ecritures_{workgroup.name}_{datetime.now().strftime('%Y%m%d%H%M%S')}") or 'ecritures'
+    else:
+        exercise_ids = scope_exercise_ids(user_id=current_user.id)
+        basename = f"ecritures_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+
+    return _columnar_export_response(exercise_ids, export_format, basename, url_for('exercises_list'))
+
+def _columnar_export_response(exercise_ids, export_format, basename, error_url):
+    """Write a columnar export to a temporary file, then stream and remove it"""
+    try:
+        filepath = export_columnar(exercise_ids, export_format)
+    except ColumnarExportError as e:
+        flash(str(e), 'danger')
+        return redirect(error_url)
+
+    extension, mimetype = COLUMNAR_FORMATS[export_format]
+    return Response(
+        iter_file_and_remove(filepath),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename={basename}{extension}',
+            'Content-Length': str(os.path.getsize(filepath))
+        }
+    )
+
+@app.route('/exercises/<int:exercise_id>/journal/import', methods=['GET', 'POST'])
+@login_required
+def journal_import(exercise_id):
+    exercise = Exercise.query.get_or_404(exercise_id)
+
+    # Check if user has permission
+    if exercise.user_id != current_user.id:
+        abort(403)
+
+    # Check if exercise is closed
+    if exercise.is_closed:
+        flash('Impossible d\'importer des écritures sur un exercice clôturé.', 'danger')
+        return redirect(url_for('transactions_list', exercise_id=exercise_id))
+
+    form = JournalImportForm()
+    report = None
+
+    if form.validate_on_submit():
+        file = form.journal_file.data
+        file_format = file.filename.rsplit('.', 1)[-1].lower()
+
+        try:
+            # The upload is read as a stream, lines are inserted in batches
+            report = import_journal(exercise_id, current_user.id, file.stream, file_format,
+                                    is_posted=form.is_posted.data, dry_run=form.dry_run.data)
+        except JournalImportError as e:
+            flash(f'Import impossible: {str(e)}', 'danger')
+        else:
+            if report['dry_run']:
+                flash(f"Vérification terminée: {report['transactions']} écriture(s) valide(s), "
+                      f"{report['rejected_transactions']} rejetée(s).", 'info')
+            elif report['rejected_transactions']:
+                flash(f"{report['transactions']} écriture(s) importée(s), "
+                      f"{report['rejected_transactions']} rejetée(s).", 'warning')
+            else:
+                flash(f"{report['transactions']} écriture(s) importée(s) avec succès!", 'success')
+                return redirect(url_for('transactions_list', exercise_id=exercise_id))
+
+    return render_template('transactions/import.html', title='Importer un journal', form=form, exercise=exercise, report=report)
+
+@app.route('/exercises/<int:exercise_id>/reports/<report_type>')
+@login_required
+def report_download(exercise_id, report_type):
+    exercise = Exercise.query.get_or_404(exercise_id)
+
+    # Check if user has permission
+    if exercise.user_id != current_user.id:
+        abort(403)
+
+    report_format = request.args.get('format', 'html')
+    account_id = request.args.get('account_id', type=int)
+
+    try:
+        start_date = request.args.get('start_date')
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+        end_date = request.args.get('end_date')
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+
+        # Large ledgers can be streamed to the browser while the template renders, bypassing the cache
+        if report_format == 'html' and request.args.get('stream', type=int):
+            fragments = stream_html_report(exercise_id, report_type, start_date, end_date, account_id)
+            return Response(stream_with_context(fragments), mimetype='text/html')
+
+        # Served from the report cache as long as the ledger version is unchanged
+        filename, content = get_report_content(exercise_id, report_type, report_format, start_date, end_date, account_id)
+    except ValueError as e:
+        logger.warning(f"Invalid report request for exercise {exercise_id}: {str(e)}")
+        abort(400)
+
+    mimetype = 'text/html' if report_format == 'html' else 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    return Response(
+        content,
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@app.route('/exercises/<int:exercise_id>/reports/comparative/<report_type>')
+@login_required
+def comparative_report_download(exercise_id, report_type):
+    """États comparatifs (exercice N, N-1, ...) côte à côte, en HTML ou XLSX"""
+    exercise = Exercise.query.get_or_404(exercise_id)
+
+    # Compared with the user's earlier exercises, or with those shared in a workgroup they belong to
+    workgroup_id = request.args.get('workgroup_id', type=int)
+    if workgroup_id is not None:
+        workgroup = Workgroup.query.get_or_404(workgroup_id)
+        if workgroup.owner_id != current_user.id and current_user not in workgroup.members:
+            abort(403)
+        if exercise not in workgroup.exercises:
+            abort(404)
+    elif exercise.user_id != current_user.id:
+        abort(403)
+
+    report_format = request.args.get('format', 'html')
+    years = request.args.get('years', DEFAULT_YEARS, type=int)
+
+    try:
+        filename, content = get_comparative_report(exercise, report_type, report_format, years, workgroup_id)
+    except ValueError as e:
+        logger.warning(f"Invalid comparative report request for exercise {exercise_id}: {str(e)}")
+        abort(400)
+
+    mimetype = 'text/html' if report_format == 'html' else 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    return Response(
+        content,
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@app.route('/api/exercises/<int:exercise_id>/balance-series')
+@login_required
+def balance_series(exercise_id):
+    """Séries mensuelles ou hebdomadaires des soldes par compte ou par classe, pour les graphiques"""
+    exercise = Exercise.query.get_or_404(exercise_id)
+
+    # Check if user has permission
+    if exercise.user_id != current_user.id:
+        abort(403)
+
+    try:
+        # Served from the series cache as long as the ledger version is unchanged
+        content = get_balance_series_json(
+            exercise_id,
+            period=request.args.get('period', 'month'),
+            group_by=request.args.get('group_by', 'account'),
+            prefix=request.args.get('prefix') or None
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    return Response(content, mimetype='application/json')
 
 # Document routes
 @app.route('/exercises/<int:exercise_id>/documents')
@@ -1289,30 +1555,64 @@ def documents_list(exercise_id):
         if exercise.user_id != current_user.id:
             abort(403)
 
-        documents = Document.query.filter_by(exercise_id=exercise_id).order_by(Document.upload_date.desc()).all()
+        documents, next_cursor = _documents_page(Document.query.filter_by(exercise_id=exercise_id))
 
-        return render_template('documents/list.html', title='Documents', exercise=exercise, documents=documents)
+        return render_template('documents/list.html', title='Documents', exercise=exercise,
+                               documents=documents, next_cursor=next_cursor)
 
+    except HTTPException:
+        # 403, 404 et curseur invalide (400) ne sont pas des erreurs de chargement
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de l'affichage des documents pour l'exercice {exercise_id}: {str(e)}")
         flash(f"Erreur lors du chargement des documents: {str(e)}", 'danger')
         return redirect(url_for('exercises_list'))
 
+@app.route('/api/exercises/<int:exercise_id>/documents')
+@login_required
+def documents_page(exercise_id):
+    """Page suivante des documents d'un exercice (défilement infini)"""
+    exercise = Exercise.query.get_or_404(exercise_id)
+
+    if exercise.user_id != current_user.id:
+        abort(403)
+
+    documents, next_cursor = _documents_page(Document.query.filter_by(exercise_id=exercise_id))
+    return page_response('documents/_rows.html', next_cursor, documents=documents)
+
+def _documents_page(query):
+    """Load the page of documents of a query after request.args['cursor'], most recent first"""
+    try:
+        return keyset_page(query, Document.upload_date, Document.id,
+                           request.args.get('cursor'), page_size_arg(request.args.get('page_size')))
+    except ValueError:
+        abort(400)
+
 @app.route('/documents')
 @login_required
 def documents_general():
     """Route générale pour afficher tous les documents de l'utilisateur"""
     try:
-        # Récupérer tous les documents de l'utilisateur
-        documents = Document.query.filter_by(user_id=current_user.id).order_by(Document.upload_date.desc()).all()
+        # Première page des documents de l'utilisateur, les suivantes sont chargées au défilement
+        documents, next_cursor = _documents_page(Document.query.filter_by(user_id=current_user.id))
 
-        return render_template('documents/general_list.html', title='Mes Documents', documents=documents)
+        return render_template('documents/general_list.html', title='Mes Documents', documents=documents, next_cursor=next_cursor)
 
+    except HTTPException:
+        # 403, 404 et curseur invalide (400) ne sont pas des erreurs de chargement
+        raise
     except Exception as e:
         logger.error(f"Erreur lors de l'affichage des documents généraux: {str(e)}")
         flash(f"Erreur lors du chargement des documents: {str(e)}", 'danger')
         return redirect(url_for('dashboard'))
 
+@app.route('/api/documents')
+@login_required
+def documents_general_page():
+    """Page suivante de tous les documents de l'utilisateur (défilement infini)"""
+    documents, next_cursor = _documents_page(Document.query.filter_by(user_id=current_user.id))
+    return page_response('documents/_rows.html', next_cursor, documents=documents)
+
 @app.route('/exercises/<int:exercise_id>/documents/upload', methods=['GET', 'POST'])
 @login_required
 def document_upload(exercise_id):
@@ -1630,14 +1930,31 @@ def exercise_solver_form():
 @login_required
 def exercise_solutions_list():
     """Liste des solutions générées."""
-    solutions = ExerciseSolution.query.filter_by(user_id=current_user.id).order_by(ExerciseSolution.created_at.desc()).all()
+    solutions, next_cursor = _solutions_page()
 
     return render_template(
         'exercise_solver/solutions_list.html',
         title='Mes solutions d\'exercices',
-        solutions=solutions
+        solutions=solutions,
+        next_cursor=next_cursor
     )
 
+@app.route('/api/exercise-solutions')
+@login_required
+def exercise_solutions_page():
+    """Page suivante des solutions générées (défilement infini)"""
+    solutions, next_cursor = _solutions_page()
+    return page_response('exercise_solver/_solution_rows.html', next_cursor, solutions=solutions)
+
+def _solutions_page():
+    """Load the page of the user's solutions after request.args['cursor'], most recent first"""
+    try:
+        return keyset_page(ExerciseSolution.query.filter_by(user_id=current_user.id),
+                           ExerciseSolution.created_at, ExerciseSolution.id,
+                           request.args.get('cursor'), page_size_arg(request.args.get('page_size')))
+    except ValueError:
+        abort(400)
+
 @app.route('/exercise-solutions/<int:solution_id>')
 @login_required
 def exercise_solution_view(solution_id):
@@ -2329,20 +2646,48 @@ def workgroup_note_delete(workgroup_id, note_id):
 @login_required
 def notifications_list():
     """View all user notifications"""
-    notifications = Notification.query.filter_by(user_id=current_user.id).order_by(Notification.created_at.desc()).all()
-
-    # Mark all as read
-    for notification in notifications:
-        notification.is_read = True
-
-    db.session.commit()
+    notifications, next_cursor, unread_ids = _notifications_page()
 
     return render_template(
         'notifications/list.html',
         title='Notifications',
-        notifications=notifications
+        notifications=notifications,
+        next_cursor=next_cursor,
+        unread_ids=unread_ids
     )
 
+@app.route('/api/notifications')
+@login_required
+def notifications_page():
+    """Next page of the user notifications (infinite scroll)"""
+    notifications, next_cursor, unread_ids = _notifications_page()
+    return page_response('notifications/_items.html', next_cursor, notifications=notifications, unread_ids=unread_ids)
+
+def _notifications_page():
+    """
+    Load the page of notifications after request.args['cursor'] and mark the unread ones
+    as read in one UPDATE. Returns (notifications, next cursor, ids of those that were unread),
+    the ids being taken before the commit, which reloads the rows as read, so the
+    templates can still show their "new" badge.
+    """
+    try:
+        notifications, next_cursor = keyset_page(
+            Notification.query.filter_by(user_id=current_user.id),
+            Notification.created_at, Notification.id,
+            request.args.get('cursor'), page_size_arg(request.args.get('page_size'))
+        )
+    except ValueError:
+        abort(400)
+
+    unread_ids = {notification.id for notification in notifications if not notification.is_read}
+    if unread_ids:
+        Notification.query.filter(Notification.id.in_(unread_ids)).update(
+            {Notification.is_read: True}, synchronize_session=False
+        )
+        db.session.commit()
+
+    return notifications, next_cursor, unread_ids
+
 @app.route('/notifications/delete/<int:notification_id>', methods=['POST'])
 @login_required
 def notification_delete(notification_id):
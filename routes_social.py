@@ -125,19 +125,7 @@ def feed():
                             liked_posts=[],
                             liked_comments=[])
 
-# Page de notifications
-@app.route('/notifications')
-@login_required
-def notifications():
-    """Affiche les notifications de l'utilisateur"""
-    notifications = Notification.query.filter_by(user_id=current_user.id) \
-                        .order_by(Notification.created_at.desc()).all()
-
-    # Marque toutes les notifications comme lues
-    if notifications:
-        current_user.mark_notifications_as_read()
-
-    return render_template('social/notifications.html', notifications=notifications)
+# La page des notifications (/notifications) est servie par routes.notifications_list, paginée
 
 # API pour upload de fichier
 @app.route('/api/upload', methods=['POST'])
@@ -366,6 +366,56 @@ if (typeof Chart !== 'undefined') {
         });
     }
     
+    // Create a trend chart from /api/exercises/<id>/balance-series data
+    function createBalanceSeriesChart(elementId, data, field = 'balance') {
+        const element = document.getElementById(elementId);
+        if (!element) return null;
+        
+        const palette = Object.values(ohadaColors);
+        
+        return new Chart(element, {
+            type: 'line',
+            data: {
+                labels: (data.periods || []).map(function(period) {
+                    const date = new Date(period);
+                    return data.period === 'week'
+                        ? date.toLocaleDateString('fr-FR', { day: '2-digit', month: 'short' })
+                        : date.toLocaleDateString('fr-FR', { month: 'short', year: 'numeric' });
+                }),
+                datasets: (data.series || []).map(function(series, index) {
+                    return {
+                        label: series.label,
+                        data: series[field] || [],
+                        borderColor: palette[index % palette.length],
+                        backgroundColor: 'transparent',
+                        tension: 0.3
+                    };
+                })
+            },
+            options: {
+                responsive: true,
+                maintainAspectRatio: false,
+                scales: {
+                    y: {
+                        ticks: {
+                            callback: function(value) {
+                                return value.toLocaleString('fr-FR') + ' XOF';
+                            }
+                        }
+                    }
+                }
+            }
+        });
+    }
+    
+    // Fetch balance series and draw them
+    function loadBalanceSeriesChart(elementId, exerciseId, params = {}, field = 'balance') {
+        const query = new URLSearchParams(params).toString();
+        return fetch(`/api/exercises/${exerciseId}/balance-series${query ? '?' + query : ''}`)
+            .then(function(response) { return response.json(); })
+            .then(function(data) { return createBalanceSeriesChart(elementId, data, field); });
+    }
+    
     // Export chart functions
     window.ohadaCharts = {
         createFinancialHealthGauge,
@@ -374,6 +424,8 @@ if (typeof Chart !== 'undefined') {
         createFinancialRatiosChart,
         createAccountDistributionChart,
         createTransactionTrendChart,
+        createBalanceSeriesChart,
+        loadBalanceSeriesChart,
         applyChartTheme,
         colors: ohadaColors
     };
@@ -0,0 +1,73 @@
+/**
+ * Défilement infini des listes paginées
+ * Un conteneur [data-infinite-scroll] porte l'URL JSON de la page suivante (data-next-url)
+ * et son curseur (data-cursor). Le lien "Charger plus" associé (data-load-more="<id du conteneur>")
+ * charge la page suivante quand il devient visible, ou au clic ; sans JavaScript, il ouvre
+ * la page suivante de la vue HTML.
+ */
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('[data-infinite-scroll]').forEach(function(container) {
+        const trigger = document.querySelector('[data-load-more="' + container.id + '"]');
+        if (!trigger) {
+            return;
+        }
+
+        let loading = false;
+
+        function loadNextPage() {
+            const cursor = container.getAttribute('data-cursor');
+            if (loading || !cursor) {
+                return;
+            }
+            loading = true;
+            trigger.classList.add('disabled');
+
+            const url = new URL(container.getAttribute('data-next-url'), window.location.origin);
+            url.searchParams.set('cursor', cursor);
+            let loaded = false;
+
+            fetch(url, { headers: { 'Accept': 'application/json' }, credentials: 'same-origin' })
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error('HTTP ' + response.status);
+                    }
+                    return response.json();
+                })
+                .then(data => {
+                    container.insertAdjacentHTML('beforeend', data.html);
+                    if (window.feather) {
+                        feather.replace();
+                    }
+                    container.setAttribute('data-cursor', data.next_cursor || '');
+                    if (!data.next_cursor) {
+                        observer.disconnect();
+                        trigger.remove();
+                    }
+                    loaded = true;
+                })
+                .catch(error => {
+                    console.error('Erreur lors du chargement de la page suivante:', error);
+                })
+                .finally(() => {
+                    loading = false;
+                    trigger.classList.remove('disabled');
+                    // Page courte : le lien est encore visible, l'observateur ne se redéclenchera pas
+                    if (loaded && trigger.isConnected && trigger.getBoundingClientRect().top < window.innerHeight) {
+                        loadNextPage();
+                    }
+                });
+        }
+
+        const observer = new IntersectionObserver(function(entries) {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadNextPage();
+            }
+        }, { rootMargin: '200px' });
+        observer.observe(trigger);
+
+        trigger.addEventListener('click', function(event) {
+            event.preventDefault();
+            loadNextPage();
+        });
+    });
+});
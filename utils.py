@@ -1,4 +1,5 @@
 import os
+import json
 import logging
 from decimal import Decimal
 from datetime import datetime
@@ -6,6 +7,13 @@ from app import app, db
 
 logger = logging.getLogger(__name__)
 
+class DecimalEncoder(json.JSONEncoder):
+    """JSON encoder that serializes Decimal amounts as floats"""
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return float(obj)
+        return super().default(obj)
+
 def allowed_file(filename):
     """Check if the file extension is allowed"""
     return '.' in filename and \
@@ -62,6 +70,7 @@ def format_date(date_obj):
 def get_account_balance(account_id, exercise_id, end_date=None):
     """Calculate account balance until the specified date"""
     from models import Account, Transaction, TransactionItem
+    from balance_store import get_stored_totals
     
     account = Account.query.get(account_id)
     if not account:
@@ -71,23 +80,29 @@ def get_account_balance(account_id, exercise_id, end_date=None):
     if end_date is None:
         end_date = datetime.now().date()
     
-    # Get all transactions for this account until the end_date
-    query = db.session.query(
-        db.func.sum(TransactionItem.debit_amount).label('total_debit'),
-        db.func.sum(TransactionItem.credit_amount).label('total_credit')
-    ).join(
-        Transaction, TransactionItem.transaction_id == Transaction.id
-    ).filter(
-        TransactionItem.account_id == account_id,
-        Transaction.exercise_id == exercise_id,
-        Transaction.transaction_date <= end_date,
-        Transaction.is_posted == True
-    )
-    
-    result = query.first()
+    # Read the balance maintained on posting when available
+    stored = get_stored_totals(account_id, exercise_id, end_date)
     
-    total_debit = result.total_debit or Decimal('0')
-    total_credit = result.total_credit or Decimal('0')
+    if stored is not None:
+        total_debit, total_credit = stored
+    else:
+        # Get all transactions for this account until the end_date
+        query = db.session.query(
+            db.func.sum(TransactionItem.debit_amount).label('total_debit'),
+            db.func.sum(TransactionItem.credit_amount).label('total_credit')
+        ).join(
+            Transaction, TransactionItem.transaction_id == Transaction.id
+        ).filter(
+            TransactionItem.account_id == account_id,
+            Transaction.exercise_id == exercise_id,
+            Transaction.transaction_date <= end_date,
+            Transaction.is_posted == True
+        )
+        
+        result = query.first()
+        
+        total_debit = result.total_debit or Decimal('0')
+        total_credit = result.total_credit or Decimal('0')
     
     # Calculate balance based on account type
     if account.account_type in ['asset', 'expense']:
@@ -99,29 +114,20 @@ def get_account_balance(account_id, exercise_id, end_date=None):
     
     return balance
 
-def get_exercise_totals(exercise_id):
+def get_exercise_totals(exercise_id, aggregates=None):
     """Calculate exercise financial totals"""
-    from models import Account
-    
-    # Get all asset accounts
-    assets = Account.query.filter_by(account_type='asset', is_active=True).all()
-    total_assets = sum(get_account_balance(a.id, exercise_id) for a in assets)
-    
-    # Get all liability accounts
-    liabilities = Account.query.filter_by(account_type='liability', is_active=True).all()
-    total_liabilities = sum(get_account_balance(a.id, exercise_id) for a in liabilities)
-    
-    # Get all equity accounts
-    equity = Account.query.filter_by(account_type='equity', is_active=True).all()
-    total_equity = sum(get_account_balance(a.id, exercise_id) for a in equity)
+    from ledger_aggregates import get_exercise_aggregates
     
-    # Get all revenue accounts
-    revenues = Account.query.filter_by(account_type='revenue', is_active=True).all()
-    total_revenues = sum(get_account_balance(a.id, exercise_id) for a in revenues)
+    # One grouped query for every account type
+    if aggregates is None:
+        aggregates = get_exercise_aggregates(exercise_id, datetime.now().date())
     
-    # Get all expense accounts
-    expenses = Account.query.filter_by(account_type='expense', is_active=True).all()
-    total_expenses = sum(get_account_balance(a.id, exercise_id) for a in expenses)
+    by_type = aggregates['by_type']
+    total_assets = by_type.get('asset', Decimal('0'))
+    total_liabilities = by_type.get('liability', Decimal('0'))
+    total_equity = by_type.get('equity', Decimal('0'))
+    total_revenues = by_type.get('revenue', Decimal('0'))
+    total_expenses = by_type.get('expense', Decimal('0'))
     
     # Calculate net income
     net_income = total_revenues - total_expenses
@@ -132,5 +138,11 @@ def get_exercise_totals(exercise_id):
         'total_equity': total_equity,
         'total_revenues': total_revenues,
         'total_expenses': total_expenses,
-        'net_income': net_income
-    }
\ No newline at end of file
+        'net_income': net_income,
+        # Keys by account type, as read by the analyzers
+        'asset': total_assets,
+        'liability': total_liabilities,
+        'equity': total_equity,
+        'revenue': total_revenues,
+        'expense': total_expenses
+    }
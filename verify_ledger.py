@@ -0,0 +1,27 @@
+import sys
+import json
+from app import app
+from ledger_integrity import verify_ledger, DEFAULT_CHUNK_SIZE
+
+def main():
+    """Vérifie l'intégrité des écritures et des soldes stockés, et affiche un rapport JSON"""
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    exercise_id = int(args[0]) if args else None
+    chunk_size = DEFAULT_CHUNK_SIZE
+    for arg in sys.argv[1:]:
+        if arg.startswith('--chunk-size='):
+            chunk_size = int(arg.split('=', 1)[1])
+
+    with app.app_context():
+        report = verify_ledger(exercise_id, chunk_size=chunk_size)
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    failed = [name for name, check in report['checks'].items() if check['count']]
+    if failed:
+        print(f"\n{len(failed)} contrôle(s) en échec: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+    print(f"\nAucune anomalie sur {report['items_checked']} ligne(s).", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()